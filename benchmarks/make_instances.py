@@ -0,0 +1,95 @@
+"""
+Generate the fixed benchmark instances (`instances.json`) by the problem generators of `cspuz.puzzle`.
+
+    python benchmarks/make_instances.py [-o benchmarks/instances.json] [--puzzle NAME ...]
+
+Generation is randomized, so this script is run only when the instance set is extended; the generated instances are
+committed so that every benchmark run (and the saved baselines) uses exactly the same problems. Generators are seeded,
+and a failed generation (some generators give up and return None) is retried with the next seed.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cspuz  # noqa: E402
+from cspuz.puzzle import akari, heyawake, masyu, nurikabe, slitherlink, star_battle, sudoku, yajilin  # noqa: E402
+
+
+def _grid(generate, solve_name):
+    # for puzzles solved by `solve_xxx(height, width, problem)`
+    def make(height, width):
+        problem = generate(height, width)
+        if problem is None:
+            return None
+        return {'solver': solve_name, 'size': '{}x{}'.format(height, width), 'args': [height, width, problem]}
+    return make
+
+
+def _sudoku(n):
+    problem = sudoku.generate_sudoku(n)
+    if problem is None:
+        return None
+    return {'solver': 'sudoku.solve_sudoku', 'size': '{0}x{0}'.format(n * n), 'args': [problem], 'kwargs': {'n': n}}
+
+
+def _star_battle(n, k):
+    blocks = star_battle.generate_star_battle(n, k)
+    if blocks is None:
+        return None
+    return {'solver': 'star_battle.solve_star_battle', 'size': '{}x{}/{}'.format(n, n, k), 'args': [n, blocks, k]}
+
+
+# puzzle name -> (function making an instance from the size parameters, size parameters of growing size)
+SPECS = {
+    'akari': (_grid(akari.generate_akari, 'akari.solve_akari'), [(6, 6), (8, 8), (10, 10)]),
+    'heyawake': (_grid(heyawake.generate_heyawake, 'heyawake.solve_heyawake'), [(5, 5), (6, 6), (8, 8)]),
+    'masyu': (_grid(masyu.generate_masyu, 'masyu.solve_masyu'), [(6, 6), (8, 8), (10, 10)]),
+    'nurikabe': (_grid(nurikabe.generate_nurikabe, 'nurikabe.solve_nurikabe'), [(5, 5), (6, 6), (7, 7)]),
+    'slitherlink': (_grid(slitherlink.generate_slitherlink, 'slitherlink.solve_slitherlink'),
+                    [(5, 5), (7, 7), (10, 10)]),
+    'star_battle': (_star_battle, [(6, 1), (8, 1), (10, 2)]),
+    'sudoku': (_sudoku, [(2,), (3,)]),
+    'yajilin': (_grid(yajilin.generate_yajilin, 'yajilin.solve_yajilin'), [(5, 5), (7, 7)]),
+}
+
+
+def make_instances(names, max_attempts=10):
+    instances = []
+    for name in names:
+        make, sizes = SPECS[name]
+        for size in sizes:
+            for seed in range(max_attempts):
+                random.seed(seed)
+                instance = make(*size)
+                if instance is not None:
+                    break
+            else:
+                raise RuntimeError('failed to generate {} of size {}'.format(name, size))
+            instance = dict(instance, puzzle=name, seed=seed)
+            print('generated {} {} (seed {})'.format(name, instance['size'], seed), file=sys.stderr, flush=True)
+            instances.append(instance)
+    return instances
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               'instances.json'))
+    parser.add_argument('--puzzle', nargs='*', choices=sorted(SPECS), default=sorted(SPECS))
+    parser.add_argument('--backend', default='pysat', help='backend used for generation')
+    args = parser.parse_args()
+
+    cspuz.config.default_backend = args.backend
+    instances = make_instances(args.puzzle)
+    with open(args.output, 'w') as f:
+        # one instance per line
+        f.write('[\n' + ',\n'.join(json.dumps(instance, separators=(',', ':')) for instance in instances) + '\n]\n')
+
+
+if __name__ == '__main__':
+    _main()
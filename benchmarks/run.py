@@ -0,0 +1,216 @@
+"""
+Benchmark of the puzzle solvers of `cspuz.puzzle` on the fixed instances in `instances.json`.
+
+    python benchmarks/run.py [--backend NAME ...] [--puzzle NAME ...] [--repeat N] [--timeout SECONDS]
+                             [--save RESULT.json] [--compare BASELINE.json] [--threshold RATIO]
+
+Each instance is solved by its `solve_xxx` function with each backend, in a fresh child process so that the memory
+usage of runs does not affect each other. For each run, the following are recorded:
+- `time`: wall-clock seconds of `solve_xxx` (the minimum over `--repeat` runs),
+- `phases`: seconds spent in each phase of the `Solver` calls (see `cspuz.stats.SolveStats`),
+- `peak_python_kb`: the peak size of Python objects allocated during the run (by `tracemalloc`, in a separate run),
+- `max_rss_kb`: the peak resident set size of the child process and of the backend processes (`ru_maxrss`),
+- `num_variables`, `num_constraints`, `num_clauses` and `num_solver_calls`: the model size, summed over the `Solver`
+  calls, and
+- `answer`: a digest of the answer keys, to detect a change of the results.
+
+By default, the backends which run in process (pysat and z3) are used if they are installed; Sugar-based backends are
+used only if specified by `--backend`, with `$CSPUZ_BACKEND_PATH` set as usual.
+
+Results are saved by `--save`. With `--compare`, each run is compared against a saved baseline, and the exit status is
+1 if the time or the memory of some run exceeds `--threshold` times the baseline, or if some answer is changed.
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _ROOT)
+
+import cspuz  # noqa: E402
+
+_DEFAULT_INSTANCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instances.json')
+_SIZE_KEYS = ('num_variables', 'num_constraints', 'num_clauses', 'num_solver_calls')
+# differences of time (in seconds) and memory (in KB) smaller than these are regarded as noise
+_MIN_TIME_DIFF = 0.05
+_MIN_MEMORY_DIFF = 256
+
+
+def available_backends():
+    ret = []
+    for name, module in [('pysat', 'pysat'), ('z3', 'z3')]:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        ret.append(name)
+    return ret
+
+
+def _solve_function(name):
+    module_name, func_name = name.split('.')
+    return getattr(importlib.import_module('cspuz.puzzle.' + module_name), func_name)
+
+
+def _solve(instance, stats_list):
+    func = _solve_function(instance['solver'])
+    hook = (lambda solver, stats: stats_list.append((solver, stats)))
+    cspuz.config.solve_hooks.append(hook)
+    try:
+        start = time.perf_counter()
+        func(*instance['args'], **instance.get('kwargs', {}))
+        return time.perf_counter() - start
+    finally:
+        cspuz.config.solve_hooks.remove(hook)
+
+
+def _run_instance(instance, backend, repeat, timeout):
+    # run in a child process
+    cspuz.config.default_backend = backend
+    cspuz.config.solver_timeout = timeout
+    result = {'puzzle': instance['puzzle'], 'size': instance['size'], 'backend': backend}
+    try:
+        times = []
+        for _ in range(repeat):
+            stats_list = []
+            times.append(_solve(instance, stats_list))
+        tracemalloc.start()
+        _solve(instance, [])
+        result['peak_python_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+        return result
+
+    result['status'] = 'ok'
+    result['time'] = min(times)
+    result['max_rss_kb'] = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    phases = dict()
+    for key in _SIZE_KEYS:
+        result[key] = sum(getattr(stats, key) for _, stats in stats_list)
+    answer = []
+    for solver, stats in stats_list:
+        for phase, seconds in stats.times.items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        answer.append((stats.method, stats.is_sat,
+                       [v.sol for v in solver.variables if solver.is_answer_key[v.id]]))
+    result['phases'] = phases
+    result['answer'] = hashlib.sha1(repr(answer).encode('utf-8')).hexdigest()[:16]
+    return result
+
+
+def run(instances, backends, repeat=1, timeout=None, verbose=True):
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for instance in instances:
+        for backend in backends:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(_run_instance, (instance, backend, repeat, timeout))
+            if verbose:
+                if result['status'] == 'ok':
+                    print(('{:<14} {:<8} {:<8} {:9.3f}s {:8d}KB (rss {:8d}KB) '
+                           'vars {:7d} clauses {:8d} calls {:5d}').format(
+                        result['puzzle'], result['size'], backend, result['time'], result['peak_python_kb'],
+                        result['max_rss_kb'], result['num_variables'], result['num_clauses'],
+                        result['num_solver_calls']), flush=True)
+                else:
+                    print('{:<14} {:<8} {:<8} {}'.format(result['puzzle'], result['size'], backend, result['status']),
+                          flush=True)
+            results.append(result)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the comparison of `results` against `baseline` and return the number of regressions."""
+    base = dict(((r['puzzle'], r['size'], r['backend']), r) for r in baseline['results'])
+    regressions = 0
+    print('{:<14} {:<8} {:<8} {:>9} {:>9} {:>7} {:>7}  {}'.format('puzzle', 'size', 'backend', 'time', 'baseline',
+                                                                  'time', 'memory', 'note'))
+    for r in results:
+        b = base.get((r['puzzle'], r['size'], r['backend']))
+        if b is None or b['status'] != 'ok' or r['status'] != 'ok':
+            note = 'no baseline' if b is None else '{} (baseline: {})'.format(r['status'], b['status'])
+            if b is not None and b['status'] == 'ok':
+                regressions += 1
+            print('{:<14} {:<8} {:<8} {:>9} {:>9} {:>7} {:>7}  {}'.format(r['puzzle'], r['size'], r['backend'],
+                                                                          '', '', '', '', note))
+            continue
+        time_ratio = r['time'] / max(b['time'], 1e-9)
+        memory_ratio = r['peak_python_kb'] / max(b['peak_python_kb'], 1)
+        notes = []
+        if time_ratio > threshold and r['time'] - b['time'] >= _MIN_TIME_DIFF:
+            notes.append('slower')
+        if memory_ratio > threshold and r['peak_python_kb'] - b['peak_python_kb'] >= _MIN_MEMORY_DIFF:
+            notes.append('more memory')
+        if r['answer'] != b['answer']:
+            notes.append('answer changed')
+        if len(notes) > 0:
+            regressions += 1
+        print('{:<14} {:<8} {:<8} {:8.3f}s {:8.3f}s {:6.2f}x {:6.2f}x  {}'.format(
+            r['puzzle'], r['size'], r['backend'], r['time'], b['time'], time_ratio, memory_ratio,
+            ', '.join(notes)).rstrip())
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=_ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL).stdout.decode('ascii').strip()
+    except OSError:
+        return None
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', default=_DEFAULT_INSTANCES)
+    parser.add_argument('--backend', nargs='*', default=None, help='backends (default: available in-process ones)')
+    parser.add_argument('--puzzle', nargs='*', default=None, help='puzzles to run (default: all)')
+    parser.add_argument('--max-size', type=int, default=None, help='run only the N smallest instances of each puzzle')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=None, help='timeout of each backend call in seconds')
+    parser.add_argument('--save', default=None, help='save the results to this file')
+    parser.add_argument('--compare', default=None, help='compare the results against this baseline')
+    parser.add_argument('--threshold', type=float, default=1.2, help='ratio to the baseline regarded as regression')
+    args = parser.parse_args()
+
+    with open(args.instances) as f:
+        instances = json.load(f)
+    if args.puzzle is not None:
+        instances = [i for i in instances if i['puzzle'] in args.puzzle]
+    if args.max_size is not None:
+        count = dict()
+        selected = []
+        for instance in instances:
+            count[instance['puzzle']] = count.get(instance['puzzle'], 0) + 1
+            if count[instance['puzzle']] <= args.max_size:
+                selected.append(instance)
+        instances = selected
+    backends = args.backend if args.backend is not None else available_backends()
+
+    results = run(instances, backends, repeat=args.repeat, timeout=args.timeout)
+    if args.save is not None:
+        meta = {'revision': _git_revision(), 'python': platform.python_version(), 'platform': platform.platform(),
+                'repeat': args.repeat}
+        with open(args.save, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=1)
+            f.write('\n')
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    _main()
@@ -1,6 +1,6 @@
-from cspuz.solver import Solver
+from cspuz.solver import Solver, solve_batch
 from cspuz.grid import BoolGrid, IntGrid, latin_square
 from cspuz.grid_frame import BoolGridFrame
 from cspuz.grid_division import GridDivision
-from cspuz.constraints import BoolVars, IntVars, Array, alldifferent, count_true, fold_or, fold_and
+from cspuz.constraints import BoolVars, IntVars, Array, alldifferent, count_true, fold_or, fold_and, fold_sum
 from cspuz.configuration import config
@@ -1 +1 @@
-from cspuz.backend import sugar, sugar_extended, z3
+from cspuz.backend import sugar, sugar_extended, z3, pysat
@@ -0,0 +1,73 @@
+"""
+Backbone computation for `solve_irrefutably` of the in-process backends.
+
+The backbone of a problem is the set of literals which are true in all of its solutions. Starting from the literals
+which are true in a solution (candidates), `compute_backbone` repeatedly asks for a solution falsifying some of the
+remaining candidates:
+- every solution found removes all the candidates it falsifies (not only the ones in the query), and
+- if there is no such solution, all the candidates in the query are proven to be in the backbone at once, and
+  they are fixed in the backend so that subsequent queries (and solves after adding constraints) share them.
+Candidates are queried in chunks. A large chunk proves many literals by one unsatisfiable call, and a small chunk (a
+single literal is queried by an assumption) is easier for the solver to refute. The chunk size starts at `chunk_size`
+and adapts to the answers: it is doubled after an unsatisfiable query, as the next candidates are likely to be in the
+backbone as well, and halved (down to 1) after a query answered by a solution, which means the chunk was too large to
+be refuted as a whole.
+"""
+
+
+class BackboneStats(object):
+    """
+    Statistics of a backbone computation.
+    - `num_candidates`: the number of literals true in the initial solution,
+    - `num_backbone`: the number of them proven to be in the backbone,
+    - `num_calls`: the number of queries to the solver (excluding the initial solution),
+    - `num_sat_calls`: the number of queries answered by a solution, and
+    - `num_filtered`: the number of candidates removed by solutions outside the queried chunk.
+    """
+    __slots__ = ('num_candidates', 'num_backbone', 'num_calls', 'num_sat_calls', 'num_filtered')
+
+    def __init__(self):
+        self.num_candidates = 0
+        self.num_backbone = 0
+        self.num_calls = 0
+        self.num_sat_calls = 0
+        self.num_filtered = 0
+
+    def __repr__(self):
+        return 'BackboneStats({})'.format(', '.join('{}={}'.format(k, getattr(self, k)) for k in self.__slots__))
+
+
+def compute_backbone(candidates, refute, fix, stats, chunk_size=None):
+    """
+    Return a list of bools telling whether each of `candidates` is in the backbone.
+
+    `candidates` are literals true in a solution of the problem. `refute(chunk)` returns a function giving the truth
+    value of a literal in a solution in which some literal of `chunk` is false, or None if there is no such solution.
+    `fix(lits)` is called with literals proven to be in the backbone. If `chunk_size` is None, all the remaining
+    candidates are queried at once; otherwise, the first query has `chunk_size` candidates and the size of the
+    subsequent ones adapts to the answers (see the module docstring).
+    """
+    stats.num_candidates += len(candidates)
+    is_backbone = [False] * len(candidates)
+    remaining = list(range(len(candidates)))
+    while len(remaining) > 0:
+        size = len(remaining) if chunk_size is None else min(chunk_size, len(remaining))
+        chunk = remaining[:size]
+        stats.num_calls += 1
+        model_value = refute([candidates[i] for i in chunk])
+        if model_value is None:
+            for i in chunk:
+                is_backbone[i] = True
+            fix([candidates[i] for i in chunk])
+            stats.num_backbone += size
+            remaining = remaining[size:]
+            if chunk_size is not None:
+                chunk_size *= 2
+        else:
+            stats.num_sat_calls += 1
+            rest = [i for i in remaining if model_value(candidates[i])]
+            stats.num_filtered += sum(1 for i in remaining[size:] if not model_value(candidates[i]))
+            remaining = rest
+            if chunk_size is not None:
+                chunk_size = max(chunk_size // 2, 1)
+    return is_backbone
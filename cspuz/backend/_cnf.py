@@ -0,0 +1,605 @@
+"""
+Compiler from cspuz constraints into CNF, used by the in-process SAT backends.
+
+Bool expressions are compiled into literals by Tseitin transformation.
+Int expressions are compiled into `IntTerm`s, which are encoded by the order encoding and/or the direct encoding.
+The encoding of each int variable is chosen from how the variable is used in the constraints:
+variables which only appear in (in)equalities and `alldifferent` use the direct encoding, and the others use
+the order encoding.
+Results are memoized per expression object, so a subexpression shared by several constraints is compiled only once.
+Connectivity constraints (`Op.GRAPH_ACTIVE_VERTICES_CONNECTED`) are not encoded into CNF; they are recorded and
+enforced lazily by cuts (see `add_connectivity_cuts`).
+"""
+
+import bisect
+
+from cspuz.constraints import Op, Expr, BoolVar, IntVar
+from cspuz.backend import _connectivity
+
+
+_COMPARISON_OPS = (Op.EQ, Op.NE, Op.LE, Op.LT, Op.GE, Op.GT)
+_ORDER_OPS = (Op.NEG, Op.ADD, Op.SUB, Op.MUL, Op.MOD, Op.LE, Op.LT, Op.GE, Op.GT)
+_FLIPPED = {Op.EQ: Op.EQ, Op.NE: Op.NE, Op.LE: Op.GE, Op.LT: Op.GT, Op.GE: Op.LE, Op.GT: Op.LT}
+
+
+class IntTerm(object):
+    """
+    An int term whose value is one of `values` (sorted in the ascending order).
+    The term is encoded by either or both of
+    - the direct encoding: `eq_lits[i]` is true iff the term is equal to `values[i]`, and
+    - the order encoding: `le_lits[i]` is true iff the term is at most `values[i]` (for i < len(values) - 1).
+    The missing one is derived on demand by `CNFCompiler`.
+    """
+    def __init__(self, values, eq_lits=None, le_lits=None):
+        self.values = values
+        self.eq_lits = eq_lits
+        self.le_lits = le_lits
+
+    def is_constant(self):
+        return len(self.values) == 1
+
+
+def _is_int_constant(e):
+    return isinstance(e, int) and not isinstance(e, bool)
+
+
+class CNFCompiler(object):
+    def __init__(self, variables, int_encoding=None):
+        """
+        `int_encoding` forces the encoding of all int variables ('order' or 'direct');
+        if it is None, the encoding is chosen for each variable.
+        """
+        self.num_vars = 0
+        self.clauses = []
+        self.true_lit = self.new_var()
+        # `add_clause` drops clauses containing `true_lit`, so this unit clause is added directly
+        self.clauses.append([self.true_lit])
+        self.memo = dict()
+        self.int_encoding = int_encoding
+        self.variables = dict()
+        self.var_encoding = dict()
+        self.direct_candidates = set()
+        self.connectivity = []
+        for v in variables:
+            if not isinstance(v, (BoolVar, IntVar)):
+                raise TypeError()
+            self.variables[v.id] = v
+
+    def new_var(self):
+        self.num_vars += 1
+        return self.num_vars
+
+    def add_clause(self, clause):
+        false_lit = -self.true_lit
+        reduced = []
+        for lit in clause:
+            if lit == self.true_lit:
+                return
+            if lit != false_lit:
+                reduced.append(lit)
+        self.clauses.append(reduced)
+
+    def take_clauses(self):
+        """Return clauses added since the last call, removing them from the compiler."""
+        ret = self.clauses
+        self.clauses = []
+        return ret
+
+    # int terms
+
+    def _const_int(self, value):
+        return IntTerm([value], eq_lits=[self.true_lit], le_lits=[])
+
+    def _new_order_int(self, values):
+        if len(values) == 0:
+            self.add_clause([])
+            return self._const_int(0)
+        if len(values) == 1:
+            return self._const_int(values[0])
+        le_lits = [self.new_var() for _ in range(len(values) - 1)]
+        for i in range(len(le_lits) - 1):
+            self.add_clause([-le_lits[i], le_lits[i + 1]])
+        return IntTerm(values, le_lits=le_lits)
+
+    def _new_direct_int(self, values):
+        if len(values) == 0:
+            self.add_clause([])
+            return self._const_int(0)
+        if len(values) == 1:
+            return self._const_int(values[0])
+        eq_lits = [self.new_var() for _ in values]
+        self.add_clause(eq_lits)
+        self._at_most_one(eq_lits)
+        return IntTerm(values, eq_lits=eq_lits)
+
+    def _at_most_one(self, lits):
+        if len(lits) <= 5:
+            for i in range(len(lits)):
+                for j in range(i):
+                    self.add_clause([-lits[i], -lits[j]])
+        else:
+            # sequential counter encoding
+            prev = None
+            for i, lit in enumerate(lits):
+                if i == len(lits) - 1:
+                    if prev is not None:
+                        self.add_clause([-lit, -prev])
+                    break
+                cur = self.new_var()
+                self.add_clause([-lit, cur])
+                if prev is not None:
+                    self.add_clause([-prev, cur])
+                    self.add_clause([-lit, -prev])
+                prev = cur
+
+    def _le_lits(self, t):
+        if t.le_lits is None:
+            # `t <= values[i]` <=> `t <= values[i - 1]` or `t == values[i]`
+            le_lits = []
+            for i in range(len(t.values) - 1):
+                if i == 0:
+                    le_lits.append(t.eq_lits[0])
+                else:
+                    le_lits.append(self._or([le_lits[i - 1], t.eq_lits[i]]))
+            t.le_lits = le_lits
+        return t.le_lits
+
+    def _eq_lits(self, t):
+        if t.eq_lits is None:
+            le_lits = t.le_lits
+            n = len(t.values)
+            eq_lits = []
+            for i in range(n):
+                if i == 0:
+                    eq_lits.append(le_lits[0])
+                elif i == n - 1:
+                    eq_lits.append(-le_lits[n - 2])
+                else:
+                    eq_lits.append(self._and([le_lits[i], -le_lits[i - 1]]))
+            t.eq_lits = eq_lits
+        return t.eq_lits
+
+    def _le_const(self, t, x):
+        # literal for `t <= x`
+        idx = bisect.bisect_right(t.values, x) - 1
+        if idx < 0:
+            return -self.true_lit
+        if idx >= len(t.values) - 1:
+            return self.true_lit
+        return self._le_lits(t)[idx]
+
+    def _ge_const(self, t, x):
+        return -self._le_const(t, x - 1)
+
+    def _eq_const(self, t, x):
+        idx = bisect.bisect_left(t.values, x)
+        if idx == len(t.values) or t.values[idx] != x:
+            return -self.true_lit
+        if t.eq_lits is not None:
+            return t.eq_lits[idx]
+        return self._and([self._le_const(t, x), -self._le_const(t, x - 1)])
+
+    # bool gates
+
+    def _and(self, lits):
+        false_lit = -self.true_lit
+        operands = []
+        for lit in lits:
+            if lit == false_lit:
+                return false_lit
+            if lit != self.true_lit:
+                operands.append(lit)
+        if len(operands) == 0:
+            return self.true_lit
+        if len(operands) == 1:
+            return operands[0]
+        ret = self.new_var()
+        for lit in operands:
+            self.add_clause([-ret, lit])
+        self.add_clause([ret] + [-lit for lit in operands])
+        return ret
+
+    def _or(self, lits):
+        return -self._and([-lit for lit in lits])
+
+    def _iff(self, a, b):
+        if a == self.true_lit:
+            return b
+        if a == -self.true_lit:
+            return -b
+        if b == self.true_lit:
+            return a
+        if b == -self.true_lit:
+            return -a
+        if a == b:
+            return self.true_lit
+        if a == -b:
+            return -self.true_lit
+        ret = self.new_var()
+        self.add_clause([-ret, -a, b])
+        self.add_clause([-ret, a, -b])
+        self.add_clause([ret, a, b])
+        self.add_clause([ret, -a, -b])
+        return ret
+
+    # int operations
+
+    def _map_monotone(self, a, fn, increasing):
+        # `fn(a)` for a strictly monotone `fn`: the literals of `a` are reused
+        n = len(a.values)
+        if increasing:
+            values = [fn(x) for x in a.values]
+            return IntTerm(values, eq_lits=a.eq_lits, le_lits=a.le_lits)
+        values = [fn(x) for x in reversed(a.values)]
+        eq_lits = None if a.eq_lits is None else list(reversed(a.eq_lits))
+        # `fn(a) <= fn(values[i])` <=> `a >= values[i]` <=> not `a <= values[i - 1]`
+        le_lits = None if a.le_lits is None else [-a.le_lits[n - 2 - i] for i in range(n - 1)]
+        return IntTerm(values, eq_lits=eq_lits, le_lits=le_lits)
+
+    def _add(self, a, b, cap=None):
+        # `a + b`, whose values above `cap` are identified with `cap` (if specified)
+        def clamp(v):
+            return v if cap is None else min(v, cap)
+        if b.is_constant() and cap is None:
+            return self._map_monotone(a, lambda x: x + b.values[0], True)
+        if a.is_constant() and cap is None:
+            return self._map_monotone(b, lambda x: x + a.values[0], True)
+        values = sorted(set(clamp(x + y) for x in a.values for y in b.values))
+        ret = self._new_order_int(values)
+        if ret.is_constant():
+            return ret
+        for x in a.values:
+            for y in b.values:
+                z = clamp(x + y)
+                self.add_clause([-self._ge_const(a, x), -self._ge_const(b, y), self._ge_const(ret, z)])
+                self.add_clause([-self._le_const(a, x), -self._le_const(b, y), self._le_const(ret, z)])
+        return ret
+
+    def _sum(self, terms, cap=None):
+        # summing up in a balanced manner keeps intermediate domains small (as in the totalizer encoding)
+        if len(terms) == 0:
+            return self._const_int(0)
+        # clamping partial sums at `cap` is valid only if they are nonnegative and so is `cap`
+        if cap is not None and (cap < 0 or any(t.values[0] < 0 for t in terms)):
+            cap = None
+        while len(terms) > 1:
+            next_terms = []
+            for i in range(0, len(terms) - 1, 2):
+                next_terms.append(self._add(terms[i], terms[i + 1], cap))
+            if len(terms) % 2 == 1:
+                next_terms.append(terms[-1])
+            terms = next_terms
+        return terms[0]
+
+    def _neg(self, a):
+        return self._map_monotone(a, lambda x: -x, False)
+
+    def _int_binary_direct(self, a, b, fn):
+        # Compute `fn(a, b)` for every pair of values: each active pair implies the corresponding result value
+        results = dict()
+        a_eq = self._eq_lits(a)
+        b_eq = self._eq_lits(b)
+        for x, lx in zip(a.values, a_eq):
+            for y, ly in zip(b.values, b_eq):
+                z = fn(x, y)
+                if z is None:
+                    self.add_clause([-lx, -ly])
+                    continue
+                results.setdefault(z, []).append((lx, ly))
+        ret = self._new_direct_int(sorted(results.keys()))
+        for z, lit in zip(ret.values, ret.eq_lits):
+            # `results` is empty if no pair is valid (then `ret` is a dummy constant)
+            for lx, ly in results.get(z, ()):
+                self.add_clause([-lx, -ly, lit])
+        return ret
+
+    def _mul(self, a, b):
+        if a.is_constant():
+            a, b = b, a
+        if b.is_constant():
+            c = b.values[0]
+            if c == 0:
+                return self._const_int(0)
+            return self._map_monotone(a, lambda x: x * c, c > 0)
+        return self._int_binary_direct(a, b, lambda x, y: x * y)
+
+    def _if_then_else(self, c, t, f):
+        if c == self.true_lit:
+            return t
+        if c == -self.true_lit:
+            return f
+        if t.is_constant() and f.is_constant():
+            x = t.values[0]
+            y = f.values[0]
+            if x == y:
+                return t
+            if x < y:
+                return IntTerm([x, y], eq_lits=[c, -c], le_lits=[c])
+            else:
+                return IntTerm([y, x], eq_lits=[-c, c], le_lits=[-c])
+        values = sorted(set(t.values) | set(f.values))
+        ret = self._new_order_int(values)
+        for v in values[:-1]:
+            for cond, src in ((c, t), (-c, f)):
+                self.add_clause([-cond, -self._le_const(src, v), self._le_const(ret, v)])
+                self.add_clause([-cond, self._le_const(src, v), -self._le_const(ret, v)])
+        return ret
+
+    def _le(self, a, b, offset=0):
+        # `a + offset <= b`
+        if b.is_constant():
+            return self._le_const(a, b.values[0] - offset)
+        if a.is_constant():
+            return self._ge_const(b, a.values[0] + offset)
+        return self._and([self._or([-self._ge_const(a, x), self._ge_const(b, x + offset)]) for x in a.values[1:]] +
+                         [self._ge_const(b, a.values[0] + offset)])
+
+    def _eq(self, a, b):
+        if b.is_constant():
+            return self._eq_const(a, b.values[0])
+        if a.is_constant():
+            return self._eq_const(b, a.values[0])
+        if a.eq_lits is not None and b.eq_lits is not None:
+            lit_of = dict(zip(b.values, b.eq_lits))
+            return self._or([self._and([lx, lit_of[x]]) for x, lx in zip(a.values, a.eq_lits) if x in lit_of])
+        return self._and([self._le(a, b), self._le(b, a)])
+
+    def _alldifferent(self, operands, enforce):
+        # if `enforce` is True, the constraint is added directly instead of returning a literal for it
+        if enforce:
+            lits_of_value = dict()
+            for t in operands:
+                for x, lit in zip(t.values, self._eq_lits(t)):
+                    lits_of_value.setdefault(x, []).append(lit)
+            for lits in lits_of_value.values():
+                self._at_most_one(lits)
+            return self.true_lit
+        pairs = []
+        for i in range(len(operands)):
+            for j in range(i):
+                pairs.append(-self._eq(operands[i], operands[j]))
+        return self._and(pairs)
+
+    def _compare(self, op, a, b):
+        if op == Op.EQ:
+            return self._eq(a, b)
+        elif op == Op.NE:
+            return -self._eq(a, b)
+        elif op == Op.LE:
+            return self._le(a, b)
+        elif op == Op.LT:
+            return self._le(a, b, 1)
+        elif op == Op.GE:
+            return self._le(b, a)
+        elif op == Op.GT:
+            return self._le(b, a, 1)
+
+    def _bool_to_int(self, lit):
+        # `lit ? 1 : 0`
+        return IntTerm([0, 1], le_lits=[-lit])
+
+    def _capped_sum_pattern(self, e):
+        # For `sum op c` (or `c op sum`) where `sum` is an ADD or COUNT_TRUE node, returns (sum, op, c) with `sum` on
+        # the left.
+        # Values of the sum beyond `c + 1` need not be distinguished.
+        if e.op not in _COMPARISON_OPS:
+            return None
+        lhs, rhs = e.operands
+        op = e.op
+        if _is_int_constant(lhs):
+            lhs, rhs = rhs, lhs
+            op = _FLIPPED[op]
+        if _is_int_constant(rhs) and isinstance(lhs, Expr) and lhs.op in (Op.ADD, Op.COUNT_TRUE):
+            return lhs, op, rhs
+        return None
+
+    def _compile_node(self, e, operands):
+        op = e.op
+        if op == Op.NOT:
+            return -operands[0]
+        elif op == Op.AND:
+            return self._and(operands)
+        elif op == Op.OR:
+            return self._or(operands)
+        elif op == Op.IFF:
+            return self._iff(operands[0], operands[1])
+        elif op == Op.XOR:
+            return -self._iff(operands[0], operands[1])
+        elif op == Op.IMP:
+            return self._or([-operands[0], operands[1]])
+        elif op == Op.NEG:
+            return self._neg(operands[0])
+        elif op == Op.ADD:
+            return self._sum(operands)
+        elif op == Op.COUNT_TRUE:
+            return self._sum([self._bool_to_int(lit) for lit in operands])
+        elif op == Op.SUB:
+            return self._sum([operands[0]] + [self._neg(t) for t in operands[1:]])
+        elif op == Op.MUL:
+            ret = operands[0]
+            for i in range(1, len(operands)):
+                ret = self._mul(ret, operands[i])
+            return ret
+        elif op == Op.MOD:
+            ret = operands[0]
+            for i in range(1, len(operands)):
+                ret = self._int_binary_direct(ret, operands[i], lambda x, y: x % y if y != 0 else None)
+            return ret
+        elif op in _COMPARISON_OPS:
+            pattern = self._capped_sum_pattern(e)
+            if pattern is not None:
+                s, cmp_op, c = pattern
+                cap = c + 1 if cmp_op in (Op.EQ, Op.NE, Op.LE, Op.GT) else c
+                if s.op == Op.COUNT_TRUE:
+                    operands = [self._bool_to_int(lit) for lit in operands]
+                return self._compare(cmp_op, self._sum(operands, cap), self._const_int(c))
+            return self._compare(op, operands[0], operands[1])
+        elif op == Op.IF:
+            return self._if_then_else(operands[0], operands[1], operands[2])
+        elif op == Op.ALLDIFF:
+            return self._alldifferent(operands, False)
+        else:
+            raise NotImplementedError('operator {} is not supported'.format(op))
+
+    def _children(self, e):
+        # operands which are compiled before `e` itself
+        # nested ADDs (e.g. `a + b + c`, which is a chain of binary additions) are flattened into a single sum
+        pattern = self._capped_sum_pattern(e)
+        if pattern is not None:
+            if pattern[0].op == Op.COUNT_TRUE:
+                return pattern[0].operands
+            return self._flatten(pattern[0], Op.ADD)
+        if e.op == Op.ADD:
+            return self._flatten(e, Op.ADD)
+        return e.operands
+
+    def _var_encoding(self, v):
+        enc = self.var_encoding.get(v.id)
+        if enc is None:
+            if isinstance(v, BoolVar):
+                enc = self.new_var()
+            else:
+                encoding = self.int_encoding
+                if encoding is None:
+                    encoding = 'direct' if v.id in self.direct_candidates else 'order'
+                values = list(range(v.lo, v.hi + 1))
+                if encoding == 'direct':
+                    enc = self._new_direct_int(values)
+                else:
+                    enc = self._new_order_int(values)
+            self.var_encoding[v.id] = enc
+        return enc
+
+    def _leaf(self, e):
+        if isinstance(e, bool):
+            return self.true_lit if e else -self.true_lit
+        if _is_int_constant(e):
+            return self._const_int(e)
+        if isinstance(e, (BoolVar, IntVar)):
+            return self._var_encoding(e)
+        return None
+
+    def compile(self, e):
+        """
+        Compile expression `e` and return the literal (for bool expressions) or `IntTerm` (for int expressions)
+        representing it. Subexpressions are visited iteratively so that deep expressions do not hit the recursion limit.
+        """
+        leaf = self._leaf(e)
+        if leaf is not None:
+            return leaf
+        if not isinstance(e, Expr):
+            raise TypeError()
+        stack = [(e, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if id(node) in self.memo:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                for o in self._children(node):
+                    if isinstance(o, Expr) and self._leaf(o) is None and id(o) not in self.memo:
+                        stack.append((o, False))
+            else:
+                operands = []
+                for o in self._children(node):
+                    leaf = self._leaf(o)
+                    operands.append(leaf if leaf is not None else self.memo[id(o)][1])
+                # the expression itself is kept in the memo so that its id is not reused
+                self.memo[id(node)] = (node, self._compile_node(node, operands))
+        return self.memo[id(e)][1]
+
+    def _flatten(self, e, op):
+        # operands of nested `op` nodes, e.g. [a, b, c] for `(a | b) | c`
+        ret = []
+        stack = [e]
+        while len(stack) > 0:
+            node = stack.pop()
+            if isinstance(node, Expr) and node.op == op:
+                stack.extend(reversed(node.operands))
+            else:
+                ret.append(node)
+        return ret
+
+    def _choose_encodings(self, constraints):
+        # An int variable gets the direct encoding if it is used only in (in)equalities with constants or variables
+        # and in `alldifferent`; otherwise the order encoding is better suited.
+        use_order = set()
+        visited = set()
+        stack = list(constraints)
+        while len(stack) > 0:
+            node = stack.pop()
+            if not isinstance(node, Expr) or isinstance(node, (BoolVar, IntVar)) or id(node) in visited:
+                continue
+            visited.add(id(node))
+            if node.op in _ORDER_OPS or (node.op in (Op.EQ, Op.NE) and
+                                         not all(isinstance(o, (int, IntVar)) for o in node.operands)):
+                for o in node.operands:
+                    if isinstance(o, IntVar):
+                        use_order.add(o.id)
+            stack.extend(node.operands)
+        for v in self.variables.values():
+            if isinstance(v, IntVar) and v.id not in self.var_encoding and v.id not in use_order:
+                self.direct_candidates.add(v.id)
+
+    def add_constraint(self, e):
+        for c in self._flatten(e, Op.AND):
+            if isinstance(c, Expr) and c.op == Op.OR:
+                self.add_clause([self.compile(o) for o in self._flatten(c, Op.OR)])
+            elif isinstance(c, Expr) and c.op == Op.ALLDIFF:
+                self._alldifferent([self.compile(o) for o in c.operands], True)
+            elif isinstance(c, Expr) and c.op == Op.GRAPH_ACTIVE_VERTICES_CONNECTED:
+                is_active, adj = _connectivity.parse_constraint(c)
+                self.connectivity.append(([self.compile(a) for a in is_active], adj))
+            else:
+                self.add_clause([self.compile(c)])
+
+    def add_constraints(self, constraints):
+        if self.int_encoding is None:
+            self._choose_encodings(constraints)
+        for c in constraints:
+            self.add_constraint(c)
+
+    def add_connectivity_cuts(self, model_value):
+        """
+        Add cuts for the connectivity constraints violated by the model and return whether any cut is added.
+        A model is a solution of the whole problem iff no cut is added.
+        """
+        added = False
+        for lits, adj in self.connectivity:
+            active = [model_value(lit) for lit in lits]
+            for u, w, boundary in _connectivity.find_cuts(active, adj):
+                self.add_clause([-lits[u], -lits[w]] + [lits[b] for b in boundary])
+                added = True
+        return added
+
+    def decode(self, v, model_value):
+        """Return the value of variable `v` under the model; `model_value(lit)` gives the truth value of `lit`."""
+        if v.id not in self.var_encoding:
+            # `v` appears in no constraint, so any value is allowed
+            return False if isinstance(v, BoolVar) else v.lo
+        enc = self._var_encoding(v)
+        if isinstance(v, BoolVar):
+            return model_value(enc)
+        if enc.eq_lits is not None:
+            for x, lit in zip(enc.values, enc.eq_lits):
+                if model_value(lit):
+                    return x
+            return None
+        for x, lit in zip(enc.values, enc.le_lits):
+            if model_value(lit):
+                return x
+        return enc.values[-1]
+
+    def value_literals(self, v, value):
+        """
+        Return literals whose conjunction is equivalent to `v == value`. No clause is added for them.
+        `v` must appear in some constraint.
+        """
+        enc = self._var_encoding(v)
+        if isinstance(v, BoolVar):
+            return [enc if value else -enc]
+        if enc.eq_lits is not None:
+            lits = [self._eq_const(enc, value)]
+        else:
+            lits = [self._le_const(enc, value), -self._le_const(enc, value - 1)]
+        return [lit for lit in lits if lit != self.true_lit]
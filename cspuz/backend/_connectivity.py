@@ -0,0 +1,114 @@
+"""
+Lazy handling of `Op.GRAPH_ACTIVE_VERTICES_CONNECTED` for backends which do not support it natively.
+
+Such backends solve the problem without the connectivity constraint first, and if the active vertices in the
+obtained model are disconnected, they add explanation clauses (cuts) computed by `find_cuts` and solve again.
+Backends with a propagation hook in the SAT solver can also use `propagate`, which works on partial assignments.
+"""
+
+from cspuz.constraints import Op
+
+
+def parse_constraint(e):
+    """
+    Split a `GRAPH_ACTIVE_VERTICES_CONNECTED` expression into the list of is_active terms and the adjacency list.
+    """
+    if e.op != Op.GRAPH_ACTIVE_VERTICES_CONNECTED:
+        raise ValueError('not a graph connectivity constraint')
+    num_vertices = e.operands[0]
+    num_edges = e.operands[1]
+    is_active = e.operands[2:2 + num_vertices]
+    edges = e.operands[2 + num_vertices:]
+    adj = [[] for _ in range(num_vertices)]
+    for i in range(num_edges):
+        u = edges[i * 2]
+        v = edges[i * 2 + 1]
+        adj[u].append(v)
+        adj[v].append(u)
+    return is_active, adj
+
+
+def find_cuts(active, adj):
+    """
+    Given the activity of vertices in a model, return explanation clauses for the disconnection of active vertices
+    as a list of (u, w, boundary), meaning "if both `u` and `w` are active, some vertex in `boundary` is active".
+    Each component of active vertices yields one cut (separating it from another component), so the result is empty
+    iff the active vertices are connected.
+    """
+    n = len(adj)
+    component = [-1] * n
+    components = []
+    for s in range(n):
+        if not active[s] or component[s] != -1:
+            continue
+        cid = len(components)
+        members = [s]
+        component[s] = cid
+        boundary = set()
+        stack = [s]
+        while len(stack) > 0:
+            v = stack.pop()
+            for w in adj[v]:
+                if active[w]:
+                    if component[w] == -1:
+                        component[w] = cid
+                        members.append(w)
+                        stack.append(w)
+                else:
+                    boundary.add(w)
+        components.append((members, sorted(boundary)))
+    if len(components) <= 1:
+        return []
+    cuts = []
+    for i, (members, boundary) in enumerate(components):
+        other = components[(i + 1) % len(components)][0][0]
+        cuts.append((members[0], other, boundary))
+    return cuts
+
+
+def propagate(state, adj):
+    """
+    Propagate the connectivity constraint under a partial assignment, where `state[v]` is True (active),
+    False (inactive) or None (undecided).
+    Vertices are grouped into components connected via vertices which are not inactive. Returns (conflict, inferences):
+    - `conflict` is (u, w, boundary) if active vertices `u` and `w` are already separated, where `boundary` is the set
+      of inactive vertices surrounding the component of `u`. Otherwise it is None.
+    - `inferences` is a list of (x, u, boundary): vertex `x` must be inactive because it cannot reach the active vertex
+      `u` unless some vertex in `boundary` (currently inactive) is active.
+    """
+    n = len(adj)
+    component = [-1] * n
+    components = []
+    for s in range(n):
+        if state[s] is False or component[s] != -1:
+            continue
+        component[s] = len(components)
+        members = [s]
+        active = None
+        boundary = set()
+        stack = [s]
+        while len(stack) > 0:
+            v = stack.pop()
+            if state[v] and active is None:
+                active = v
+            for w in adj[v]:
+                if state[w] is False:
+                    boundary.add(w)
+                elif component[w] == -1:
+                    component[w] = component[s]
+                    members.append(w)
+                    stack.append(w)
+        components.append((members, active, sorted(boundary)))
+    with_active = [c for c in components if c[1] is not None]
+    if len(with_active) >= 2:
+        return (with_active[0][1], with_active[1][1], with_active[0][2]), []
+    if len(with_active) == 0:
+        return None, []
+    u = with_active[0][1]
+    inferences = []
+    for members, active, boundary in components:
+        if active is None:
+            for x in members:
+                if state[x] is None:
+                    inferences.append((x, u, boundary))
+    return None, inferences
@@ -1,6 +1,13 @@
+import atexit
+import contextlib
+import os
+import select
+import threading
+import time
 import warnings
 import subprocess
 import signal
+import tempfile
 
 
 try:
@@ -10,24 +17,203 @@ except ImportError:
     _PSUTIL_AVAILABLE = False
 
 
-def run_subprocess(args, input, timeout=None):
+# A line consisting of this marker terminates each request to / response from a backend server
+# (see `CspuzSugarInterface --server`).
+END_OF_MESSAGE = '%end'
+
+# Input lines are encoded and written in chunks of about this many characters.
+_WRITE_CHUNK_SIZE = 1 << 16
+
+
+def write_lines(f, lines):
+    """
+    Write `lines` (a string or an iterable of lines) to binary file `f`, separated by newlines.
+    Lines are written in chunks, so the whole input is never held as a single string.
+    """
+    if isinstance(lines, str):
+        lines = [lines]
+    chunk = []
+    chunk_size = 0
+    for line in lines:
+        chunk.append(line)
+        chunk_size += len(line) + 1
+        if chunk_size >= _WRITE_CHUNK_SIZE:
+            chunk.append('')
+            f.write('\n'.join(chunk).encode('ascii'))
+            chunk = []
+            chunk_size = 0
+    if len(chunk) > 0:
+        chunk.append('')
+        f.write('\n'.join(chunk).encode('ascii'))
+
+
+def _timer(stats, phase):
+    # `stats.timer(phase)` if `stats` (a `SolveStats`) is given
+    return stats.timer(phase) if stats is not None else contextlib.nullcontext()
+
+
+def terminate_process_tree(proc):
+    if _PSUTIL_AVAILABLE:
+        try:
+            parent = psutil.Process(proc.pid)
+            children = parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        children.append(parent)
+        for p in children:
+            try:
+                p.send_signal(signal.SIGTERM)
+            except psutil.NoSuchProcess:
+                pass
+    else:
+        proc.terminate()
+
+
+def run_subprocess(args, input, timeout=None, stats=None):
+    """
+    Run `args` with `input` (a string or an iterable of lines) as the standard input and return the standard output.
+    The input is streamed into a temporary file which is passed to the process as its standard input.
+    If `stats` is given, the time for writing the input and running the process is recorded in it.
+    """
     if timeout and not _PSUTIL_AVAILABLE:
         warnings.warn('psutil not found; timeout is ignored')
+    with tempfile.TemporaryFile() as input_file:
+        with _timer(stats, 'serialize'):
+            write_lines(input_file, input)
+            input_file.seek(0)
+        with _timer(stats, 'subprocess'):
+            return _run_with_input_file(args, input_file, timeout)
+
+
+def _run_with_input_file(args, input_file, timeout):
     if timeout and _PSUTIL_AVAILABLE:
-        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        proc = subprocess.Popen(args, stdin=input_file, stdout=subprocess.PIPE,
                                 stderr=subprocess.PIPE)
         try:
-            out, _ = proc.communicate(input.encode('ascii'), timeout=timeout)
+            out, _ = proc.communicate(timeout=timeout)
             out = out.decode('utf-8')
         except subprocess.TimeoutExpired:
-            parent = psutil.Process(proc.pid)
-            children = parent.children(recursive=True)
-            children.append(parent)
-            for p in children:
-                p.send_signal(signal.SIGTERM)
+            terminate_process_tree(proc)
             raise
         return out
     else:
-        res = subprocess.run(args, input=input.encode('ascii'), stdout=subprocess.PIPE)
+        res = subprocess.run(args, stdin=input_file, stdout=subprocess.PIPE)
         out = res.stdout.decode('utf-8')
         return out
+
+
+class ServerProcess(object):
+    """
+    A long-lived backend process which answers requests framed by `END_OF_MESSAGE` lines.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.buffer = b''
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def communicate(self, input, timeout=None, stats=None):
+        with _timer(stats, 'serialize'):
+            write_lines(self.proc.stdin, input)
+            self.proc.stdin.write('{}\n'.format(END_OF_MESSAGE).encode('ascii'))
+            self.proc.stdin.flush()
+        with _timer(stats, 'subprocess'):
+            return self._read_response(timeout).decode('utf-8')
+
+    def _read_response(self, timeout):
+        terminator = '\n{}\n'.format(END_OF_MESSAGE).encode('ascii')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while True:
+            pos = self.buffer.find(terminator)
+            if pos >= 0:
+                response = self.buffer[:pos + 1]
+                self.buffer = self.buffer[pos + len(terminator):]
+                return response
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    self.kill()
+                    raise subprocess.TimeoutExpired(self.args, timeout)
+            chunk = os.read(fd, 65536)
+            if len(chunk) == 0:
+                self.kill()
+                raise RuntimeError('backend server terminated unexpectedly')
+            self.buffer += chunk
+
+    def close(self):
+        if self.is_alive():
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.kill()
+
+    def kill(self):
+        if self.is_alive():
+            terminate_process_tree(self.proc)
+            self.proc.wait()
+
+
+_idle_servers = {}
+_all_servers = []
+_server_lock = threading.Lock()
+
+
+def _reset_servers_in_child():
+    # Server processes belong to the parent process, which keeps using them. A forked child starts with no server,
+    # so that it neither shares a server with the parent nor closes the servers of the parent at exit.
+    # The lock may have been held by another thread of the parent at the fork, so it is also replaced.
+    global _idle_servers, _all_servers, _server_lock
+    _idle_servers = {}
+    _all_servers = []
+    _server_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_servers_in_child)
+
+
+def run_server(args, input, timeout=None, stats=None):
+    """
+    Send `input` to an idle server process launched by `args` (spawning a new one if none is available)
+    and return its response. Server processes are kept alive and reused by subsequent calls.
+    If `stats` is given, the time for writing the input and waiting for the response is recorded in it.
+    """
+    key = tuple(args)
+    server = None
+    with _server_lock:
+        idle = _idle_servers.setdefault(key, [])
+        while len(idle) > 0:
+            server = idle.pop()
+            if server.is_alive():
+                break
+            server = None
+    if server is None:
+        server = ServerProcess(args)
+        with _server_lock:
+            _all_servers.append(server)
+
+    try:
+        out = server.communicate(input, timeout=timeout, stats=stats)
+    except BaseException:
+        server.kill()
+        with _server_lock:
+            _all_servers.remove(server)
+        raise
+
+    with _server_lock:
+        _idle_servers[key].append(server)
+    return out
+
+
+@atexit.register
+def shutdown_servers():
+    with _server_lock:
+        servers = list(_all_servers)
+        _all_servers.clear()
+        _idle_servers.clear()
+    for server in servers:
+        server.close()
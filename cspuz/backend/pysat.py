@@ -0,0 +1,322 @@
+"""
+In-process CSP backend which compiles constraints into CNF and solves it with a SAT solver of PySAT
+(https://pysathq.github.io/). No subprocess nor temporary file is involved.
+
+Clauses are added to a single SAT solver instance incrementally, so constraints added after a call of `solve`
+(e.g. refuting clauses in `Solver.solve`) are solved keeping the learned clauses.
+
+Connectivity constraints are not encoded into CNF. If the SAT solver supports external propagators (IPASIR-UP, e.g.
+CaDiCaL 1.9.5), they are propagated during the search by `ConnectivityPropagator`. Otherwise, whenever a model
+violates one of them, cuts are added and the SAT solver is called again.
+"""
+
+import subprocess
+import threading
+import time
+
+try:
+    import pysat.solvers
+    PYSAT_AVAILABLE = True
+except ImportError:
+    PYSAT_AVAILABLE = False
+
+try:
+    from pysat.engines import Propagator
+except ImportError:
+    Propagator = object
+
+import cspuz
+from cspuz.constraints import BoolVar, IntVar
+from cspuz.backend import _connectivity
+from cspuz.backend._backbone import BackboneStats, compute_backbone
+from cspuz.backend._cnf import CNFCompiler
+from cspuz.stats import SolveStats
+
+# Solvers which cannot be interrupted (CaDiCaL) are run with a timeout in slices limited by the number of conflicts.
+# The number of conflicts of a slice starts from this and is adjusted so that each slice takes about
+# `_SLICE_SECONDS`, so that the timeout is exceeded by at most that long.
+_INITIAL_CONFLICT_BUDGET = 1000
+_SLICE_SECONDS = 0.05
+
+
+def _supports_interrupt(sat_solver):
+    try:
+        sat_solver.interrupt()
+    except NotImplementedError:
+        return False
+    sat_solver.clear_interrupt()
+    return True
+
+
+class ConnectivityPropagator(Propagator):
+    """
+    External propagator for the connectivity constraints of a `CNFCompiler`.
+    A vertex which cannot reach an active vertex is propagated to be inactive, and active vertices separated from
+    each other are reported as a conflict. Explanations are the same clauses as the cuts of `_connectivity.find_cuts`.
+    """
+    def __init__(self, constraints, true_lit):
+        super(ConnectivityPropagator, self).__init__()
+        self.constraints = constraints
+        self.true_lit = true_lit
+        self.watches = dict()
+        for i, (lits, _) in enumerate(constraints):
+            for lit in lits:
+                if abs(lit) != true_lit:
+                    self.watches.setdefault(abs(lit), []).append(i)
+        self.value = dict()
+        self.fixed = set()
+        self.trail = []
+        self.trail_lim = []
+        self.dirty = set(range(len(constraints)))
+        self.reasons = dict()
+        self.pending_clause = None
+
+    def setup_observe(self, solver):
+        for var in self.watches:
+            solver.observe(var)
+
+    def _lit_value(self, lit):
+        if abs(lit) == self.true_lit:
+            return lit > 0
+        value = self.value.get(abs(lit))
+        if value is None:
+            return None
+        return value == lit
+
+    def on_assignment(self, lit, fixed=False):
+        self.value[abs(lit)] = lit
+        if fixed:
+            self.fixed.add(abs(lit))
+        self.trail.append(lit)
+        self.dirty.update(self.watches[abs(lit)])
+
+    def on_new_level(self):
+        self.trail_lim.append(len(self.trail))
+
+    def on_backtrack(self, to):
+        while len(self.trail_lim) > to:
+            lim = self.trail_lim.pop()
+            while len(self.trail) > lim:
+                var = abs(self.trail.pop())
+                if var not in self.fixed:
+                    self.value.pop(var, None)
+                self.dirty.update(self.watches[var])
+        self.pending_clause = None
+
+    def propagate(self):
+        if self.pending_clause is not None:
+            return []
+        ret = []
+        propagated = set()
+        dirty = self.dirty
+        self.dirty = set()
+        for i in dirty:
+            lits, adj = self.constraints[i]
+            conflict, inferences = _connectivity.propagate([self._lit_value(lit) for lit in lits], adj)
+            if conflict is not None:
+                u, w, boundary = conflict
+                self.pending_clause = [-lits[u], -lits[w]] + [lits[b] for b in boundary]
+                return []
+            for x, u, boundary in inferences:
+                lit = -lits[x]
+                if lit not in propagated and self._lit_value(lit) is None:
+                    propagated.add(lit)
+                    self.reasons[lit] = [lit, -lits[u]] + [lits[b] for b in boundary]
+                    ret.append(lit)
+        return ret
+
+    def provide_reason(self, lit):
+        return self.reasons[lit]
+
+    def check_model(self, model):
+        model = set(model)
+        for lits, adj in self.constraints:
+            active = [lit in model or lit == self.true_lit for lit in lits]
+            cuts = _connectivity.find_cuts(active, adj)
+            if len(cuts) > 0:
+                u, w, boundary = cuts[0]
+                self.pending_clause = [-lits[u], -lits[w]] + [lits[b] for b in boundary]
+                return False
+        return True
+
+    def has_clause(self):
+        return self.pending_clause is not None
+
+    def add_clause(self):
+        clause = self.pending_clause
+        self.pending_clause = None
+        return clause
+
+
+class CSPSolver(object):
+    def __init__(self, variables):
+        self.variables = variables
+        for v in self.variables:
+            if not isinstance(v, (BoolVar, IntVar)):
+                raise TypeError()
+        self.compiler = CNFCompiler(variables)
+        self.sat_solver = None
+        self.supports_interrupt = None
+        self.stats = SolveStats()
+        self.stats.num_backend_variables = len(variables)
+
+    def add_constraint(self, constraint):
+        with self.stats.timer('build'):
+            if isinstance(constraint, list):
+                self.stats.num_backend_constraints += len(constraint)
+                self.compiler.add_constraints(constraint)
+            else:
+                self.stats.num_backend_constraints += 1
+                self.compiler.add_constraint(constraint)
+
+    def _sync_clauses(self):
+        if not PYSAT_AVAILABLE:
+            raise ModuleNotFoundError('pysat is not found')
+        clauses = self.compiler.take_clauses()
+        self.stats.num_clauses += len(clauses)
+        self.stats.num_sat_variables = self.compiler.num_vars
+        if self.sat_solver is None:
+            self.sat_solver = pysat.solvers.Solver(name=cspuz.config.pysat_solver)
+            self.sat_solver.append_formula(clauses)
+            self._connect_propagator()
+        elif len(clauses) > 0:
+            self.sat_solver.append_formula(clauses)
+
+    def _connect_propagator(self):
+        # Connectivity constraints added after this are still handled by cuts in `_find_model`.
+        if len(self.compiler.connectivity) == 0 or Propagator is object:
+            return
+        propagator = ConnectivityPropagator(list(self.compiler.connectivity), self.compiler.true_lit)
+        try:
+            self.sat_solver.connect_propagator(propagator)
+        except NotImplementedError:
+            return
+        propagator.setup_observe(self.sat_solver)
+
+    def _solve_sat(self, assumptions=()):
+        self.stats.num_solver_calls += 1
+        timeout = cspuz.config.solver_time_limit('pysat')
+        if not timeout:
+            with self.stats.timer('solve'):
+                return self.sat_solver.solve(assumptions=assumptions)
+        if self.supports_interrupt is None:
+            self.supports_interrupt = _supports_interrupt(self.sat_solver)
+        with self.stats.timer('solve'):
+            if self.supports_interrupt:
+                res = self._solve_interrupted(assumptions, timeout)
+            else:
+                res = self._solve_in_slices(assumptions, timeout)
+        if res is None:
+            raise subprocess.TimeoutExpired('pysat', timeout)
+        return res
+
+    def _solve_interrupted(self, assumptions, timeout):
+        # returns None if the solver is interrupted after `timeout` seconds
+        timer = threading.Timer(timeout, self.sat_solver.interrupt)
+        timer.start()
+        try:
+            res = self.sat_solver.solve_limited(assumptions=assumptions, expect_interrupt=True)
+        finally:
+            timer.cancel()
+        if res is None:
+            self.sat_solver.clear_interrupt()
+        return res
+
+    def _solve_in_slices(self, assumptions, timeout):
+        # returns None if the problem is not solved in `timeout` seconds.
+        # Learned clauses are kept across the slices, so the search is not restarted from scratch.
+        deadline = time.monotonic() + timeout
+        budget = _INITIAL_CONFLICT_BUDGET
+        while True:
+            start = time.monotonic()
+            self.sat_solver.conf_budget(budget)
+            res = self.sat_solver.solve_limited(assumptions=assumptions)
+            now = time.monotonic()
+            if res is not None:
+                return res
+            if now >= deadline:
+                return None
+            # the next slice takes about `_SLICE_SECONDS` (or the remaining time), growing at most twice at once
+            target = min(_SLICE_SECONDS, deadline - now)
+            budget = max(1, int(budget * min(2.0, target / max(now - start, 1e-6))))
+
+    def _find_model(self, assumptions=()):
+        # returns a function giving the truth value of a literal in the model, or None if unsatisfiable
+        while True:
+            self._sync_clauses()
+            if not self._solve_sat(assumptions):
+                return None
+            model = self.sat_solver.get_model()
+
+            def model_value(lit):
+                if abs(lit) > len(model):
+                    return lit < 0
+                return model[abs(lit) - 1] == lit
+
+            if not self.compiler.add_connectivity_cuts(model_value):
+                return model_value
+
+    def solve(self):
+        model_value = self._find_model()
+        if model_value is None:
+            for v in self.variables:
+                v.sol = None
+            return False
+
+        for v in self.variables:
+            v.sol = self.compiler.decode(v, model_value)
+        return True
+
+    def _refute(self, chunk):
+        # a model in which some literal of `chunk` is false
+        if len(chunk) == 1:
+            return self._find_model([-chunk[0]])
+        # the clause is enabled only while `act` is assumed, and disabled permanently after the call
+        act = self.compiler.new_var()
+        self.compiler.add_clause([-act] + [-lit for lit in chunk])
+        try:
+            return self._find_model([act])
+        finally:
+            self.compiler.add_clause([-act])
+
+    def _fix(self, lits):
+        for lit in lits:
+            self.compiler.add_clause([lit])
+
+    def solve_irrefutably(self, is_answer_key):
+        """
+        Find the values of answer keys (`is_answer_key[v.id]` is nonzero) which are common to all the solutions.
+        `sol` of each answer key is set to the common value, or None if it is not unique. `sol` of the other
+        variables is set to None. Statistics of the computation are stored in `stats.backbone`.
+        """
+        model_value = self._find_model()
+        for v in self.variables:
+            v.sol = None
+        if model_value is None:
+            return False
+
+        # `v == value` holds in all the solutions iff all of `lits` are in the backbone
+        keys = []
+        candidates = []
+        for v in self.variables:
+            if not is_answer_key[v.id]:
+                continue
+            if v.id not in self.compiler.var_encoding:
+                # `v` appears in no constraint, so it is irrefutable only if its domain is a singleton
+                if isinstance(v, IntVar) and v.lo == v.hi:
+                    v.sol = v.lo
+                continue
+            value = self.compiler.decode(v, model_value)
+            lits = self.compiler.value_literals(v, value)
+            keys.append((v, value, len(candidates), len(candidates) + len(lits)))
+            candidates += lits
+
+        # prefer models falsifying the candidates, so that each model refutes as many of them as possible
+        self.sat_solver.set_phases([-lit for lit in candidates])
+        self.stats.backbone = BackboneStats()
+        is_backbone = compute_backbone(candidates, self._refute, self._fix, self.stats.backbone,
+                                       chunk_size=cspuz.config.backbone_chunk_size)
+        for v, value, start, end in keys:
+            if all(is_backbone[start:end]):
+                v.sol = value
+        return True
@@ -1,10 +1,17 @@
 """
 CSP backend using the Sugar CSP solver (http://bach.istc.kobe-u.ac.jp/sugar/).
+The CSP description is passed to Sugar as a stream of lines (see `_subproc.write_lines`).
 """
 
+import itertools
+import re
+import time
+
 import cspuz
-from cspuz.constraints import Op, Expr, BoolVar, IntVar
+from cspuz.constraints import Op, Expr, BoolExpr, BoolVar, IntVar
+from cspuz.stats import SolveStats
 
+from . import _connectivity
 from ._subproc import run_subprocess
 
 
@@ -32,6 +39,21 @@ OP_TO_OPNAME = {
 }
 
 
+# `a <name>\t<value>` lines of the output of Sugar, for the variables of the problem (aux variables are `c<n>`)
+_ASSIGNMENT_PATTERN = re.compile(r'^a ([bi])(\d+)\t(\S+)', re.M)
+
+
+def parse_assignment(out, pattern, size):
+    """
+    Parse the values of variables (named `b<id>` or `i<id>`) in `out` at once, by regex `pattern` matching each line
+    into (kind, id, value). Returns a list indexed by variable ids (None for variables not found).
+    """
+    assignment = [None] * size
+    for kind, var_id, val in pattern.findall(out):
+        assignment[int(var_id)] = (val == 'true') if kind == 'b' else int(val)
+    return assignment
+
+
 def _convert_variable(v):
     if isinstance(v, BoolVar):
         return '(bool b{})'.format(v.id)
@@ -41,26 +63,211 @@ def _convert_variable(v):
         raise TypeError()
 
 
-def _convert_expr(e):
-    if isinstance(e, bool):
-        return ('true' if e else 'false')
-    if isinstance(e, int):
-        return str(e)
-    if not isinstance(e, Expr):
-        raise TypeError()
+def _count_references(constraints):
+    # number of references to each compound expression (keyed by id) from `constraints` and other expressions
+    count = dict()
+    stack = list(constraints)
+    while len(stack) > 0:
+        e = stack.pop()
+        if not isinstance(e, Expr) or isinstance(e, (BoolVar, IntVar)):
+            continue
+        c = count.get(id(e), 0)
+        count[id(e)] = c + 1
+        if c == 0:
+            stack.extend(e.operands)
+    return count
 
-    if isinstance(e, BoolVar):
-        return 'b{}'.format(e.id)
-    elif isinstance(e, IntVar):
-        return 'i{}'.format(e.id)
-    else:
-        return '({} {})'.format(
-            OP_TO_OPNAME[e.op],
-            ' '.join(map(_convert_expr, e.operands))
-        )
+
+class _ExprConverter(object):
+    """
+    Converter of expressions into the Sugar syntax.
+    Expressions in `shared` (ids of expressions referenced more than once) are defined only once as auxiliary
+    variables `c<n>`, whose definitions are taken by `take_definitions`.
+    """
+    def __init__(self):
+        self.shared = set()
+        self.names = dict()
+        self.bounds = dict()
+        self.definitions = []
+        self.num_aux_vars = 0
+
+    def take_definitions(self):
+        ret = self.definitions
+        self.definitions = []
+        return ret
+
+    def _int_bounds(self, e):
+        # bounds of the value of int expression `e` by interval arithmetic (None if unknown)
+        stack = [(e, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if isinstance(node, (int, IntVar)) or id(node) in self.bounds:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                if node.op == Op.IF:
+                    stack.extend((o, False) for o in node.operands[1:])
+                elif node.op != Op.COUNT_TRUE:
+                    stack.extend((o, False) for o in node.operands)
+            else:
+                self.bounds[id(node)] = (node, self._compute_bounds(node))
+        return self._known_bounds(e)
+
+    def _known_bounds(self, e):
+        if isinstance(e, int):
+            return e, e
+        if isinstance(e, IntVar):
+            return e.lo, e.hi
+        return self.bounds[id(e)][1]
+
+    def _compute_bounds(self, e):
+        # bounds of `e` from those of its operands, which are already computed
+        if e.op == Op.COUNT_TRUE:
+            return 0, len(e.operands)
+        if e.op == Op.IF:
+            operand_bounds = [self._known_bounds(o) for o in e.operands[1:]]
+        else:
+            operand_bounds = [self._known_bounds(o) for o in e.operands]
+        if any(b is None for b in operand_bounds):
+            return None
+        elif e.op == Op.NEG:
+            lo, hi = operand_bounds[0]
+            return -hi, -lo
+        elif e.op == Op.ADD:
+            return sum(b[0] for b in operand_bounds), sum(b[1] for b in operand_bounds)
+        elif e.op == Op.SUB:
+            lo, hi = operand_bounds[0]
+            for b in operand_bounds[1:]:
+                lo, hi = lo - b[1], hi - b[0]
+            return lo, hi
+        elif e.op == Op.MUL:
+            lo, hi = operand_bounds[0]
+            for b in operand_bounds[1:]:
+                cands = [lo * b[0], lo * b[1], hi * b[0], hi * b[1]]
+                lo, hi = min(cands), max(cands)
+            return lo, hi
+        elif e.op == Op.IF:
+            return min(b[0] for b in operand_bounds), max(b[1] for b in operand_bounds)
+        else:
+            return None
+
+    def _define(self, e, desc):
+        name = 'c{}'.format(self.num_aux_vars)
+        if isinstance(e, BoolExpr):
+            self.definitions.append('(bool {})'.format(name))
+            self.definitions.append('(iff {} {})'.format(name, desc))
+        else:
+            bounds = self._int_bounds(e)
+            if bounds is None:
+                return None
+            self.definitions.append('(int {} {} {})'.format(name, bounds[0], bounds[1]))
+            self.definitions.append('(= {} {})'.format(name, desc))
+        self.num_aux_vars += 1
+        return name
+
+    def _new_aux_var(self, lo=None, hi=None):
+        # declare a new auxiliary variable (bool if `lo` is None, int in [lo, hi] otherwise) and return its name
+        name = 'c{}'.format(self.num_aux_vars)
+        if lo is None:
+            self.definitions.append('(bool {})'.format(name))
+        else:
+            self.definitions.append('(int {} {} {})'.format(name, lo, hi))
+        self.num_aux_vars += 1
+        return name
+
+    def _atom(self, e):
+        # the description of `e` if it is a constant, a variable or an already defined expression; otherwise None
+        if isinstance(e, bool):
+            return ('true' if e else 'false')
+        if isinstance(e, int):
+            return str(e)
+        if not isinstance(e, Expr):
+            raise TypeError()
+        if isinstance(e, BoolVar):
+            return 'b{}'.format(e.id)
+        elif isinstance(e, IntVar):
+            return 'i{}'.format(e.id)
+        if id(e) in self.names:
+            return self.names[id(e)][1]
+        return None
+
+    def _describe(self, e):
+        # Description of `e` in which defined subexpressions are referred to by their names.
+        # Tokens are emitted iteratively and joined at once, so the cost is linear even for deep expressions.
+        tokens = []
+        stack = [e]
+        while len(stack) > 0:
+            x = stack.pop()
+            if isinstance(x, str):
+                tokens.append(x)
+                continue
+            atom = self._atom(x)
+            if atom is not None:
+                tokens.append(atom)
+                continue
+            items = []
+            if x.op == Op.COUNT_TRUE:
+                tokens.append('(+')
+                for o in x.operands:
+                    items += [' (if ', o, ' 1 0)']
+            else:
+                tokens.append('(' + OP_TO_OPNAME[x.op])
+                for o in x.operands:
+                    items += [' ', o]
+            items.append(')')
+            stack.extend(reversed(items))
+        return ''.join(tokens)
+
+    def _define_shared(self, e):
+        # define the subexpressions of `e` in `shared`, children first
+        visited = set()
+        stack = [(e, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if not expanded:
+                if self._atom(node) is not None or id(node) in visited:
+                    continue
+                visited.add(id(node))
+                stack.append((node, True))
+                stack.extend((o, False) for o in reversed(node.operands))
+            elif id(node) in self.shared and node.op != Op.GRAPH_ACTIVE_VERTICES_CONNECTED:
+                name = self._define(node, self._describe(node))
+                if name is not None:
+                    # `node` is kept in `names` so that its id is not reused
+                    self.names[id(node)] = (node, name)
+
+    def convert_connectivity(self, e):
+        """
+        Descriptions of constraints equivalent to `GRAPH_ACTIVE_VERTICES_CONNECTED` expression `e`, for Sugar without
+        the extension. As the rank encoding of `graph.active_vertices_connected`, each active vertex is the root or has
+        an active neighbor of a smaller rank, and there is at most one root.
+        """
+        is_active, adj = _connectivity.parse_constraint(e)
+        n = len(is_active)
+        active = [self.convert(a) for a in is_active]
+        ranks = [self._new_aux_var(0, max(n - 1, 0)) for _ in range(n)]
+        is_root = [self._new_aux_var() for _ in range(n)]
+        ret = []
+        for i in range(n):
+            supports = [is_root[i]] + ['(&& (< {} {}) {})'.format(ranks[j], ranks[i], active[j]) for j in adj[i]]
+            ret.append('(=> {} (|| {}))'.format(active[i], ' '.join(supports)))
+        if n > 0:
+            ret.append('(<= (+ {}) 1)'.format(' '.join('(if {} 1 0)'.format(r) for r in is_root)))
+        return ret
+
+    def convert(self, e):
+        atom = self._atom(e)
+        if atom is not None:
+            return atom
+        if len(self.shared) > 0:
+            self._define_shared(e)
+        return self._describe(e)
 
 
 class CSPSolver(object):
+    # whether the backend handles `graph-active-vertices-connected` natively (otherwise, it is encoded by ranks)
+    native_graph_primitive = False
+
     def __init__(self, variables):
         self.variables = variables
         max_var_id = -1
@@ -71,35 +278,64 @@ class CSPSolver(object):
                 raise TypeError()
         self.max_var_id = max_var_id
         self.converted_variables = list(map(_convert_variable, self.variables))
-        self.converted_constraints = []
+        # constraints are converted only while the description is written to Sugar (see `_describe`), so that the
+        # converted descriptions are never held in memory all at once
+        self.constraints = []
+        self.stats = SolveStats()
+        self.stats.num_backend_variables = len(variables)
 
     def add_constraint(self, constraint):
-        if isinstance(constraint, list):
-            self.converted_constraints += map(_convert_expr, constraint)
-        else:
-            self.converted_constraints.append(_convert_expr(constraint))
+        if not isinstance(constraint, list):
+            constraint = [constraint]
+        self.stats.num_backend_constraints += len(constraint)
+        self.constraints.append(constraint)
 
-    def solve(self):
-        csp_description = '\n'.join(self.converted_variables + self.converted_constraints)
+    def _convert_constraints(self):
+        # Yields the descriptions of the constraints. Each list given to `add_constraint` is converted as a unit, as
+        # expressions shared in it are defined as auxiliary variables. The conversion time is recorded as 'build' (which
+        # is also a part of 'serialize', as conversion and writing are interleaved).
+        converter = _ExprConverter()
+        build_time = 0.0
+        try:
+            for constraint in self.constraints:
+                start = time.perf_counter()
+                count = _count_references(constraint)
+                converter.shared = set(i for i, c in count.items() if c >= 2)
+                converter.bounds = dict()
+                build_time += time.perf_counter() - start
+                for e in constraint:
+                    start = time.perf_counter()
+                    if (isinstance(e, Expr) and e.op == Op.GRAPH_ACTIVE_VERTICES_CONNECTED and
+                            not self.native_graph_primitive):
+                        descs = converter.convert_connectivity(e)
+                    else:
+                        descs = [converter.convert(e)]
+                    definitions = converter.take_definitions()
+                    build_time += time.perf_counter() - start
+                    yield from definitions
+                    yield from descs
+        finally:
+            self.stats.add_time('build', build_time)
+
+    def _describe(self):
+        # the whole CSP description, as an iterator of lines
+        return itertools.chain(self.converted_variables, self._convert_constraints())
+
+    def _run(self, csp_description):
         sugar_path = cspuz.config.backend_path or 'sugar'
-        out = run_subprocess([sugar_path, '/dev/stdin'], csp_description, timeout=cspuz.config.solver_timeout).split('\n')
-        if 'UNSATISFIABLE' in out[0]:
+        timeout = cspuz.config.solver_time_limit(sugar_path)
+        self.stats.num_solver_calls += 1
+        return run_subprocess([sugar_path, '/dev/stdin'], csp_description, timeout=timeout, stats=self.stats)
+
+    def solve(self):
+        out = self._run(self._describe())
+        if 'UNSATISFIABLE' in out.split('\n', 1)[0]:
             for v in self.variables:
                 v.sol = None
             return False
 
-        assignment = [None] * (self.max_var_id + 1)
-        for line in out[1:]:
-            if len(line) <= 2:
-                break
-            var, val = line[2:].strip().split('\t')
-            if val == 'true':
-                converted_val = True
-            elif val == 'false':
-                converted_val = False
-            else:
-                converted_val = int(val)
-            assignment[int(var[1:])] = converted_val
+        with self.stats.timer('parse'):
+            assignment = parse_assignment(out, _ASSIGNMENT_PATTERN, self.max_var_id + 1)
         for v in self.variables:
             v.sol = assignment[v.id]
         return True
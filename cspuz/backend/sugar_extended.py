@@ -1,46 +1,56 @@
+import itertools
+import re
+
 import cspuz
 from cspuz.constraints import BoolVar, IntVar
 from cspuz.backend import sugar
 
-from ._subproc import run_subprocess
+from ._subproc import run_subprocess, run_server
+
+
+# `<name> <value>` lines of the output for irrefutable answers
+_IRREFUTABLE_ASSIGNMENT_PATTERN = re.compile(r'^([bi])(\d+) (\S+)$', re.M)
 
 
 class CSPSolver(sugar.CSPSolver):
+    @property
+    def native_graph_primitive(self):
+        # only Sugar built with the native graph constraint handles it; `config.use_graph_primitive` tells so
+        return cspuz.config.use_graph_primitive
+
     def __init__(self, variables):
         super(CSPSolver, self).__init__(variables)
 
+    def _run(self, csp_description):
+        sugar_path = cspuz.config.backend_path or 'sugar'
+        timeout = cspuz.config.solver_time_limit(sugar_path)
+        self.stats.num_solver_calls += 1
+        if cspuz.config.use_backend_server:
+            return run_server([sugar_path, '--server'], csp_description, timeout=timeout, stats=self.stats)
+        else:
+            return run_subprocess([sugar_path, '/dev/stdin'], csp_description, timeout=timeout, stats=self.stats)
+
     def solve_irrefutably(self, is_answer_key):
         answer_keys = []
-        for i in range(len(self.variables)):
-            if is_answer_key[i]:
-                if isinstance(self.variables[i], BoolVar):
-                    answer_keys.append('b{}'.format(self.variables[i].id))
-                elif isinstance(self.variables[i], IntVar):
-                    answer_keys.append('i{}'.format(self.variables[i].id))
+        for v in self.variables:
+            if is_answer_key[v.id]:
+                if isinstance(v, BoolVar):
+                    answer_keys.append('b{}'.format(v.id))
+                elif isinstance(v, IntVar):
+                    answer_keys.append('i{}'.format(v.id))
                 else:
                     raise TypeError()
         answer_keys_desc = '#' + ' '.join(answer_keys)
-        csp_description = '\n'.join(self.converted_variables + self.converted_constraints + [answer_keys_desc])
-        sugar_path = cspuz.config.backend_path or 'sugar'
-        out = run_subprocess([sugar_path, '/dev/stdin'], csp_description, timeout=cspuz.config.solver_timeout).split('\n')
+        csp_description = itertools.chain(self._describe(), [answer_keys_desc])
+        out = self._run(csp_description)
         for v in self.variables:
             v.sol = None
 
-        if 'unsat' in out[0]:
+        if 'unsat' in out.split('\n', 1)[0]:
             return False
 
-        assignment = [None] * (self.max_var_id + 1)
-        for line in out[1:]:
-            if len(line) <= 2:
-                break
-            var, val = line.split(' ')
-            if val == 'true':
-                converted_val = True
-            elif val == 'false':
-                converted_val = False
-            else:
-                converted_val = int(val)
-            assignment[int(var[1:])] = converted_val
+        with self.stats.timer('parse'):
+            assignment = sugar.parse_assignment(out, _IRREFUTABLE_ASSIGNMENT_PATTERN, self.max_var_id + 1)
         for v in self.variables:
             v.sol = assignment[v.id]
         return True
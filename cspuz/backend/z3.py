@@ -1,110 +1,367 @@
+"""
+Backend using the Z3 SMT solver (https://github.com/Z3Prover/z3) through its Python API.
+
+Comparisons of linear combinations of bools (e.g. `count_true(a) <= 2`) are converted into native pseudo-Boolean
+constraints (`z3.AtMost`, `z3.PbEq`, ...) instead of integer arithmetic. If there is no int variable, the problem
+is solved by the finite-domain solver of Z3 (`SolverFor('QF_FD')`), which is a SAT solver handling pseudo-Boolean
+constraints natively; otherwise (or if the finite-domain solver gives up) the default SMT solver is used.
+"""
+
+import subprocess
+import threading
+
 try:
     import z3
     Z3_AVAILABLE = True
 except ImportError:
     Z3_AVAILABLE = False
 
+import cspuz
 from cspuz.constraints import Op, Expr, BoolVar, IntVar
+from cspuz.backend import _connectivity
+from cspuz.backend._backbone import BackboneStats, compute_backbone
+from cspuz.stats import SolveStats
+
+
+_thread_local = threading.local()
+# the default `timeout` of Z3 solvers (in milliseconds), which means no time limit
+_Z3_NO_TIMEOUT = 4294967295
+
+
+def _context():
+    # Z3 contexts are not thread-safe, so each thread builds its terms in its own context
+    # (the main thread uses the default context of Z3)
+    if threading.current_thread() is threading.main_thread():
+        return z3.main_ctx()
+    ctx = getattr(_thread_local, 'ctx', None)
+    if ctx is None:
+        ctx = _thread_local.ctx = z3.Context()
+    return ctx
+
+
+def _is_int_constant(e):
+    return isinstance(e, int) and not isinstance(e, bool)
+
 
+def _pb_terms(e, coef, terms):
+    # Add `coef * e` to `terms` (a dict from the id of a bool expression to [expression, coefficient]) if `e` is a
+    # linear combination of bools; returns the constant part, or None if `e` is not of such form.
+    # Int variables are not regarded as linear combinations of bools.
+    if _is_int_constant(e):
+        return coef * e
+    if not isinstance(e, Expr) or isinstance(e, IntVar):
+        return None
+    if e.op == Op.COUNT_TRUE:
+        for x in e.operands:
+            if isinstance(x, bool):
+                return None
+            entry = terms.setdefault(id(x), [x, 0])
+            entry[1] += coef
+        return 0
+    if e.op == Op.IF:
+        cond, t, f = e.operands
+        if not (_is_int_constant(t) and _is_int_constant(f)) or isinstance(cond, bool):
+            return None
+        entry = terms.setdefault(id(cond), [cond, 0])
+        entry[1] += coef * (t - f)
+        return coef * f
+    if e.op in (Op.ADD, Op.SUB, Op.NEG):
+        ret = 0
+        for i, x in enumerate(e.operands):
+            sign = -1 if (e.op == Op.NEG or (e.op == Op.SUB and i > 0)) else 1
+            c = _pb_terms(x, coef * sign, terms)
+            if c is None:
+                return None
+            ret += c
+        return ret
+    if e.op == Op.MUL and len(e.operands) == 2:
+        x, y = e.operands
+        if _is_int_constant(x):
+            x, y = y, x
+        if _is_int_constant(y):
+            return _pb_terms(x, coef * y, terms)
+    return None
 
-def _convert_expr(e, variables_dict):
-    if isinstance(e, (bool, int)):
-        return e
+
+def _convert_pb(e, variables_dict, memo):
+    # `lhs op rhs` as a pseudo-Boolean constraint, or None if it is not a comparison of linear combinations of bools
+    terms = dict()
+    lhs, rhs = e.operands
+    lhs_const = _pb_terms(lhs, 1, terms)
+    if lhs_const is None:
+        return None
+    rhs_const = _pb_terms(rhs, -1, terms)
+    if rhs_const is None:
+        return None
+    # sum(coef * x) + const (op) 0
+    const = lhs_const + rhs_const
+    if not any(entry[1] != 0 for entry in terms.values()):
+        return None
+    # make the coefficients positive by `c * x == c - c * (not x)`
+    args = []
+    for x, c in terms.values():
+        if c == 0:
+            continue
+        x = _convert_expr(x, variables_dict, memo)
+        if c < 0:
+            const += c
+            args.append((z3.Not(x), -c))
+        else:
+            args.append((x, c))
+    k = -const
+    op = e.op
+    if op == Op.LT:
+        op, k = Op.LE, k - 1
+    elif op == Op.GT:
+        op, k = Op.GE, k + 1
+    unit = all(c == 1 for _, c in args) and k >= 0
+    if op == Op.LE:
+        return z3.AtMost(*([x for x, _ in args] + [k])) if unit else z3.PbLe(args, k)
+    elif op == Op.GE:
+        return z3.AtLeast(*([x for x, _ in args] + [k])) if unit else z3.PbGe(args, k)
+    elif op == Op.EQ:
+        return z3.PbEq(args, k)
+    elif op == Op.NE:
+        return z3.Not(z3.PbEq(args, k))
+
+
+def _convert_expr(e, variables_dict, memo=None):
+    # `memo` maps the id of each converted expression to (expression, z3 term) so that an expression shared by
+    # several constraints (see `constraints._make_expr`) is converted only once
+    # constants are converted in the context of the current thread, as a term made of constants only (e.g.
+    # `z3.Not(True)`) would otherwise be in the default context
+    if isinstance(e, bool):
+        return z3.BoolVal(e, _context())
+    if isinstance(e, int):
+        return z3.IntVal(e, _context())
     if not isinstance(e, Expr):
         raise TypeError()
     if isinstance(e, (BoolVar, IntVar)):
         return variables_dict[e.id]
-    else:
-        operands = list(map(lambda x: _convert_expr(x, variables_dict), e.operands))
-        if e.op == Op.NEG:
-            return -operands[0]
-        elif e.op == Op.ADD:
-            ret = operands[0]
-            for i in range(1, len(operands)):
-                ret = ret + operands[i]
-            return ret
-        elif e.op == Op.SUB:
-            ret = operands[0]
-            for i in range(1, len(operands)):
-                ret = ret - operands[i]
-            return ret
-        elif e.op == Op.MUL:
-            ret = operands[0]
-            for i in range(1, len(operands)):
-                ret = ret * operands[i]
-            return ret
-        elif e.op == Op.MOD:
-            ret = operands[0]
-            for i in range(1, len(operands)):
-                ret = ret % operands[i]
+    if memo is not None and id(e) in memo:
+        return memo[id(e)][1]
+    ret = _convert_compound_expr(e, variables_dict, memo)
+    if memo is not None:
+        memo[id(e)] = (e, ret)
+    return ret
+
+
+def _convert_compound_expr(e, variables_dict, memo):
+    if e.op in (Op.EQ, Op.NE, Op.LE, Op.LT, Op.GE, Op.GT):
+        ret = _convert_pb(e, variables_dict, memo)
+        if ret is not None:
             return ret
-        elif e.op == Op.EQ:
-            return operands[0] == operands[1]
-        elif e.op == Op.NE:
-            return operands[0] != operands[1]
-        elif e.op == Op.LE:
-            return operands[0] <= operands[1]
-        elif e.op == Op.LT:
-            return operands[0] < operands[1]
-        elif e.op == Op.GE:
-            return operands[0] >= operands[1]
-        elif e.op == Op.GT:
-            return operands[0] > operands[1]
-        elif e.op == Op.NOT:
-            return z3.Not(operands[0])
-        elif e.op == Op.AND:
-            return z3.And(operands)
-        elif e.op == Op.OR:
-            return z3.Or(operands)
-        elif e.op == Op.XOR:
-            return z3.Xor(operands[0], operands[1])
-        elif e.op == Op.IFF:
-            return operands[0] == operands[1]
-        elif e.op == Op.IMP:
-            return z3.Or(z3.Not(operands[0]), operands[1])
-        elif e.op == Op.IF:
-            return z3.If(operands[0], operands[1], operands[2])
-        elif e.op == Op.ALLDIFF:
-            return z3.Distinct(operands)
+    operands = list(map(lambda x: _convert_expr(x, variables_dict, memo), e.operands))
+    if e.op == Op.NEG:
+        return -operands[0]
+    elif e.op == Op.ADD:
+        if len(operands) > 2:
+            return z3.Sum(operands)
+        ret = operands[0]
+        for i in range(1, len(operands)):
+            ret = ret + operands[i]
+        return ret
+    elif e.op == Op.SUB:
+        ret = operands[0]
+        for i in range(1, len(operands)):
+            ret = ret - operands[i]
+        return ret
+    elif e.op == Op.MUL:
+        ret = operands[0]
+        for i in range(1, len(operands)):
+            ret = ret * operands[i]
+        return ret
+    elif e.op == Op.MOD:
+        ret = operands[0]
+        for i in range(1, len(operands)):
+            ret = ret % operands[i]
+        return ret
+    elif e.op == Op.EQ:
+        return operands[0] == operands[1]
+    elif e.op == Op.NE:
+        return operands[0] != operands[1]
+    elif e.op == Op.LE:
+        return operands[0] <= operands[1]
+    elif e.op == Op.LT:
+        return operands[0] < operands[1]
+    elif e.op == Op.GE:
+        return operands[0] >= operands[1]
+    elif e.op == Op.GT:
+        return operands[0] > operands[1]
+    elif e.op == Op.NOT:
+        return z3.Not(operands[0])
+    elif e.op == Op.AND:
+        return z3.And(operands)
+    elif e.op == Op.OR:
+        return z3.Or(operands)
+    elif e.op == Op.XOR:
+        return z3.Xor(operands[0], operands[1])
+    elif e.op == Op.IFF:
+        return operands[0] == operands[1]
+    elif e.op == Op.IMP:
+        return z3.Or(z3.Not(operands[0]), operands[1])
+    elif e.op == Op.IF:
+        return z3.If(operands[0], operands[1], operands[2])
+    elif e.op == Op.ALLDIFF:
+        return z3.Distinct(operands)
+    elif e.op == Op.COUNT_TRUE:
+        return z3.Sum([z3.If(x, 1, 0) for x in operands])
 
 
 class CSPSolver(object):
+    """
+    A single Z3 solver is kept for the lifetime of this object, so constraints added after a call of `solve`
+    are solved incrementally. `solve_irrefutably` refutes the candidate answer in push/pop scopes of the solver.
+
+    Terms are built in the Z3 context of the thread creating this object, so solvers created in different threads
+    can be used concurrently, but a solver must not be used from threads other than the creating one.
+    """
     def __init__(self, variables):
         self.variables = variables
         self.variables_dict = dict()
+        self.ctx = _context()
         id_last = 0
         for v in variables:
             if isinstance(v, BoolVar):
-                self.variables_dict[v.id] = z3.Bool('b' + str(id_last))
+                self.variables_dict[v.id] = z3.Bool('b' + str(id_last), self.ctx)
             elif isinstance(v, IntVar):
-                self.variables_dict[v.id] = z3.Int('i' + str(id_last))
+                self.variables_dict[v.id] = z3.Int('i' + str(id_last), self.ctx)
             id_last += 1
+        # all assertions given to the solver, to rebuild it when the finite-domain solver gives up
         self.converted_constraints = []
+        self.memo = dict()
+        # connectivity constraints are enforced lazily by cuts (see `_connectivity`)
+        self.connectivity = []
+        self.use_finite_domain = not any(isinstance(v, IntVar) for v in variables)
+        self.solver = None
+        self.stats = SolveStats()
+        self.stats.num_backend_variables = len(variables)
+
+    def _add(self, converted):
+        self.converted_constraints.append(converted)
+        if self.solver is not None:
+            self.solver.add(converted)
 
     def add_constraint(self, constraint):
+        with self.stats.timer('build'):
+            self._add_constraint(constraint)
+
+    def _add_constraint(self, constraint):
         if isinstance(constraint, list):
-            self.converted_constraints += map(lambda e: _convert_expr(e, self.variables_dict), constraint)
+            for e in constraint:
+                self._add_constraint(e)
+            return
+        self.stats.num_backend_constraints += 1
+        if isinstance(constraint, Expr) and constraint.op == Op.GRAPH_ACTIVE_VERTICES_CONNECTED:
+            is_active, adj = _connectivity.parse_constraint(constraint)
+            self.connectivity.append(([_convert_expr(a, self.variables_dict, self.memo) for a in is_active], adj))
         else:
-            self.converted_constraints.append(_convert_expr(constraint, self.variables_dict))
+            self._add(_convert_expr(constraint, self.variables_dict, self.memo))
 
-    def solve(self):
-        if not Z3_AVAILABLE:
-            raise ModuleNotFoundError('z3 is not found')
-        solver = z3.Solver()
+    def _connectivity_cuts(self, model):
+        cuts = []
+        for terms, adj in self.connectivity:
+            active = [z3.is_true(model.eval(t, model_completion=True)) for t in terms]
+            for u, w, boundary in _connectivity.find_cuts(active, adj):
+                cuts.append(z3.Or([z3.Not(terms[u]), z3.Not(terms[w])] + [terms[b] for b in boundary]))
+        return cuts
+
+    def _make_solver(self):
+        solver = z3.SolverFor('QF_FD', ctx=self.ctx) if self.use_finite_domain else z3.Solver(ctx=self.ctx)
         for var in self.variables:
             if isinstance(var, IntVar):
                 var_z3 = self.variables_dict[var.id]
                 solver.add(var.lo <= var_z3, var_z3 <= var.hi)
         solver.add(self.converted_constraints)
+        return solver
+
+    def _find_model(self, scoped=()):
+        # returns a model satisfying all the constraints (including connectivity) and `scoped`, or None.
+        # `scoped` are asserted in a push/pop scope, so they are removed after the call.
+        if not Z3_AVAILABLE:
+            raise ModuleNotFoundError('z3 is not found')
+        if self.solver is None:
+            self.solver = self._make_solver()
+        while True:
+            if len(scoped) > 0:
+                self.solver.push()
+                self.solver.add(scoped)
+            # the solver is reused, so the time limit (which may be shortened by a deadline) is set for each check
+            timeout = cspuz.config.solver_time_limit('z3')
+            self.solver.set(timeout=int(timeout * 1000) if timeout else _Z3_NO_TIMEOUT)
+            self.stats.num_solver_calls += 1
+            with self.stats.timer('solve'):
+                res = self.solver.check()
+            model = self.solver.model() if res == z3.sat else None
+            if len(scoped) > 0:
+                self.solver.pop()
+            if res == z3.unknown:
+                if self.use_finite_domain and 'timeout' not in self.solver.reason_unknown():
+                    # the finite-domain solver gives up on some int terms (e.g. `count_true(a) * count_true(b)`)
+                    self.use_finite_domain = False
+                    self.solver = self._make_solver()
+                    continue
+                raise subprocess.TimeoutExpired('z3', timeout)
+            if res == z3.unsat:
+                return None
+            cuts = self._connectivity_cuts(model)
+            if len(cuts) == 0:
+                return model
+            # cuts are valid for every solution, so they are kept for subsequent calls
+            for cut in cuts:
+                self._add(cut)
+
+    def _decode(self, model, var):
+        # variables which appear in no constraint are not in the model
+        value = model.eval(self.variables_dict[var.id], model_completion=True)
+        return z3.is_true(value) if isinstance(var, BoolVar) else value.as_long()
 
-        if solver.check() == z3.unsat:
+    def solve(self):
+        model = self._find_model()
+        if model is None:
+            for var in self.variables:
+                var.sol = None
             return False
+        for var in self.variables:
+            var.sol = self._decode(model, var)
+        return True
 
-        model = solver.model()
+    def _refute(self, chunk):
+        # a model in which some literal of `chunk` is false
+        model = self._find_model([z3.Or([z3.Not(lit) for lit in chunk])])
+        if model is None:
+            return None
+        return lambda lit: z3.is_true(model.eval(lit, model_completion=True))
+
+    def _fix(self, lits):
+        for lit in lits:
+            self._add(lit)
+
+    def solve_irrefutably(self, is_answer_key):
+        """
+        Find the values of answer keys (`is_answer_key[v.id]` is nonzero) which are common to all the solutions.
+        `sol` of each answer key is set to the common value, or None if it is not unique. `sol` of the other
+        variables is set to None. Statistics of the computation are stored in `stats.backbone`.
+        """
+        model = self._find_model()
         for var in self.variables:
+            var.sol = None
+        if model is None:
+            return False
+
+        answer_keys = [var for var in self.variables if is_answer_key[var.id]]
+        answer = [self._decode(model, var) for var in answer_keys]
+        candidates = []
+        for var, value in zip(answer_keys, answer):
             var_z3 = self.variables_dict[var.id]
             if isinstance(var, BoolVar):
-                var.sol = z3.is_true(model[var_z3])
-            elif isinstance(var, IntVar):
-                var.sol = model[var_z3].as_long()
+                candidates.append(var_z3 if value else z3.Not(var_z3))
+            else:
+                candidates.append(var_z3 == value)
+        self.stats.backbone = BackboneStats()
+        is_backbone = compute_backbone(candidates, self._refute, self._fix, self.stats.backbone,
+                                       chunk_size=cspuz.config.backbone_chunk_size)
+        for var, value, irrefutable in zip(answer_keys, answer, is_backbone):
+            if irrefutable:
+                var.sol = value
         return True
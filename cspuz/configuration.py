@@ -1,4 +1,8 @@
+import contextlib
 import os
+import subprocess
+import threading
+import time
 from distutils.util import strtobool
 
 
@@ -9,12 +13,70 @@ def _get_default(infer_from_env, env_key, default):
         return default
 
 
+# per-thread overrides of the configuration: a dict from id(Config) to a dict of option values
+_local = threading.local()
+
+
 class Config(object):
     def __init__(self, infer_from_env=True):
         self.default_backend = _get_default(infer_from_env, 'CSPUZ_DEFAULT_BACKEND', 'sugar')
         self.backend_path = _get_default(infer_from_env, 'CSPUZ_BACKEND_PATH', None)
         self.use_graph_primitive = strtobool(_get_default(infer_from_env, 'CSPUZ_USE_GRAPH_PRIMITIVE', 'False'))
+        self.pysat_solver = _get_default(infer_from_env, 'CSPUZ_PYSAT_SOLVER', 'cadical195')
+        self.use_backend_server = strtobool(_get_default(infer_from_env, 'CSPUZ_USE_BACKEND_SERVER', 'False'))
+        self.use_presolve = strtobool(_get_default(infer_from_env, 'CSPUZ_USE_PRESOLVE', 'True'))
         self.solver_timeout = None
+        # a `time.monotonic()` value after which the backend must not run (see `solver_time_limit`)
+        self.solver_deadline = None
+        chunk_size = _get_default(infer_from_env, 'CSPUZ_BACKBONE_CHUNK_SIZE', None)
+        self.backbone_chunk_size = int(chunk_size) if chunk_size is not None else None
+        # functions called as `hook(solver, stats)` after each call of `Solver.find_answer` and `Solver.solve`,
+        # where `stats` is the `SolveStats` of the call
+        self.solve_hooks = []
+
+    def __getattribute__(self, name):
+        overrides = getattr(_local, 'overrides', None)
+        if overrides is not None:
+            values = overrides.get(id(self))
+            if values is not None and name in values:
+                return values[name]
+        return object.__getattribute__(self, name)
+
+    @contextlib.contextmanager
+    def override(self, values):
+        """
+        Context manager making the options in `values` (a dict from option names to values) take effect in the block,
+        only for the current thread. The configuration seen by other threads is not changed.
+        """
+        if getattr(_local, 'overrides', None) is None:
+            _local.overrides = dict()
+        previous = _local.overrides.get(id(self))
+        _local.overrides[id(self)] = dict(values) if previous is None else dict(previous, **values)
+        try:
+            yield
+        finally:
+            if previous is None:
+                del _local.overrides[id(self)]
+            else:
+                _local.overrides[id(self)] = previous
+
+    def solver_time_limit(self, cmd):
+        """
+        Return the time limit (in seconds, or None if unlimited) of a call of the backend `cmd`, which is
+        `solver_timeout` shortened to the time left until `solver_deadline`.
+        Raise `subprocess.TimeoutExpired` if the deadline has already passed.
+        """
+        timeout = self.solver_timeout
+        if self.solver_deadline is None:
+            return timeout
+        remaining = self.solver_deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        return min(timeout, remaining) if timeout else remaining
+
+    def as_dict(self):
+        """Return the options seen by the current thread as a dict."""
+        return {name: getattr(self, name) for name in self.__dict__}
 
 
 config = Config()
@@ -1,5 +1,7 @@
 from enum import Enum, auto
-import functools
+import gc
+import itertools
+import weakref
 
 
 def check_dtype(obj, dtype):
@@ -12,7 +14,7 @@ def check_dtype(obj, dtype):
 class Op(Enum):
     VAR = auto()
     NEG = auto()  # -int : int
-    ADD = auto()  # int + int : int
+    ADD = auto()  # int + int + ... : int
     SUB = auto()  # int - int : int
     MUL = auto()  # int * int : int
     MOD = auto()  # int % int : int
@@ -30,25 +32,112 @@ class Op(Enum):
     IMP = auto()  # bool (=>) bool : bool
     IF = auto()  # if (bool) { int } else { int } : int
     ALLDIFF = auto()  # alldifferent(int*) : bool
+    COUNT_TRUE = auto()  # count_true(bool*) : int
     GRAPH_ACTIVE_VERTICES_CONNECTED = auto()
 
 
+# Expressions built by `_make_expr` are hash-consed: structurally equal expressions are represented by the same
+# object, so that backends can process (and emit) each of them only once.
+# Operands which are expressions are identified by their `id`; this is safe since an interned expression keeps its
+# operands alive, and the entry is removed when the expression itself is garbage-collected.
+# (A plain dict of `KeyedRef` is used rather than `WeakValueDictionary`, which is considerably slower to update.
+# Likewise, keys contain `op.value` since hashing `Enum` members is slow.)
+_interned_exprs = dict()
+
+
+def _forget_interned_expr(ref):
+    if _interned_exprs.get(ref.key) is ref:
+        del _interned_exprs[ref.key]
+
+
+def _new_expr(cls, op, operands):
+    key = [cls, op.value]
+    for o in operands:
+        if isinstance(o, Expr):
+            key.append(id(o))
+        elif isinstance(o, (bool, int)):
+            key.append((type(o), o))
+        else:
+            return cls(op, operands)
+    key = tuple(key)
+    ref = _interned_exprs.get(key)
+    if ref is not None:
+        e = ref()
+        if e is not None:
+            return e
+    e = cls(op, operands)
+    _interned_exprs[key] = weakref.KeyedRef(e, _forget_interned_expr, key)
+    return e
+
+
+_GC_SUSPEND_THRESHOLD = 1024
+
+
+def _size(shape):
+    ret = 1
+    for n in shape:
+        ret *= n
+    return ret
+
+
+def _strides(shape):
+    # strides (in elements) of the row-major layout
+    ret = [1] * len(shape)
+    for i in range(len(shape) - 2, -1, -1):
+        ret[i] = ret[i + 1] * shape[i + 1]
+    return ret
+
+
+def _broadcast_shape(shapes):
+    ndim = max(len(shape) for shape in shapes)
+    ret = []
+    for i in range(ndim):
+        dims = set(shape[i - ndim + len(shape)] for shape in shapes if i - ndim + len(shape) >= 0)
+        dims.discard(1)
+        if len(dims) >= 2:
+            raise TypeError('operands have non-uniform shapes')
+        ret.append(dims.pop() if len(dims) == 1 else 1)
+    return tuple(ret)
+
+
+def _broadcast_data(array, shape):
+    # elements of `array` broadcast to `shape` (in the row-major order)
+    if array.shape == shape:
+        return array.data
+    src_shape = (1,) * (len(shape) - len(array.shape)) + array.shape
+    indices = [0]
+    for n_src, stride, n in zip(src_shape, _strides(src_shape), shape):
+        if n_src == 1:
+            indices = [i for i in indices for _ in range(n)]
+        else:
+            indices = [i + j * stride for i in indices for j in range(n)]
+    return [array.data[i] for i in indices]
+
+
+def _convert_numpy(o):
+    # NumPy arrays and scalars (or anything with `tolist`) are converted into `Array`s and Python scalars
+    if isinstance(o, (Expr, Array, int)) or not hasattr(o, 'tolist'):
+        return o
+    if getattr(o, 'shape', None) == ():
+        return o.item()
+    return Array(o)
+
+
 def _make_expr(op, operands):
-    # array shape checking
+    operands = [_convert_numpy(o) for o in operands]
+    # array shape checking (operands are broadcast to the common shape as in NumPy)
     shapes = []
     for o in operands:
         if isinstance(o, Array):
             shapes.append(o.shape)
-    if len(shapes) >= 2:
-        for i in range(1, len(shapes)):
-            if shapes[0] != shapes[i]:
-                raise TypeError('operands have non-uniform shapes')
+    if len(shapes) >= 2 and any(shape != shapes[0] for shape in shapes):
+        shapes = [_broadcast_shape(shapes)]
     # type checking
     if op in [Op.NEG, Op.ADD, Op.SUB, Op.MUL, Op.MOD, Op.EQ, Op.NE, Op.LE, Op.LT, Op.GE, Op.GT, Op.ALLDIFF]:
         # operand type: int
         if not all(map(lambda o: check_dtype(o, int), operands)):
             return NotImplemented
-    elif op in [Op.NOT, Op.AND, Op.OR, Op.IFF, Op.XOR, Op.IMP]:
+    elif op in [Op.NOT, Op.AND, Op.OR, Op.IFF, Op.XOR, Op.IMP, Op.COUNT_TRUE]:
         # operand type: bool
         if not all(map(lambda o: check_dtype(o, bool), operands)):
             return NotImplemented
@@ -57,45 +146,44 @@ def _make_expr(op, operands):
             return NotImplemented
 
     if len(shapes) == 0:
-        if op in [Op.NEG, Op.ADD, Op.SUB, Op.MUL, Op.MOD, Op.IF]:
-            return IntExpr(op, operands)
+        if op in [Op.NEG, Op.ADD, Op.SUB, Op.MUL, Op.MOD, Op.IF, Op.COUNT_TRUE]:
+            return _new_expr(IntExpr, op, operands)
         else:
-            return BoolExpr(op, operands)
+            return _new_expr(BoolExpr, op, operands)
     else:
-        if len(shapes[0]) == 1:
-            size, = shapes[0]
-        else:
-            h, w = shapes[0]
-            size = h * w
-        if op in [Op.NEG, Op.ADD, Op.SUB, Op.MUL, Op.MOD, Op.IF]:
+        shape = shapes[0]
+        size = _size(shape)
+        if op in [Op.NEG, Op.ADD, Op.SUB, Op.MUL, Op.MOD, Op.IF, Op.COUNT_TRUE]:
             dtype = int
+            cls = IntExpr
         else:
             dtype = bool
-        data = []
-        for i in range(size):
-            ops = []
-            for o in operands:
-                if isinstance(o, Array):
-                    ops.append(o.data[i])
-                else:
-                    ops.append(o)
-            if dtype is int:
-                data.append(IntExpr(op, ops))
-            else:
-                data.append(BoolExpr(op, ops))
-
+            cls = BoolExpr
+        columns = [_broadcast_data(o, shape) if isinstance(o, Array) else itertools.repeat(o, size) for o in operands]
+        # Expressions never form reference cycles, so the cyclic GC (which would repeatedly be triggered by the
+        # allocations here) is suspended while building a large array.
+        gc_suspended = size >= _GC_SUSPEND_THRESHOLD and gc.isenabled()
+        if gc_suspended:
+            gc.disable()
+        try:
+            data = [_new_expr(cls, op, list(ops)) for ops in zip(*columns)]
+        finally:
+            if gc_suspended:
+                gc.enable()
         return Array(data, shape=shapes[0], dtype=dtype)
 
 
 class Expr(object):
+    # `__slots__` keeps expressions and variables small; `__weakref__` is needed for hash-consing (see `_new_expr`)
+    __slots__ = ('op', 'operands', '__weakref__')
+
     def __init__(self, op, operands):
         self.op = op
         self.operands = operands
 
 
 class BoolExpr(Expr):
-    def __init__(self, op, operands):
-        super(BoolExpr, self).__init__(op, operands)
+    __slots__ = ()
 
     def cond(self, t, f):
         res = _make_expr(Op.IF, [self, t, f])
@@ -142,8 +230,7 @@ class BoolExpr(Expr):
 
 
 class IntExpr(Expr):
-    def __init__(self, op, operands):
-        super(IntExpr, self).__init__(op, operands)
+    __slots__ = ()
 
     def __neg__(self):
         return _make_expr(Op.NEG, [self])
@@ -192,8 +279,11 @@ class IntExpr(Expr):
 
 
 class BoolVar(BoolExpr):
+    __slots__ = ('id', 'sol')
+
     def __init__(self, id):
-        super(BoolVar, self).__init__(Op.VAR, [])
+        self.op = Op.VAR
+        self.operands = ()
         self.id = id
         self.sol = None
 
@@ -203,22 +293,13 @@ class BoolVars(object):
         self.vars = vars
 
     def fold_or(self):
-        if len(self.vars) == 0:
-            return False
-        else:
-            return functools.reduce(lambda x, y: x | y, self.vars)
+        return fold_or(self.vars)
 
     def fold_and(self):
-        if len(self.vars) == 0:
-            return True
-        else:
-            return functools.reduce(lambda x, y: x & y, self.vars)
+        return fold_and(self.vars)
 
     def count_true(self):
-        if len(self.vars) == 0:
-            return 0
-        else:
-            return functools.reduce(lambda x, y: x + y, map(lambda x: x.cond(1, 0), self.vars))
+        return count_true(self.vars)
 
     def __iter__(self):
         return iter(self.vars)
@@ -236,8 +317,11 @@ class IntVars(object):
 
 
 class IntVar(IntExpr):
+    __slots__ = ('id', 'lo', 'hi', 'sol')
+
     def __init__(self, id, lo, hi):
-        super(IntVar, self).__init__(Op.VAR, [])
+        self.op = Op.VAR
+        self.operands = ()
         self.id = id
         self.lo = lo
         self.hi = hi
@@ -254,128 +338,158 @@ def alldifferent(*args):
         return True
 
 
-def count_true(*args):
-    res = None
+def _flatten_args(args):
+    ret = []
     for arg in args:
         if hasattr(arg, '__iter__'):
-            for x in arg:
-                if res is None:
-                    res = x.cond(1, 0)
-                else:
-                    res = res + x.cond(1, 0)
+            ret.extend(arg)
         else:
-            if res is None:
-                res = arg.cond(1, 0)
-            else:
-                res = res + arg.cond(1, 0)
-    if res is None:
-        return 0
+            ret.append(arg)
+    return ret
+
+
+def count_true(*args, axis=None):
+    """
+    The number of true values among the arguments (bool expressions, or iterables of them).
+    A single `COUNT_TRUE` node is built instead of a chain of binary additions, so that backends can encode it as
+    a cardinality constraint.
+    If `axis` is specified, the argument must be a single `Array`, which is reduced along `axis`.
+    """
+    if axis is not None:
+        return _single_array(args, 'count_true').count_true(axis=axis)
+    terms = []
+    offset = 0
+    for x in _flatten_args(args):
+        if isinstance(x, bool):
+            offset += int(x)
+        else:
+            terms.append(x)
+    if len(terms) == 0:
+        return offset
+    res = _make_expr(Op.COUNT_TRUE, terms)
+    if res is NotImplemented:
+        raise TypeError('unsupported argument type(s) for `count_true`')
+    if offset != 0:
+        res = res + offset
     return res
 
 
-def fold_or(*args):
-    res = None
-    for arg in args:
-        if hasattr(arg, '__iter__'):
-            for x in arg:
-                if res is None:
-                    res = x
-                else:
-                    res = res | x
+def fold_sum(*args, axis=None):
+    """
+    The sum of the arguments (int expressions, or iterables of them) as a single n-ary `ADD` node.
+    Weighted sums can be written with terms like `x * 2`, which backends handle as linear terms.
+    If `axis` is specified, the argument must be a single `Array`, which is reduced along `axis`.
+    """
+    if axis is not None:
+        return _single_array(args, 'fold_sum').fold_sum(axis=axis)
+    terms = []
+    offset = 0
+    for x in _flatten_args(args):
+        if isinstance(x, int) and not isinstance(x, bool):
+            offset += x
         else:
-            if res is None:
-                res = arg
-            else:
-                res = res | arg
-    if res is None:
+            terms.append(x)
+    if offset != 0 or len(terms) == 0:
+        terms.append(offset)
+    if len(terms) == 1:
+        return terms[0]
+    res = _make_expr(Op.ADD, terms)
+    if res is NotImplemented:
+        raise TypeError('unsupported argument type(s) for `fold_sum`')
+    return res
+
+
+def _single_array(args, name):
+    if len(args) != 1 or not isinstance(args[0], Array):
+        raise TypeError('`{}` with `axis` takes exactly one Array'.format(name))
+    return args[0]
+
+
+def fold_or(*args, axis=None):
+    if axis is not None:
+        return _single_array(args, 'fold_or').fold_or(axis=axis)
+    terms = []
+    for x in _flatten_args(args):
+        if isinstance(x, bool):
+            if x:
+                return True
+        else:
+            terms.append(x)
+    if len(terms) == 0:
         return False
-    else:
-        return res
+    if len(terms) == 1:
+        return terms[0]
+    res = _make_expr(Op.OR, terms)
+    if res is NotImplemented:
+        raise TypeError('unsupported argument type(s) for `fold_or`')
+    return res
 
 
-def fold_and(*args):
-    res = None
-    for arg in args:
-        if hasattr(arg, '__iter__'):
-            for x in arg:
-                if res is None:
-                    res = x
-                else:
-                    res = res & x
+def fold_and(*args, axis=None):
+    if axis is not None:
+        return _single_array(args, 'fold_and').fold_and(axis=axis)
+    terms = []
+    for x in _flatten_args(args):
+        if isinstance(x, bool):
+            if not x:
+                return False
         else:
-            if res is None:
-                res = arg
-            else:
-                res = res & arg
-    if res is None:
+            terms.append(x)
+    if len(terms) == 0:
         return True
-    else:
-        return res
+    if len(terms) == 1:
+        return terms[0]
+    res = _make_expr(Op.AND, terms)
+    if res is NotImplemented:
+        raise TypeError('unsupported argument type(s) for `fold_and`')
+    return res
 
 
-def _compute_shape(data):
-    if hasattr(data, '__len__') and hasattr(data, '__iter__') and hasattr(data, '__getitem__'):
-        h = len(data)
-        if h == 0:
-            return 0,
-        row = data[0]
-        if hasattr(row, '__len__') and hasattr(row, '__iter__') and hasattr(data, '__getitem__'):
-            w = len(row)
-            for i in range(1, h):
-                if len(data[i]) != w:
-                    raise ValueError('jugged arrays are not supported')
-            return h, w
-        else:
-            return h,
-    else:
-        return ()
+def _is_sequence(obj):
+    return hasattr(obj, '__len__') and hasattr(obj, '__iter__') and hasattr(obj, '__getitem__') and \
+        not isinstance(obj, str)
 
 
-def _parse_range(r, size):
-    if isinstance(r, slice):
-        lo = r.start
-        hi = r.stop
-        if lo is None:
-            lo = 0
-        elif lo < 0:
-            lo = lo + size
-        if hi is None:
-            hi = size
-        elif hi < 0:
-            hi = hi + size
-        point = False
-    else:
-        if r < 0:
-            r2 = r + size
-        else:
-            r2 = r
-        if not 0 <= r2 < size:
-            raise IndexError('index {} is out of bounds for the axis with size {}'.format(r, size))
-        lo = r2
-        hi = r2 + 1
-        point = True
-    return min(max(0, lo), size), min(max(0, hi), size), point
+def _compute_shape(data):
+    if not _is_sequence(data):
+        return ()
+    shape = []
+    level = [data]
+    while True:
+        n = len(level[0])
+        for x in level:
+            if len(x) != n:
+                raise ValueError('jugged arrays are not supported')
+        shape.append(n)
+        if n == 0:
+            break
+        level = [y for x in level for y in x]
+        if not _is_sequence(level[0]):
+            if any(_is_sequence(y) for y in level):
+                raise ValueError('jugged arrays are not supported')
+            break
+    return tuple(shape)
 
 
 class Array(object):
+    # make NumPy defer to the (reflected) operators of `Array` for e.g. `numpy_array == cspuz_array`
+    __array_ufunc__ = None
+
     def __init__(self, data, shape=None, dtype=None):
-        if isinstance(shape, int):
-            shape = (shape,)
+        if hasattr(data, 'tolist') and not isinstance(data, list):
+            # e.g. numpy.ndarray
+            data = data.tolist() if shape is None else data.reshape(-1).tolist()
         if shape is not None:
             self.data = data
-            self.shape = shape
+            self.shape = (shape,) if isinstance(shape, int) else tuple(shape)
         else:
             shape = _compute_shape(data)
             if len(shape) == 0:
                 raise ValueError('0-dim arrays are not supported')
-            if len(shape) == 1:
-                self.data = [x for x in data]
-            if len(shape) == 2:
-                h, w = shape
-                self.data = []
-                for y in range(h):
-                    for x in range(w):
-                        self.data.append(data[y][x])
+            data = list(data)
+            for _ in range(len(shape) - 1):
+                data = [y for x in data for y in x]
+            self.data = data
             self.shape = shape
         if dtype is None:
             if len(self.data) == 0:
@@ -394,55 +508,147 @@ class Array(object):
     def flatten(self):
         return Array(self.data, shape=(len(self.data),), dtype=self.dtype)
 
-    def reshape(self, shape):
+    def reshape(self, *shape):
+        if len(shape) == 1:
+            shape = shape[0]
         if isinstance(shape, int):
-            size = shape
-        else:
-            if len(shape) == 1:
-                size, = shape
-            elif len(shape) == 2:
-                h, w = shape
-                size = h * w
-            else:
-                raise ValueError('invalid shape')
-        if size != len(self.data):
+            shape = (shape,)
+        shape = tuple(shape)
+        if shape.count(-1) == 1:
+            # the size of the axis given as -1 is inferred
+            rest = _size([n for n in shape if n != -1])
+            if rest == 0 or len(self.data) % rest != 0:
+                raise ValueError('reshaping into array of different size')
+            shape = tuple(len(self.data) // rest if n == -1 else n for n in shape)
+        if any(n < 0 for n in shape):
+            raise ValueError('invalid shape')
+        if _size(shape) != len(self.data):
             raise ValueError('reshaping into array of different size')
         return Array(self.data, shape=shape, dtype=self.dtype)
 
-    def __getitem__(self, item):
-        if len(self.shape) == 1:
-            sz, = self.shape
-            lo, hi, pt = _parse_range(item, sz)
-            if pt:
-                return self.data[lo]
-            else:
-                ret_data = []
-                for i in range(lo, hi):
-                    ret_data.append(self.data[i])
-                return Array(ret_data, shape=(max(0, hi - lo),), dtype=self.dtype)
-        else:
-            h, w = self.shape
-            if isinstance(item, tuple) and len(item) == 2:
-                y, x = item
-            else:
-                y = item
-                x = slice(None, None)
-            ylo, yhi, ypt = _parse_range(y, h)
-            xlo, xhi, xpt = _parse_range(x, w)
+    def transpose(self, *axes):
+        ndim = len(self.shape)
+        if len(axes) == 0:
+            axes = tuple(range(ndim - 1, -1, -1))
+        elif len(axes) == 1 and not isinstance(axes[0], int):
+            axes = tuple(axes[0])
+        if sorted(axes) != list(range(ndim)):
+            raise ValueError('axes don\'t match array')
+        strides = _strides(self.shape)
+        indices = [0]
+        for a in axes:
+            indices = [i + j * strides[a] for i in indices for j in range(self.shape[a])]
+        return Array([self.data[i] for i in indices], shape=tuple(self.shape[a] for a in axes), dtype=self.dtype)
 
-            if ypt and xpt:
-                return self.data[ylo * w + xlo]
+    def __getitem__(self, item):
+        if not isinstance(item, tuple):
+            item = (item,)
+        if len(item) == len(self.shape) and all(type(i) is int for i in item):
+            # fast path for accessing a single element
+            offset = 0
+            for i, n in zip(item, self.shape):
+                if not -n <= i < n:
+                    raise IndexError('index {} is out of bounds for the axis with size {}'.format(i, n))
+                offset = offset * n + (i % n)
+            return self.data[offset]
+        if all(i is Ellipsis or isinstance(i, slice) or (isinstance(i, int) and not isinstance(i, bool))
+               for i in item):
+            return self._basic_getitem(item)
+        return self._advanced_getitem(item)
+
+    def _basic_getitem(self, item):
+        # indexing by integers and slices
+        ndim = len(self.shape)
+        num_ellipsis = item.count(Ellipsis)
+        if num_ellipsis >= 2:
+            raise IndexError('an index can only have a single ellipsis')
+        if num_ellipsis == 1:
+            k = item.index(Ellipsis)
+            item = item[:k] + (slice(None),) * (ndim - len(item) + 1) + item[k + 1:]
+        if len(item) > ndim:
+            raise IndexError('too many indices for array')
+        item = item + (slice(None),) * (ndim - len(item))
+
+        # offsets of the selected elements are computed axis by axis in the row-major order
+        shape = []
+        bases = [0]
+        for k in range(ndim):
+            i = item[k]
+            n = self.shape[k]
+            if isinstance(i, slice):
+                r = range(*i.indices(n))
+                shape.append(len(r))
+                if k == ndim - 1 and r.step == 1:
+                    data = []
+                    for b in bases:
+                        data += self.data[b * n + r.start:b * n + r.stop]
+                    return Array(data, shape=tuple(shape), dtype=self.dtype)
+                bases = [b * n + j for b in bases for j in r]
             else:
-                ret_data = []
-                for i in range(ylo, yhi):
-                    for j in range(xlo, xhi):
-                        ret_data.append(self.data[i * w + j])
-                if ypt and not xpt:
-                    return Array(ret_data, shape=(max(0, xhi - xlo), ), dtype=self.dtype)
-                elif not ypt and xpt:
-                    return Array(ret_data, shape=(max(0, yhi - ylo), ), dtype=self.dtype)
-                else:
-                    return Array(ret_data, shape=(max(0, yhi - ylo), max(0, xhi - xlo)), dtype=self.dtype)
+                if not -n <= i < n:
+                    raise IndexError('index {} is out of bounds for the axis with size {}'.format(i, n))
+                i %= n
+                bases = [b * n + i for b in bases]
+        if len(shape) == 0:
+            return self.data[bases[0]]
+        return Array([self.data[b] for b in bases], shape=tuple(shape), dtype=self.dtype)
+
+    def _advanced_getitem(self, item):
+        # indexing by integer arrays / boolean masks, which follows NumPy by indexing an array of indices
+        try:
+            import numpy
+        except ImportError:
+            raise TypeError('indexing with arrays requires numpy')
+        item = tuple(numpy.array(i.data).reshape(i.shape) if isinstance(i, Array) else i for i in item)
+        indices = numpy.arange(len(self.data)).reshape(self.shape)[item]
+        if indices.ndim == 0:
+            return self.data[int(indices)]
+        return Array([self.data[i] for i in indices.reshape(-1).tolist()], shape=indices.shape, dtype=self.dtype)
+
+    def _reduce(self, fn, axis, dtype):
+        # apply `fn` (which takes a list of elements) along `axis` (an int, a tuple of ints or None for all axes)
+        if axis is None:
+            return fn(self.data)
+        ndim = len(self.shape)
+        axes = (axis,) if isinstance(axis, int) else tuple(axis)
+        for a in axes:
+            if not -ndim <= a < ndim:
+                raise ValueError('axis {} is out of bounds for array of dimension {}'.format(a, ndim))
+        axes = sorted(set(a % ndim for a in axes))
+        kept = [a for a in range(ndim) if a not in axes]
+        if len(kept) == 0:
+            return fn(self.data)
+        shape = tuple(self.shape[a] for a in kept)
+        grouped = self.transpose(kept + axes).data
+        group_size = _size([self.shape[a] for a in axes])
+        data = [fn(grouped[i * group_size:(i + 1) * group_size]) for i in range(_size(shape))]
+        return Array(data, shape=shape, dtype=dtype)
+
+    def count_true(self, axis=None):
+        return self._reduce(count_true, axis, int)
+
+    def fold_or(self, axis=None):
+        return self._reduce(fold_or, axis, bool)
+
+    def fold_and(self, axis=None):
+        return self._reduce(fold_and, axis, bool)
+
+    def fold_sum(self, axis=None):
+        return self._reduce(fold_sum, axis, int)
+
+    def solution(self):
+        """
+        Return the solution (`sol`) of the variables in this array as a NumPy masked array of the same shape.
+        Elements whose values are not determined (`sol` is None, e.g. non-unique cells after `Solver.solve`) are masked.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ModuleNotFoundError('numpy is not found')
+        sols = [x if isinstance(x, (bool, int)) else x.sol for x in self.data]
+        mask = numpy.fromiter((s is None for s in sols), dtype=bool, count=len(sols))
+        values = numpy.fromiter((0 if s is None else s for s in sols), dtype=self.dtype, count=len(sols))
+        return numpy.ma.masked_array(values.reshape(self.shape), mask=mask.reshape(self.shape))
 
     def __iter__(self):
         return iter(self.data)
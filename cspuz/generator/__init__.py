@@ -1,2 +1,4 @@
-from cspuz.generator.core import default_score_calculator, default_uniqueness_checker, count_non_default_values, generate_problem
+from cspuz.generator.core import default_score_calculator, default_uniqueness_checker, count_non_default_values, generate_problem, stream_problems
 from cspuz.generator.builder import Builder, Choice, ArrayBuilder2D
+from cspuz.generator.multi_chain import generate_problem_multi_chain, iterate_problems_multi_chain
+from cspuz.generator.cache import SolverCache
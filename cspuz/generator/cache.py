@@ -0,0 +1,117 @@
+import collections
+import copy
+import hashlib
+import pickle
+import shelve
+import threading
+
+from cspuz.constraints import Expr, BoolVar, IntVar, Array
+from cspuz.solver import Solver
+
+
+def _snapshot(obj):
+    # Copy of `obj` (an answer returned by a solver function) which keeps `sol` of the variables but does not refer to
+    # the `Solver` or the constraints.
+    if isinstance(obj, (BoolVar, IntVar)):
+        return copy.copy(obj)
+    if isinstance(obj, Expr) or isinstance(obj, (bool, int, str)) or obj is None:
+        return obj
+    if isinstance(obj, Solver):
+        return None
+    if isinstance(obj, Array):
+        return Array([_snapshot(x) for x in obj.data], shape=obj.shape, dtype=obj.dtype)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(x) for x in obj)
+    if hasattr(obj, '__dict__'):
+        # e.g. BoolGridFrame
+        ret = copy.copy(obj)
+        for key, value in vars(obj).items():
+            setattr(ret, key, _snapshot(value))
+        return ret
+    return obj
+
+
+def _canonical(problem):
+    # Form of `problem` determined only by its content: NumPy arrays (or anything with `tolist`), lists and tuples are
+    # converted into nested tuples. `repr` is not used, as it omits elements of large NumPy arrays.
+    if hasattr(problem, 'tolist'):
+        problem = problem.tolist()
+    if isinstance(problem, (list, tuple)):
+        return tuple(_canonical(x) for x in problem)
+    return problem
+
+
+class SolverCache(object):
+    """
+    LRU cache of the results of a solver function (which returns `(is_sat, *answer)` like the ones passed to
+    `generate_problem`), keyed by the content of the problem.
+
+    At most `maxsize` results are kept in memory. If `path` is specified, results are also stored in a `shelve` database
+    at `path` so that they survive across runs. A cache (and its database) must be used for only one solver function,
+    and the database should not be shared by concurrent processes.
+    Answers are stored as snapshots holding `sol` of the variables, so they are not affected by later solves.
+    """
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.store = shelve.open(path) if path is not None else None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(problem):
+        # the pickle protocol is fixed so that keys stored in the database stay valid
+        return hashlib.sha1(pickle.dumps(_canonical(problem), protocol=4)).hexdigest()
+
+    def _put_memory(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def get(self, problem):
+        """Return the cached result for `problem`, or None if it is not cached."""
+        key = self.key(problem)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            if self.store is not None and key in self.store:
+                result = self.store[key]
+                self._put_memory(key, result)
+                self.hits += 1
+                return result
+            self.misses += 1
+            return None
+
+    def put(self, problem, result):
+        key = self.key(problem)
+        result = _snapshot(tuple(result))
+        with self.lock:
+            self._put_memory(key, result)
+            if self.store is not None:
+                self.store[key] = result
+
+    def wrap(self, solver):
+        """Return a function which behaves like `solver` but uses this cache."""
+        def cached_solver(problem):
+            result = self.get(problem)
+            if result is None:
+                result = solver(problem)
+                self.put(problem, result)
+            return result
+        return cached_solver
+
+    def close(self):
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
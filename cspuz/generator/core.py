@@ -1,6 +1,12 @@
+import collections
+import concurrent.futures
 import math
+import queue
 import random
+import subprocess
 import sys
+import threading
+import time
 
 from cspuz.constraints import IntVar, BoolVar, Array
 from cspuz.grid_frame import BoolGridFrame
@@ -45,6 +51,40 @@ def count_non_default_values(problem, default, weight=1):
             return 0
 
 
+def _solve_neighbors(solver, neighbors, pretest, executor=None, window=1):
+    # Yields (problem, solver(problem)) for each neighbor passing `pretest`, in the order of `neighbors`.
+    # With `executor`, up to `window` neighbors are solved ahead concurrently; solves not yet started are cancelled
+    # when the consumer stops iterating.
+    if executor is None:
+        for next_problem in neighbors:
+            if pretest is not None and not pretest(next_problem):
+                continue
+            yield next_problem, solver(next_problem)
+        return
+
+    neighbors = iter(neighbors)
+    pending = collections.deque()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    next_problem = next(neighbors)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if pretest is not None and not pretest(next_problem):
+                    continue
+                pending.append((next_problem, executor.submit(solver, next_problem)))
+            if len(pending) == 0:
+                return
+            next_problem, future = pending.popleft()
+            yield next_problem, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
 def generate_problem(solver,
                      initial_problem=None,
                      neighbor_generator=None,
@@ -56,7 +96,24 @@ def generate_problem(solver,
                      initial_temperature=5.0,
                      temperature_decay=0.995,
                      max_steps=None,
+                     parallel=None,
+                     cache=None,
+                     time_limit=None,
                      verbose=False):
+    """
+    Generate a problem by simulated annealing.
+
+    If `parallel` is specified, up to `parallel` neighbors are solved concurrently by a thread pool (so `solver`
+    need not be picklable). The results are still examined in the order of the neighbors, so the acceptance is the
+    same as in the sequential mode. Any backend can be used by the concurrent solves (the z3 backend builds the terms
+    of each thread in a separate context), but `solver` itself must be safe to call from several threads.
+
+    If `cache` (a `SolverCache`) is specified, results of `solver` are cached so that problems visited again are not
+    solved again.
+
+    If `time_limit` (in seconds) is specified, the generation fails (and None is returned) once the time limit is
+    exceeded. The time limit is checked after each solve, so it does not interrupt a running solve.
+    """
     if builder_pattern is not None:
         if initial_problem is not None or neighbor_generator is not None:
             raise ValueError('initial_problem and neighbor_generator must not be specified if builder_pattern is specified')
@@ -68,43 +125,131 @@ def generate_problem(solver,
         score = default_score_calculator
     if uniqueness is None:
         uniqueness = default_uniqueness_checker
+    if cache is not None:
+        solver = cache.wrap(solver)
 
     problem = initial_problem
     current_score = None
     temperature = initial_temperature
+    deadline = None if time_limit is None else time.monotonic() + time_limit
 
     if max_steps is None:
         max_steps = 1000
 
-    for step in range(max_steps):
-        for next_problem in neighbor_generator(problem):
-            if pretest is not None and not pretest(next_problem):
-                continue
-
-            is_sat, *answer = solver(next_problem)
-            if not is_sat:
-                continue
-
-            if uniqueness(*answer):
-                print('generated', file=sys.stderr)
-                return next_problem
-
-            next_score_base = score(*answer)
-            if clue_penalty is None:
-                next_score_penalty = 0
-            else:
-                next_score_penalty = clue_penalty(next_problem)
-            next_score = next_score_base - next_score_penalty
-
-            update = current_score is None or current_score <= next_score or \
-                     random.random() < math.exp((next_score - current_score) / temperature)
-            if update:
-                if verbose:
-                    print('score: {} -> {} (base: {}, penalty: {})'.format(
-                        current_score, next_score, next_score_base, next_score_penalty), file=sys.stderr)
-                problem = next_problem
-                current_score = next_score
-                break
-        temperature *= temperature_decay
+    if parallel is not None and parallel > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=parallel)
+        window = parallel
+    else:
+        executor = None
+        window = 1
+
+    try:
+        for step in range(max_steps):
+            neighbors = _solve_neighbors(solver, neighbor_generator(problem), pretest, executor=executor, window=window)
+            for next_problem, (is_sat, *answer) in neighbors:
+                if deadline is not None and time.monotonic() > deadline:
+                    neighbors.close()
+                    print('failed (time limit exceeded)', file=sys.stderr)
+                    return None
+
+                if not is_sat:
+                    continue
+
+                if uniqueness(*answer):
+                    print('generated', file=sys.stderr)
+                    return next_problem
+
+                next_score_base = score(*answer)
+                if clue_penalty is None:
+                    next_score_penalty = 0
+                else:
+                    next_score_penalty = clue_penalty(next_problem)
+                next_score = next_score_base - next_score_penalty
+
+                update = current_score is None or current_score <= next_score or \
+                         random.random() < math.exp((next_score - current_score) / temperature)
+                if update:
+                    if verbose:
+                        print('score: {} -> {} (base: {}, penalty: {})'.format(
+                            current_score, next_score, next_score_base, next_score_penalty), file=sys.stderr)
+                    problem = next_problem
+                    current_score = next_score
+                    break
+            # cancel the solves of the remaining neighbors
+            neighbors.close()
+            temperature *= temperature_decay
+    finally:
+        if executor is not None:
+            # solves already running cannot be interrupted; they are left to finish in the background
+            executor.shutdown(wait=False)
     print('failed', file=sys.stderr)
     return None
+
+
+def _stream_problems_impl(solver, count, kwargs):
+    num_generated = 0
+    while count is None or num_generated < count:
+        try:
+            problem = generate_problem(solver, **kwargs)
+        except subprocess.TimeoutExpired:
+            print('timeout', file=sys.stderr)
+            continue
+        if problem is not None:
+            num_generated += 1
+            yield problem
+
+
+def _prefetch(iterator, size):
+    # Runs `iterator` in a background thread, keeping at most `size` items ahead of the consumer.
+    buffer = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for item in iterator:
+                while not stopped.is_set():
+                    try:
+                        buffer.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stopped.is_set():
+                    return
+            buffer.put((end, None))
+        except BaseException as e:
+            buffer.put((end, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exc = buffer.get()
+            if item is end:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+def stream_problems(solver, count=None, prefetch=None, cache=None, time_limit=None, **kwargs):
+    """
+    Yield generated problems continuously. Arguments other than the below ones are passed to `generate_problem`.
+
+    - `count`: the number of problems to yield (unlimited by default).
+    - `prefetch`: if specified, problems are generated in a background thread, up to `prefetch` problems ahead of the
+      consumer. Otherwise, the next problem is generated only when it is requested.
+    - `cache`: a `SolverCache` shared among all the generations.
+    - `time_limit`: time budget (in seconds) for each problem; the generation is restarted if it is exceeded.
+      Solves raising `subprocess.TimeoutExpired` (see `config.solver_timeout`) also restart the generation.
+
+    Solver processes are kept warm across problems if `config.use_backend_server` is enabled.
+    """
+    kwargs = dict(kwargs, cache=cache, time_limit=time_limit)
+    problems = _stream_problems_impl(solver, count, kwargs)
+    if prefetch is None:
+        return problems
+    else:
+        return _prefetch(problems, prefetch)
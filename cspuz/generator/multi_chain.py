@@ -0,0 +1,124 @@
+import multiprocessing
+import pickle
+import queue
+import random
+import subprocess
+import sys
+import traceback
+
+from cspuz.backend._subproc import terminate_process_tree
+from cspuz.generator.core import generate_problem
+
+
+def _run_chain(result_queue, chain_id, seed, initial_temperature, restart, kwargs):
+    random.seed(seed)
+    while True:
+        try:
+            problem = generate_problem(initial_temperature=initial_temperature, **kwargs)
+        except subprocess.TimeoutExpired:
+            # restart the generation, as `stream_problems` does
+            print('timeout', file=sys.stderr)
+            continue
+        except Exception as e:
+            # reported to the parent process, which re-raises it
+            trace = traceback.format_exc()
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError('chain {} failed:\n{}'.format(chain_id, trace))
+            result_queue.put((chain_id, None, e))
+            return
+        result_queue.put((chain_id, problem, None))
+        if not restart:
+            return
+
+
+def _chain_temperatures(num_chains, temperatures, initial_temperature):
+    if temperatures is not None:
+        if num_chains is not None and num_chains != len(temperatures):
+            raise ValueError('num_chains and len(temperatures) differ')
+        return list(temperatures)
+    if num_chains is None:
+        num_chains = multiprocessing.cpu_count()
+    return [initial_temperature] * num_chains
+
+
+def _iterate_chains(solver, temperatures, seed, restart, kwargs):
+    # Yields the results of the chains (None for a failed chain) as they are produced. An exception raised in a chain
+    # is re-raised here.
+    # fork is used so that `solver` and other callbacks (typically lambdas) need not be picklable.
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    processes = []
+    try:
+        for i, temperature in enumerate(temperatures):
+            process = context.Process(target=_run_chain,
+                                      args=(result_queue, i, seed + i, temperature, restart, {'solver': solver, **kwargs}),
+                                      daemon=True)
+            process.start()
+            processes.append(process)
+        num_running = len(processes)
+        while num_running > 0:
+            try:
+                chain_id, problem, exc = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes) and result_queue.empty():
+                    # e.g. the chains were killed by a signal
+                    raise RuntimeError('all the chains exited without reporting a result')
+                continue
+            if exc is not None:
+                raise exc
+            if not restart:
+                num_running -= 1
+            yield problem
+    finally:
+        for process in processes:
+            if process.is_alive():
+                # backend processes (e.g. Sugar) spawned by the chain are also terminated
+                terminate_process_tree(process)
+        for process in processes:
+            process.join()
+
+
+def generate_problem_multi_chain(solver, num_chains=None, temperatures=None, seed=None, initial_temperature=5.0,
+                                 **kwargs):
+    """
+    Run independent simulated annealing chains of `generate_problem` in separate processes, and return the first
+    problem generated by any of them (or None if all the chains fail).
+
+    The number of chains is `num_chains` (the number of CPUs by default). Each chain starts with `initial_temperature`,
+    unless the temperature of each chain is given by `temperatures` (e.g. a geometric ladder [2.0, 4.0, 8.0, 16.0]).
+    Chain `i` uses the random seed `seed + i`. Other keyword arguments are passed to `generate_problem`.
+    The remaining chains are terminated once a problem is generated.
+
+    A chain whose solve raises `subprocess.TimeoutExpired` (see `config.solver_timeout`) restarts its generation.
+    Any other exception raised in a chain terminates all the chains and is re-raised.
+    """
+    temperatures = _chain_temperatures(num_chains, temperatures, initial_temperature)
+    chains = _iterate_chains(solver, temperatures, seed, False, kwargs)
+    try:
+        for problem in chains:
+            if problem is not None:
+                return problem
+        return None
+    finally:
+        chains.close()
+
+
+def iterate_problems_multi_chain(solver, num_chains=None, temperatures=None, seed=None, initial_temperature=5.0,
+                                 **kwargs):
+    """
+    Same as `generate_problem_multi_chain`, but yields generated problems indefinitely.
+    A chain restarts from the initial problem whenever it generates a problem or fails.
+    The chains are terminated when the iterator is closed (e.g. by breaking out of the for loop).
+    """
+    temperatures = _chain_temperatures(num_chains, temperatures, initial_temperature)
+    chains = _iterate_chains(solver, temperatures, seed, True, kwargs)
+    try:
+        for problem in chains:
+            if problem is not None:
+                yield problem
+    finally:
+        chains.close()
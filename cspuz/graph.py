@@ -1,4 +1,4 @@
-from cspuz.constraints import count_true, Array, IntVar, IntExpr, _compute_shape, BoolExpr, Op
+from cspuz.constraints import count_true, fold_sum, Array, IntVar, IntExpr, _compute_shape, BoolExpr, Op
 from cspuz.grid_frame import BoolGridFrame
 from cspuz.configuration import config
 
@@ -69,9 +69,20 @@ def _from_grid_frame(grid_frame):
     return edges, graph
 
 
+# Backends which handle `Op.GRAPH_ACTIVE_VERTICES_CONNECTED` natively, without the Sugar extension. The choice is
+# made when the constraint is built; Sugar backends expand the primitive into the rank encoding below unless the
+# extension supports it (`config.use_graph_primitive`), so a problem built this way can be solved by any backend.
+_GRAPH_PRIMITIVE_BACKENDS = ('pysat', 'z3')
+
+
+def _use_graph_primitive(use_graph_primitive):
+    if use_graph_primitive is not None:
+        return use_graph_primitive
+    return config.use_graph_primitive or config.default_backend in _GRAPH_PRIMITIVE_BACKENDS
+
+
 def _active_vertices_connected(solver, is_active, graph, acyclic=False, use_graph_primitive=None):
-    if use_graph_primitive is None:
-        use_graph_primitive = config.use_graph_primitive
+    use_graph_primitive = _use_graph_primitive(use_graph_primitive)
     if use_graph_primitive and not acyclic:
         solver.ensure(BoolExpr(Op.GRAPH_ACTIVE_VERTICES_CONNECTED,
             [graph.num_vertices, len(graph)] + list(is_active) + sum([[x, y] for x, y in graph.edges], [])
@@ -158,8 +169,7 @@ def active_edges_acyclic(solver, is_active_edge, graph):
 
 
 def _division_connected(solver, division, num_regions, graph, roots=None, allow_empty_group=False, use_graph_primitive=None):
-    if use_graph_primitive is None:
-        use_graph_primitive = config.use_graph_primitive
+    use_graph_primitive = _use_graph_primitive(use_graph_primitive)
 
     n = graph.num_vertices
     m = len(graph)
@@ -248,9 +258,10 @@ def _division_connected_variable_groups(solver, graph, group_size=None):
         solver.ensure(downstream_size <= total_size)
         solver.ensure(is_root.then(downstream_size == total_size))
         for i in range(n):
-            solver.ensure(sum(
-                [(is_active_edge[e] & (rank[j] > rank[i])).cond(downstream_size[j], 0) for j, e in graph.incident_edges[i]]
-            ) + 1 == downstream_size[i])
+            solver.ensure(fold_sum(
+                [(is_active_edge[e] & (rank[j] > rank[i])).cond(downstream_size[j], 0) for j, e in graph.incident_edges[i]],
+                1
+            ) == downstream_size[i])
 
             if isinstance(group_size, (int, IntVar, IntExpr)):
                 s = group_size
@@ -289,12 +300,10 @@ def division_connected_variable_groups(solver, graph=None, shape=None, group_siz
 
 
 def _active_edges_single_cycle(solver, is_active_edge, graph, use_graph_primitive=None):
-    if use_graph_primitive is None:
-        use_graph_primitive = config.use_graph_primitive
+    use_graph_primitive = _use_graph_primitive(use_graph_primitive)
     n = graph.num_vertices
     m = len(graph)
 
-    rank = solver.int_array(n, 0, n - 1)
     is_passed = solver.bool_array(n)
 
     if use_graph_primitive:
@@ -315,6 +324,7 @@ def _active_edges_single_cycle(solver, is_active_edge, graph, use_graph_primitiv
             [len(graph), len(edge_graph)] + list(is_active_edge) + sum([[x, y] for x, y in edge_graph], [])
         ))
     else:
+        rank = solver.int_array(n, 0, n - 1)
         is_root = solver.bool_array(n)
 
         for i in range(n):
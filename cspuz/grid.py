@@ -1,6 +1,4 @@
-import functools
-
-from cspuz.constraints import BoolVars, IntVars
+from cspuz.constraints import BoolVars, IntVars, count_true
 
 
 def parse_range(r, lim):
@@ -64,7 +62,6 @@ class BoolGrid(object):
         ranks = [[solver.int_var(0, height * width - 1) for _ in range(width)] for _ in range(height)]
         is_root = [[solver.bool_var() for _ in range(width)] for _ in range(height)]
 
-        root_count = None
         for y in range(height):
             for x in range(width):
                 neighbors = []
@@ -76,17 +73,10 @@ class BoolGrid(object):
                     neighbors.append((y, x - 1))
                 if x < width - 1:
                     neighbors.append((y, x + 1))
-                less_ranks = [((ranks[y2][x2] < ranks[y][x]) & ~self[y2, x2]).cond(1, 0) for y2, x2 in neighbors]
-                solver.ensure((~self[y, x]).then(
-                    functools.reduce(lambda a, b: a + b, less_ranks, is_root[y][x].cond(1, 0)) >= 1
-                ))
-
-                if root_count is None:
-                    root_count = is_root[y][x].cond(1, 0)
-                else:
-                    root_count = root_count + is_root[y][x].cond(1, 0)
+                less_ranks = [(ranks[y2][x2] < ranks[y][x]) & ~self[y2, x2] for y2, x2 in neighbors]
+                solver.ensure((~self[y, x]).then(count_true(less_ranks, is_root[y][x]) >= 1))
 
-        solver.ensure(root_count <= 1)
+        solver.ensure(count_true([r for row in is_root for r in row]) <= 1)
 
     def forbid_adjacent_true_cells_and_connect_false_cells(self):
         self.forbid_adjacent_true_cells()
@@ -104,12 +94,12 @@ class BoolGrid(object):
                         y2 = y + dy
                         x2 = x + dx
                         if 0 <= y2 < height and 0 <= x2 < width:
-                            less_ranks.append(((ranks[y2][x2] < ranks[y][x]) & self[y2, x2]).cond(1, 0))
+                            less_ranks.append((ranks[y2][x2] < ranks[y][x]) & self[y2, x2])
                             if (y2, x2) < (y, x):
                                 solver.ensure(ranks[y2][x2] != ranks[y][x])
                         else:
                             nonzero = True
-                solver.ensure(self[y, x].then(sum(less_ranks) <= (0 if nonzero else 1)))
+                solver.ensure(self[y, x].then(count_true(less_ranks) <= (0 if nonzero else 1)))
 
 
 class IntGrid(object):
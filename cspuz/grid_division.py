@@ -1,3 +1,4 @@
+from cspuz.constraints import count_true
 from cspuz.grid import IntGrid, BoolGrid
 from cspuz.grid_frame import BoolGridFrame
 
@@ -35,8 +36,8 @@ class GridDivision(object):
                     neighbors.append((y, x - 1))
                 if x < width - 1:
                     neighbors.append((y, x + 1))
-                solver.ensure(sum([
-                    (spanning_forest[y + y2, x + x2] & (rank[y, x] > rank[y2, x2])).cond(1, 0) for y2, x2 in neighbors
+                solver.ensure(count_true([
+                    spanning_forest[y + y2, x + x2] & (rank[y, x] > rank[y2, x2]) for y2, x2 in neighbors
                 ]) == is_root[y, x].cond(0, 1))
 
                 if y > 0:
@@ -48,7 +49,7 @@ class GridDivision(object):
                         (region_id[y, x] == region_id[y, x - 1]) & (rank[y, x] != rank[y, x - 1]))
                     )
         for i in range(self.num_regions):
-            solver.ensure(sum([(r & (n == i)).cond(1, 0) for r, n in zip(is_root[:, :], region_id[:, :])]) == 1)
+            solver.ensure(count_true([r & (n == i) for r, n in zip(is_root[:, :], region_id[:, :])]) == 1)
 
         if roots is not None:
             for i, (y, x) in enumerate(roots):
@@ -0,0 +1,720 @@
+"""
+Presolve of constraints before they are passed to a backend.
+
+- Constants are folded, and constraints which become trivially true (including comparisons decided by the bounds of
+  both sides, e.g. `count_true(...) >= 0`) are dropped.
+- Unit constraints on a single variable (e.g. `b`, `~b`, `x == 3` or `x <= 2`) are turned into fixed values or
+  restricted domains, which are substituted into the other constraints. This is repeated until no unit constraint
+  is found.
+- Bounds of int variables are tightened by propagating the bounds through top-level (in)equalities (in the manner of
+  HC4: the bounds of subexpressions are computed bottom-up, and the bounds implied by the constraint are propagated
+  top-down to the variables), e.g. `y == x + 1` with `x` in [0, 3] restricts `y` to [1, 4].
+- Bool variables which are constrained to be equal (`a == b`) or opposite (`a != b`) are merged into one.
+- Variables whose values are fixed, merged variables and variables which appear in no constraint (except answer
+  keys) are not passed to the backend at all.
+
+Graph constraints (`Op.GRAPH_ACTIVE_VERTICES_CONNECTED`) are passed to the backend as they are.
+"""
+
+import collections
+import math
+import time
+
+from cspuz.constraints import Op, Expr, BoolExpr, IntExpr, BoolVar, IntVar, _new_expr
+
+_COMPARISON_OPS = (Op.EQ, Op.NE, Op.LE, Op.LT, Op.GE, Op.GT)
+_ARITHMETIC_OPS = (Op.NEG, Op.ADD, Op.SUB, Op.MUL, Op.MOD)
+_INF = float('inf')
+
+# limit of the number of revisions of a constraint in the bounds propagation, since propagation between
+# variables with wide domains (e.g. `x < y` and `y < x`) converges slowly
+_MAX_REVISIONS_PER_CONSTRAINT = 16
+
+
+def _is_int_constant(e):
+    return isinstance(e, int) and not isinstance(e, bool)
+
+
+def _interval(op, operand_bounds):
+    # bounds of the value of an int expression from the bounds of its (int) operands, or None if unknown
+    if op == Op.NEG:
+        lo, hi = operand_bounds[0]
+        return -hi, -lo
+    elif op == Op.ADD:
+        return sum(b[0] for b in operand_bounds), sum(b[1] for b in operand_bounds)
+    elif op == Op.SUB:
+        lo, hi = operand_bounds[0]
+        for b in operand_bounds[1:]:
+            lo, hi = lo - b[1], hi - b[0]
+        return lo, hi
+    elif op == Op.MUL:
+        lo, hi = operand_bounds[0]
+        for b in operand_bounds[1:]:
+            cands = [lo * b[0], lo * b[1], hi * b[0], hi * b[1]]
+            lo, hi = min(cands), max(cands)
+        return lo, hi
+    elif op == Op.IF:
+        return min(b[0] for b in operand_bounds), max(b[1] for b in operand_bounds)
+    return None
+
+
+def _compare_bounds(op, a, b):
+    # True / False if `a op b` is decided by the bounds `a` and `b` of both sides, otherwise None
+    if op == Op.LE:
+        return True if a[1] <= b[0] else (False if a[0] > b[1] else None)
+    elif op == Op.LT:
+        return True if a[1] < b[0] else (False if a[0] >= b[1] else None)
+    elif op == Op.GE:
+        return _compare_bounds(Op.LE, b, a)
+    elif op == Op.GT:
+        return _compare_bounds(Op.LT, b, a)
+    elif op == Op.EQ:
+        if a[0] == a[1] == b[0] == b[1]:
+            return True
+        return False if a[1] < b[0] or b[1] < a[0] else None
+    elif op == Op.NE:
+        res = _compare_bounds(Op.EQ, a, b)
+        return None if res is None else not res
+
+
+def _evaluate(op, values):
+    # value of an arithmetic expression with constant operands, or None if undefined (division by zero)
+    if op == Op.NEG:
+        return -values[0]
+    elif op == Op.ADD:
+        return sum(values)
+    elif op == Op.SUB:
+        return values[0] - sum(values[1:])
+    elif op == Op.MUL:
+        ret = 1
+        for v in values:
+            ret *= v
+        return ret
+    elif op == Op.MOD:
+        ret = values[0]
+        for v in values[1:]:
+            if v == 0:
+                return None
+            ret %= v
+        return ret
+    elif op == Op.EQ:
+        return values[0] == values[1]
+    elif op == Op.NE:
+        return values[0] != values[1]
+    elif op == Op.LE:
+        return values[0] <= values[1]
+    elif op == Op.LT:
+        return values[0] < values[1]
+    elif op == Op.GE:
+        return values[0] >= values[1]
+    elif op == Op.GT:
+        return values[0] > values[1]
+    elif op == Op.ALLDIFF:
+        return len(set(values)) == len(values)
+
+
+def _is_literal(e):
+    return isinstance(e, BoolVar) or (isinstance(e, BoolExpr) and e.op == Op.NOT and isinstance(e.operands[0], BoolVar))
+
+
+def _sum_except(values):
+    # function giving the sum of `values` except the i-th one, without computing `inf - inf`
+    finite_sum = 0
+    infinite = []
+    for x in values:
+        if math.isinf(x):
+            infinite.append(x)
+        else:
+            finite_sum += x
+
+    def sum_except(i):
+        if math.isinf(values[i]):
+            return infinite[0] if len(infinite) >= 2 else finite_sum
+        return infinite[0] if len(infinite) >= 1 else finite_sum - values[i]
+    return sum_except
+
+
+def _ceil_div(a, b):
+    return -((-a) // b)
+
+
+def _div_bounds(lo, hi, c):
+    # bounds of `t` such that `t * c` is in [lo, hi] (c != 0)
+    if c < 0:
+        lo, hi, c = -hi, -lo, -c
+    return (_ceil_div(lo, c) if lo != -_INF else -_INF), (hi // c if hi != _INF else _INF)
+
+
+class Presolver(object):
+    """
+    Simplifier of constraints over `variables`.
+    After `run`, `fixed` maps the ids of variables whose values are determined to the values, and `domains` maps
+    the ids of int variables with restricted domains to their proxies (`IntVar`s with the same id and the restricted
+    domains). `aliases` maps the ids of merged bool variables to (representative, negated), meaning that the variable
+    is equal to the representative (or its negation if `negated` is True). `infeasible` is set to True if the
+    constraints are found to be unsatisfiable.
+    """
+    def __init__(self, variables):
+        self.variables = variables
+        self.fixed = dict()
+        self.domains = dict()
+        self.aliases = dict()
+        # ids of the variables merged into each representative
+        self.alias_members = dict()
+        self.infeasible = False
+        self.memo = dict()
+
+    def _var_value(self, v):
+        # the current value (a constant or a variable) of `v`
+        if v.id in self.fixed:
+            return self.fixed[v.id]
+        if isinstance(v, IntVar):
+            return self.domains.get(v.id, v)
+        if v.id in self.aliases:
+            representative, negated = self.aliases[v.id]
+            value = self._var_value(representative)
+            return self._negate(value) if negated else value
+        return v
+
+    def _bounds(self, e):
+        if _is_int_constant(e):
+            return e, e
+        if isinstance(e, IntVar):
+            return e.lo, e.hi
+        entry = self.memo.get(id(e))
+        return entry[2] if entry is not None else None
+
+    def _new(self, cls, op, operands):
+        e = _new_expr(cls, op, operands)
+        if cls is IntExpr and id(e) not in self.memo:
+            self.memo[id(e)] = (e, e, self._compute_bounds(e))
+        return e
+
+    def _compute_bounds(self, e):
+        if e.op == Op.COUNT_TRUE:
+            return 0, len(e.operands)
+        if e.op not in _ARITHMETIC_OPS and e.op != Op.IF:
+            return None
+        operand_bounds = [self._bounds(o) for o in (e.operands[1:] if e.op == Op.IF else e.operands)]
+        if any(b is None for b in operand_bounds):
+            return None
+        return _interval(e.op, operand_bounds)
+
+    def _negate(self, a):
+        if isinstance(a, bool):
+            return not a
+        if a.op == Op.NOT:
+            return a.operands[0]
+        return self._new(BoolExpr, Op.NOT, [a])
+
+    def _fold(self, e, operands):
+        # `e` with simplified `operands`, folded if possible
+        op = e.op
+        if op == Op.NOT:
+            return self._negate(operands[0])
+        elif op in (Op.AND, Op.OR):
+            absorbing = (op == Op.OR)
+            rest = []
+            seen = set()
+            negated = set()
+            for a in operands:
+                if isinstance(a, bool):
+                    if a == absorbing:
+                        return absorbing
+                elif id(a) not in seen:
+                    # `a` and `~a` appear together
+                    if id(a) in negated or (a.op == Op.NOT and id(a.operands[0]) in seen):
+                        return absorbing
+                    seen.add(id(a))
+                    if a.op == Op.NOT:
+                        negated.add(id(a.operands[0]))
+                    rest.append(a)
+            if len(rest) == 0:
+                return not absorbing
+            if len(rest) == 1:
+                return rest[0]
+            operands = rest
+        elif op == Op.IMP:
+            a, b = operands
+            if a is True:
+                return b
+            if a is False or b is True:
+                return True
+            if b is False:
+                return self._negate(a)
+        elif op in (Op.IFF, Op.XOR):
+            a, b = operands
+            if isinstance(a, bool):
+                a, b = b, a
+            if isinstance(b, bool):
+                if isinstance(a, bool):
+                    return (a == b) == (op == Op.IFF)
+                return a if b == (op == Op.IFF) else self._negate(a)
+            if a is b:
+                return op == Op.IFF
+        elif op == Op.IF:
+            c, t, f = operands
+            if isinstance(c, bool):
+                return t if c else f
+            if t is f or (_is_int_constant(t) and _is_int_constant(f) and t == f):
+                return t
+        elif op == Op.COUNT_TRUE:
+            num_true = sum(1 for a in operands if a is True)
+            rest = [a for a in operands if not isinstance(a, bool)]
+            if len(rest) == 0:
+                return num_true
+            if len(rest) < len(operands):
+                res = self._new(IntExpr, Op.COUNT_TRUE, rest)
+                return res if num_true == 0 else self._new(IntExpr, Op.ADD, [res, num_true])
+        elif op in _ARITHMETIC_OPS or op in _COMPARISON_OPS or op == Op.ALLDIFF:
+            if all(_is_int_constant(a) for a in operands):
+                res = _evaluate(op, operands)
+                if res is not None:
+                    return res
+            elif op == Op.ADD:
+                constant = sum(a for a in operands if _is_int_constant(a))
+                rest = [a for a in operands if not _is_int_constant(a)]
+                if constant != 0:
+                    rest.append(constant)
+                if len(rest) == 1:
+                    return rest[0]
+                operands = rest
+            elif op in _COMPARISON_OPS:
+                if operands[0] is operands[1]:
+                    return op in (Op.EQ, Op.LE, Op.GE)
+                a, b = (self._bounds(o) for o in operands)
+                if a is not None and b is not None:
+                    res = _compare_bounds(op, a, b)
+                    if res is not None:
+                        return res
+        if len(operands) == len(e.operands) and all(x is y for x, y in zip(operands, e.operands)):
+            return e
+        return self._new(BoolExpr if isinstance(e, BoolExpr) else IntExpr, op, operands)
+
+    def simplify(self, e):
+        """Simplify expression `e` under the current `fixed` and `domains`."""
+        if isinstance(e, (bool, int)):
+            return e
+        if isinstance(e, (BoolVar, IntVar)):
+            return self._var_value(e)
+        if e.op == Op.GRAPH_ACTIVE_VERTICES_CONNECTED:
+            return e
+        stack = [(e, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if id(node) in self.memo:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                for o in node.operands:
+                    if isinstance(o, Expr) and not isinstance(o, (BoolVar, IntVar)) and id(o) not in self.memo:
+                        stack.append((o, False))
+            else:
+                operands = []
+                for o in node.operands:
+                    if isinstance(o, (BoolVar, IntVar)):
+                        operands.append(self._var_value(o))
+                    elif isinstance(o, Expr):
+                        operands.append(self.memo[id(o)][1])
+                    else:
+                        operands.append(o)
+                res = self._fold(node, operands)
+                bounds = None
+                if isinstance(node, IntExpr):
+                    if res is node:
+                        bounds = self._compute_bounds(res)
+                    else:
+                        bounds = self._bounds(res)
+                # `node` is kept in the memo so that its id is not reused
+                self.memo[id(node)] = (node, res, bounds)
+        return self.memo[id(e)][1]
+
+    def _restrict(self, v, lo, hi):
+        # restrict the domain of int variable `v` to [lo, hi]; returns whether the domain is changed
+        if math.isnan(lo) or math.isnan(hi):
+            return False
+        current = self._var_value(v)
+        if _is_int_constant(current):
+            if not lo <= current <= hi:
+                self.infeasible = True
+            return False
+        new_lo = max(lo, current.lo)
+        new_hi = min(hi, current.hi)
+        if new_lo > new_hi:
+            self.infeasible = True
+            return False
+        if (new_lo, new_hi) == (current.lo, current.hi):
+            return False
+        if new_lo == new_hi:
+            self.fixed[v.id] = new_lo
+            self.domains.pop(v.id, None)
+        else:
+            self.domains[v.id] = IntVar(v.id, new_lo, new_hi)
+        return True
+
+    def _merge(self, a, b, negated):
+        # merge bool variables `a` and `b` (`a == b` if not `negated`, otherwise `a != b`), both of which are
+        # representatives
+        if a is b:
+            if negated:
+                self.infeasible = True
+            return
+        members = self.alias_members.pop(b.id, [])
+        for i in members:
+            _, n = self.aliases[i]
+            self.aliases[i] = (a, n != negated)
+        self.aliases[b.id] = (a, negated)
+        self.alias_members.setdefault(a.id, []).extend(members + [b.id])
+
+    def _resolve_literal(self, e):
+        # the current value of literal `e` as a bool constant or (representative, negated)
+        negated = not isinstance(e, BoolVar)
+        value = self._var_value(e if isinstance(e, BoolVar) else e.operands[0])
+        if isinstance(value, bool):
+            return value != negated
+        if isinstance(value, BoolVar):
+            return value, negated
+        return value.operands[0], not negated
+
+    def _assign_literal(self, literal, value):
+        if isinstance(literal, bool):
+            if literal != value:
+                self.infeasible = True
+        else:
+            v, negated = literal
+            self.fixed[v.id] = (value != negated)
+
+    def _apply_unit(self, c):
+        # If `c` is a unit constraint, apply it to `fixed` / `domains` / `aliases` and return True
+        if _is_literal(c):
+            self._assign_literal(self._resolve_literal(c), True)
+            return True
+        if c.op in (Op.IFF, Op.XOR):
+            a, b = c.operands
+            if not (_is_literal(a) and _is_literal(b)):
+                return False
+            a = self._resolve_literal(a)
+            b = self._resolve_literal(b)
+            is_xor = (c.op == Op.XOR)
+            if isinstance(a, bool):
+                a, b = b, a
+            if isinstance(b, bool):
+                self._assign_literal(a, b != is_xor)
+            else:
+                self._merge(a[0], b[0], (a[1] != b[1]) != is_xor)
+            return True
+        if c.op not in _COMPARISON_OPS:
+            return False
+        lhs, rhs = c.operands
+        op = c.op
+        if _is_int_constant(lhs) and isinstance(rhs, IntVar):
+            lhs, rhs = rhs, lhs
+            op = {Op.EQ: Op.EQ, Op.NE: Op.NE, Op.LE: Op.GE, Op.LT: Op.GT, Op.GE: Op.LE, Op.GT: Op.LT}[op]
+        if not (isinstance(lhs, IntVar) and _is_int_constant(rhs)):
+            return False
+        if op == Op.EQ:
+            self._restrict(lhs, rhs, rhs)
+        elif op == Op.LE:
+            self._restrict(lhs, lhs.lo, rhs)
+        elif op == Op.LT:
+            self._restrict(lhs, lhs.lo, rhs - 1)
+        elif op == Op.GE:
+            self._restrict(lhs, rhs, lhs.hi)
+        elif op == Op.GT:
+            self._restrict(lhs, rhs + 1, lhs.hi)
+        elif rhs == lhs.lo:
+            self._restrict(lhs, rhs + 1, lhs.hi)
+        elif rhs == lhs.hi:
+            self._restrict(lhs, lhs.lo, rhs - 1)
+        else:
+            return False
+        return True
+
+    def _forward_bounds(self, e, bounds):
+        # bounds of int expression `e` under the current domains; bounds of the subexpressions are stored in `bounds`
+        stack = [(e, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if not isinstance(node, IntExpr) or isinstance(node, IntVar) or id(node) in bounds:
+                continue
+            if node.op not in _ARITHMETIC_OPS and node.op != Op.IF:
+                bounds[id(node)] = (0, len(node.operands)) if node.op == Op.COUNT_TRUE else (-_INF, _INF)
+                continue
+            operands = node.operands[1:] if node.op == Op.IF else node.operands
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((o, False) for o in operands)
+                continue
+            operand_bounds = [self._current_bounds(o, bounds) for o in operands]
+            if node.op == Op.MOD or (node.op == Op.MUL and any(_INF in b or -_INF in b for b in operand_bounds)):
+                bounds[id(node)] = (-_INF, _INF)
+            else:
+                bounds[id(node)] = _interval(node.op, operand_bounds)
+        return self._current_bounds(e, bounds)
+
+    def _current_bounds(self, e, bounds):
+        if _is_int_constant(e):
+            return e, e
+        if isinstance(e, IntVar):
+            v = self._var_value(e)
+            return (v, v) if _is_int_constant(v) else (v.lo, v.hi)
+        return bounds[id(e)]
+
+    def _revise(self, c, changed):
+        # propagate bounds through comparison `c`; ids of variables whose domains are tightened are added to `changed`
+        lhs, rhs = c.operands
+        bounds = dict()
+        la, ha = self._forward_bounds(lhs, bounds)
+        lb, hb = self._forward_bounds(rhs, bounds)
+        if c.op == Op.EQ:
+            stack = [(lhs, lb, hb), (rhs, la, ha)]
+        elif c.op in (Op.LE, Op.LT):
+            d = 1 if c.op == Op.LT else 0
+            stack = [(lhs, -_INF, hb - d), (rhs, la + d, _INF)]
+        else:
+            d = 1 if c.op == Op.GT else 0
+            stack = [(lhs, lb + d, _INF), (rhs, -_INF, ha - d)]
+        while len(stack) > 0 and not self.infeasible:
+            node, lo, hi = stack.pop()
+            if _is_int_constant(node):
+                if not lo <= node <= hi:
+                    self.infeasible = True
+                continue
+            if isinstance(node, IntVar):
+                v = self._var_value(node)
+                if _is_int_constant(v):
+                    if not lo <= v <= hi:
+                        self.infeasible = True
+                elif self._restrict(node, max(lo, v.lo), min(hi, v.hi)):
+                    changed.add(node.id)
+                continue
+            node_lo, node_hi = bounds[id(node)]
+            if lo <= node_lo and node_hi <= hi:
+                continue
+            lo = max(lo, node_lo)
+            hi = min(hi, node_hi)
+            if lo > hi:
+                self.infeasible = True
+                break
+            operand_bounds = [self._current_bounds(o, bounds) for o in node.operands] \
+                if node.op in (Op.NEG, Op.ADD, Op.SUB, Op.MUL) else None
+            if node.op == Op.NEG:
+                stack.append((node.operands[0], -hi, -lo))
+            elif node.op == Op.ADD:
+                others_lo = _sum_except([b[0] for b in operand_bounds])
+                others_hi = _sum_except([b[1] for b in operand_bounds])
+                for i, o in enumerate(node.operands):
+                    # nothing is propagated to `o` if the other operands are unbounded (e.g. a MOD term)
+                    if not (math.isinf(others_lo(i)) and math.isinf(others_hi(i))):
+                        stack.append((o, lo - others_hi(i), hi - others_lo(i)))
+            elif node.op == Op.SUB:
+                (a_lo, a_hi), rest = operand_bounds[0], operand_bounds[1:]
+                sum_lo = sum(b[0] for b in rest)
+                sum_hi = sum(b[1] for b in rest)
+                if not (math.isinf(sum_lo) and math.isinf(sum_hi)):
+                    stack.append((node.operands[0], lo + sum_lo, hi + sum_hi))
+                if len(rest) > 0:
+                    others_lo = _sum_except([a_lo] + [-b[1] for b in rest])
+                    others_hi = _sum_except([a_hi] + [-b[0] for b in rest])
+                    for i, o in enumerate(node.operands[1:], 1):
+                        # `o` = (the other terms) - `node`
+                        if not (math.isinf(others_lo(i)) and math.isinf(others_hi(i))):
+                            stack.append((o, others_lo(i) - hi, others_hi(i) - lo))
+            elif node.op == Op.MUL and len(node.operands) == 2:
+                a, b = node.operands
+                if _is_int_constant(a):
+                    a, b = b, a
+                if _is_int_constant(b) and b != 0:
+                    t_lo, t_hi = _div_bounds(lo, hi, b)
+                    stack.append((a, t_lo, t_hi))
+
+    def _propagate_bounds(self, constraints):
+        # tighten the domains of int variables by the top-level (in)equalities; returns whether any domain is changed
+        targets = []
+        occurrences = dict()
+        for c in constraints:
+            if c.op not in (Op.EQ, Op.LE, Op.LT, Op.GE, Op.GT):
+                continue
+            for i in _referenced_variable_ids([c]):
+                occurrences.setdefault(i, []).append(len(targets))
+            targets.append(c)
+        queue = collections.deque(range(len(targets)))
+        in_queue = set(queue)
+        num_revisions = [0] * len(targets)
+        any_changed = False
+        while len(queue) > 0 and not self.infeasible:
+            idx = queue.popleft()
+            in_queue.remove(idx)
+            num_revisions[idx] += 1
+            changed = set()
+            self._revise(targets[idx], changed)
+            any_changed = any_changed or len(changed) > 0
+            for i in changed:
+                for j in occurrences[i]:
+                    if j not in in_queue and num_revisions[j] < _MAX_REVISIONS_PER_CONSTRAINT:
+                        queue.append(j)
+                        in_queue.add(j)
+        return any_changed
+
+    def tightened_domains(self):
+        """Return a dict from the ids of int variables whose domains are tightened to the new (lo, hi)."""
+        ret = dict((i, (v.lo, v.hi)) for i, v in self.domains.items())
+        for i, value in self.fixed.items():
+            if isinstance(self.variables[i], IntVar):
+                ret[i] = (value, value)
+        return ret
+
+    def run(self, constraints):
+        """
+        Simplify `constraints` until neither a unit constraint nor a tightened domain is found, and return the
+        remaining constraints.
+        """
+        passthrough = []
+        pending = list(constraints)
+        while not self.infeasible:
+            self.memo = dict()
+            remaining = []
+            changed = False
+            stack = list(reversed(pending))
+            while len(stack) > 0:
+                c = stack.pop()
+                if isinstance(c, Expr) and c.op == Op.GRAPH_ACTIVE_VERTICES_CONNECTED:
+                    passthrough.append(c)
+                    continue
+                c = self.simplify(c)
+                if c is True:
+                    continue
+                if c is False:
+                    self.infeasible = True
+                    break
+                if c.op == Op.AND:
+                    stack.extend(reversed(c.operands))
+                elif self._apply_unit(c):
+                    changed = True
+                else:
+                    remaining.append(c)
+            pending = remaining
+            if not changed and not self.infeasible:
+                changed = self._propagate_bounds(pending)
+            if not changed:
+                break
+        self.memo = dict()
+        return pending + passthrough
+
+
+def _referenced_variable_ids(constraints):
+    ret = set()
+    visited = set()
+    stack = list(constraints)
+    while len(stack) > 0:
+        e = stack.pop()
+        if isinstance(e, (BoolVar, IntVar)):
+            ret.add(e.id)
+        elif isinstance(e, Expr) and id(e) not in visited:
+            visited.add(id(e))
+            stack.extend(e.operands)
+    return ret
+
+
+class PresolvedCSPSolver(object):
+    """
+    A CSP solver of `backend` which solves the presolved problem, and writes the solutions back to `variables`.
+    """
+    def __init__(self, backend, variables, constraints, is_answer_key):
+        start = time.perf_counter()
+        self.variables = variables
+        self.presolver = Presolver(variables)
+        constraints = self.presolver.run(constraints)
+        fixed = self.presolver.fixed
+        aliases = self.presolver.aliases
+
+        # variables in graph constraints (which are not simplified) are still needed even if they are fixed or merged
+        graph_variable_ids = _referenced_variable_ids([c for c in constraints
+                                                       if c.op == Op.GRAPH_ACTIVE_VERTICES_CONNECTED])
+        for i in sorted(graph_variable_ids):
+            v = variables[i]
+            if i in aliases:
+                constraints.append(v == self.presolver.simplify(v))
+                del aliases[i]
+            elif i in fixed:
+                value = fixed.pop(i)
+                constraints.append(v if value is True else (~v if value is False else v == value))
+        self.presolver.memo = dict()
+
+        referenced = _referenced_variable_ids(constraints)
+        is_answer_key = self._answer_keys(is_answer_key)
+        self.backend_variables = []
+        for v in variables:
+            if v.id in fixed or v.id in aliases or not (v.id in referenced or is_answer_key[v.id]):
+                continue
+            self.backend_variables.append(self.presolver.domains.get(v.id, v))
+        presolve_time = time.perf_counter() - start
+        self.csp_solver = backend.CSPSolver(self.backend_variables)
+        # statistics are shared with the backend
+        self.stats = self.csp_solver.stats
+        self.stats.add_time('presolve', presolve_time)
+        if not self.presolver.infeasible:
+            self.csp_solver.add_constraint(constraints)
+
+    @property
+    def solve_irrefutably(self):
+        # available only if the backend has `solve_irrefutably`.
+        # This is not stored as an attribute, since the reference cycle would make this object (and the backend
+        # objects it holds) freed by the garbage collector in an arbitrary thread, which Z3 does not allow.
+        if not hasattr(self.csp_solver, 'solve_irrefutably'):
+            raise AttributeError('solve_irrefutably')
+        return self._solve_irrefutably
+
+    def _answer_keys(self, is_answer_key):
+        # the representative of a merged answer key is also an answer key
+        ret = bytearray(is_answer_key)
+        for i, (representative, _) in self.presolver.aliases.items():
+            if is_answer_key[i]:
+                ret[representative.id] = 1
+        return ret
+
+    def add_constraint(self, constraint):
+        if not isinstance(constraint, list):
+            constraint = [constraint]
+        simplified = []
+        with self.stats.timer('presolve'):
+            for c in constraint:
+                c = self.presolver.simplify(c)
+                if c is False:
+                    self.presolver.infeasible = True
+                elif c is not True:
+                    simplified.append(c)
+            self.presolver.memo = dict()
+        if not self.presolver.infeasible and len(simplified) > 0:
+            self.csp_solver.add_constraint(simplified)
+
+    def _write_back(self, is_sat, default):
+        # `default(v)` is the value of a variable not passed to the backend
+        backend_variables = dict((v.id, v) for v in self.backend_variables)
+        aliases = self.presolver.aliases
+        for v in self.variables:
+            if not is_sat:
+                v.sol = None
+            elif v.id in aliases:
+                continue
+            elif v.id in self.presolver.fixed:
+                v.sol = self.presolver.fixed[v.id]
+            elif v.id in backend_variables:
+                v.sol = backend_variables[v.id].sol
+            else:
+                v.sol = default(v)
+        if is_sat:
+            for i, (representative, negated) in aliases.items():
+                sol = self.variables[representative.id].sol
+                self.variables[i].sol = (sol != negated) if sol is not None else None
+
+    def solve(self):
+        is_sat = not self.presolver.infeasible and self.csp_solver.solve()
+        # unconstrained variables can take any value
+        self._write_back(is_sat, lambda v: False if isinstance(v, BoolVar) else self.presolver.domains.get(v.id, v).lo)
+        return is_sat
+
+    def _solve_irrefutably(self, is_answer_key):
+        is_sat = not self.presolver.infeasible and self.csp_solver.solve_irrefutably(self._answer_keys(is_answer_key))
+        self._write_back(is_sat, lambda v: None)
+        return is_sat
@@ -1,14 +1,13 @@
 import random
 import math
 import sys
-import subprocess
 
 import cspuz
 from cspuz import Solver, graph
 from cspuz.grid_frame import BoolGridFrame
 from cspuz.constraints import count_true
 from cspuz.puzzle import util
-from cspuz.generator import generate_problem, count_non_default_values, ArrayBuilder2D
+from cspuz.generator import generate_problem, stream_problems, count_non_default_values, ArrayBuilder2D, SolverCache
 
 
 def solve_slitherlink(height, width, problem):
@@ -24,7 +23,7 @@ def solve_slitherlink(height, width, problem):
     return is_sat, grid_frame
 
 
-def generate_slitherlink(height, width, symmetry=False, verbose=False):
+def _generation_args(height, width, symmetry):
     def no_neighboring_zero(problem):
         for y in range(height):
             for x in range(width):
@@ -37,13 +36,24 @@ def generate_slitherlink(height, width, symmetry=False, verbose=False):
                                 return False
         return True
 
-    generated = generate_problem(lambda problem: solve_slitherlink(height, width, problem),
-                                 builder_pattern=ArrayBuilder2D(height, width, range(-1, 4), default=-1, symmetry=symmetry, disallow_adjacent=True),
-                                 clue_penalty=lambda problem: count_non_default_values(problem, default=-1, weight=5),
-                                 pretest=no_neighboring_zero, verbose=verbose)
+    return {
+        'solver': lambda problem: solve_slitherlink(height, width, problem),
+        'builder_pattern': ArrayBuilder2D(height, width, range(-1, 4), default=-1, symmetry=symmetry, disallow_adjacent=True),
+        'clue_penalty': lambda problem: count_non_default_values(problem, default=-1, weight=5),
+        'pretest': no_neighboring_zero,
+    }
+
+
+def generate_slitherlink(height, width, symmetry=False, verbose=False):
+    generated = generate_problem(verbose=verbose, **_generation_args(height, width, symmetry))
     return generated
 
 
+def stream_slitherlink(height, width, symmetry=False, verbose=False, **kwargs):
+    # `kwargs` are passed to `stream_problems`
+    return stream_problems(verbose=verbose, **_generation_args(height, width, symmetry), **kwargs)
+
+
 def _main():
     if len(sys.argv) == 1:
         # original example: http://pzv.jp/p.html?slither/4/4/dgdh2c7b
@@ -62,14 +72,9 @@ def _main():
     else:
         cspuz.config.solver_timeout = 1800.0
         height, width = map(int, sys.argv[1:])
-        while True:
-            try:
-                problem = generate_slitherlink(height, width, symmetry=True, verbose=True)
-                if problem is not None:
-                    print(util.stringify_array(problem, { -1: '.', 0: '0', 1: '1', 2: '2', 3: '3' }))
-                    print(flush=True)
-            except subprocess.TimeoutExpired:
-                print('timeout', file=sys.stderr)
+        for problem in stream_slitherlink(height, width, symmetry=True, verbose=True, cache=SolverCache()):
+            print(util.stringify_array(problem, { -1: '.', 0: '0', 1: '1', 2: '2', 3: '3' }))
+            print(flush=True)
 
 
 if __name__ == '__main__':
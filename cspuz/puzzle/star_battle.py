@@ -3,7 +3,7 @@ import math
 import sys
 import numpy as np
 
-from cspuz import Array, Solver, graph
+from cspuz import Array, Solver, graph, count_true
 from cspuz.puzzle import util, url
 
 
@@ -14,14 +14,14 @@ def solve_star_battle(n, blocks, k, is_anti_knight=False):
     has_star = solver.bool_array((n, n))
     solver.add_answer_key(has_star)
     for i in range(n):
-        solver.ensure(sum(has_star[i, :].cond(1, 0)) == k)
-        solver.ensure(sum(has_star[:, i].cond(1, 0)) == k)
+        solver.ensure(count_true(has_star[i, :]) == k)
+        solver.ensure(count_true(has_star[:, i]) == k)
     solver.ensure(~(has_star[:-1, :] & has_star[1:, :]))
     solver.ensure(~(has_star[:, :-1] & has_star[:, 1:]))
     solver.ensure(~(has_star[:-1, :-1] & has_star[1:, 1:]))
     solver.ensure(~(has_star[:-1, 1:] & has_star[1:, :-1]))
     for i in range(n):
-        solver.ensure(sum((has_star & (blocks == i)).cond(1, 0)) == k)
+        solver.ensure(count_true(has_star & (blocks == i)) == k)
 
     if is_anti_knight:
         graph.active_vertices_anti_knight(solver, has_star)
@@ -1,6 +1,11 @@
+import concurrent.futures
+import time
+
 import cspuz
 from cspuz import backend
 from cspuz.constraints import BoolVar, IntVar, BoolVars, Array
+from cspuz.backend._backbone import BackboneStats, compute_backbone
+from cspuz.presolve import PresolvedCSPSolver
 
 
 def _get_default_backend():
@@ -11,76 +16,111 @@ def _get_default_backend():
         return backend.sugar_extended
     elif backend_name == 'z3':
         return backend.z3
+    elif backend_name == 'pysat':
+        return backend.pysat
     else:
         raise ValueError('invalid default backend {}'.format(backend_name))
 
 
+def _shape_size(shape):
+    if isinstance(shape, int):
+        return shape
+    size = 1
+    for n in shape:
+        size *= n
+    return size
+
+
 class Solver(object):
     def __init__(self):
         self.variables = []
-        self.is_answer_key = []
+        # `is_answer_key[i]` is nonzero iff `variables[i]` is an answer key
+        self.is_answer_key = bytearray()
         self.constraints = []
+        # ids of the objects in `constraints`; since expressions are hash-consed, a constraint which is structurally
+        # identical to an existing one is the same object and is not added twice
+        self.constraint_ids = set()
+        # `SolveStats` of the last call of `find_answer` or `solve`
+        self.last_stats = None
 
     def bool_var(self):
         v = BoolVar(len(self.variables))
         self.variables.append(v)
-        self.is_answer_key.append(False)
+        self.is_answer_key.append(0)
         return v
 
     def int_var(self, lo, hi):
         v = IntVar(len(self.variables), lo, hi)
         self.variables.append(v)
-        self.is_answer_key.append(False)
+        self.is_answer_key.append(0)
         return v
 
     def bool_array(self, shape):
-        if isinstance(shape, int):
-            size = shape
-        elif len(shape) == 1:
-            size, = shape
-        else:
-            h, w = shape
-            size = h * w
-        vars = [self.bool_var() for _ in range(size)]
+        start = len(self.variables)
+        vars = [BoolVar(i) for i in range(start, start + _shape_size(shape))]
+        self.variables += vars
+        self.is_answer_key += bytes(len(vars))
         return Array(vars, shape=shape, dtype=bool)
 
     def int_array(self, shape, lo, hi):
-        if isinstance(shape, int):
-            size = shape
-        elif len(shape) == 1:
-            size, = shape
-        else:
-            h, w = shape
-            size = h * w
-        vars = [self.int_var(lo, hi) for _ in range(size)]
+        start = len(self.variables)
+        vars = [IntVar(i, lo, hi) for i in range(start, start + _shape_size(shape))]
+        self.variables += vars
+        self.is_answer_key += bytes(len(vars))
         return Array(vars, shape=shape, dtype=int)
 
     def ensure(self, constraint):
-        if hasattr(constraint, '__iter__'):
-            self.constraints += constraint
-        else:
-            self.constraints.append(constraint)
+        if not hasattr(constraint, '__iter__'):
+            constraint = [constraint]
+        constraint_ids = self.constraint_ids
+        for c in constraint:
+            if id(c) not in constraint_ids:
+                constraint_ids.add(id(c))
+                self.constraints.append(c)
 
     def add_answer_key(self, variable):
         if hasattr(variable, '__iter__'):
             for v in variable:
-                self.is_answer_key[v.id] = True
+                self.is_answer_key[v.id] = 1
         else:
-            self.is_answer_key[variable.id] = True
+            self.is_answer_key[variable.id] = 1
 
-    def find_answer(self, backend=None):
-        if backend is None:
-            backend = _get_default_backend()
+    def _make_csp_solver(self, backend):
+        if cspuz.config.use_presolve:
+            return PresolvedCSPSolver(backend, self.variables, self.constraints, self.is_answer_key)
         csp_solver = backend.CSPSolver(self.variables)
         csp_solver.add_constraint(self.constraints)
-        return csp_solver.solve()
+        return csp_solver
 
-    def solve(self, backend=None):
+    def _run(self, method, backend):
+        start = time.perf_counter()
         if backend is None:
             backend = _get_default_backend()
-        csp_solver = backend.CSPSolver(self.variables)
-        csp_solver.add_constraint(self.constraints)
+        csp_solver = self._make_csp_solver(backend)
+        if method == 'find_answer':
+            is_sat = csp_solver.solve()
+        else:
+            is_sat = self._solve_irrefutably(csp_solver)
+
+        stats = csp_solver.stats
+        stats.method = method
+        stats.backend = backend.__name__.rsplit('.', 1)[-1]
+        stats.is_sat = is_sat
+        stats.num_variables = len(self.variables)
+        stats.num_constraints = len(self.constraints)
+        stats.num_answer_keys = sum(self.is_answer_key)
+        stats.add_time('total', time.perf_counter() - start)
+        self.last_stats = stats
+        _run_solve_hooks(self, stats)
+        return is_sat
+
+    def find_answer(self, backend=None):
+        return self._run('find_answer', backend)
+
+    def solve(self, backend=None):
+        return self._run('solve', backend)
 
+    def _solve_irrefutably(self, csp_solver):
         if hasattr(csp_solver, 'solve_irrefutably'):
             return csp_solver.solve_irrefutably(self.is_answer_key)
 
@@ -88,26 +128,119 @@ class Solver(object):
             # inconsistent problem
             return False
 
-        n_var = len(self.variables)
-        answer = [None] * n_var
-        for i in range(n_var):
-            if self.is_answer_key[i]:
-                answer[i] = self.variables[i].sol
-
-        while True:
-            difference_cond = []
-            for i in range(n_var):
-                if self.is_answer_key[i] and answer[i] is not None:
-                    difference_cond.append(self.variables[i] != answer[i])
-            csp_solver.add_constraint(BoolVars(difference_cond).fold_or())
+        # refuting constraints are added permanently, so all the remaining candidates are refuted at once
+        candidates = [(v, v.sol) for v in self.variables if self.is_answer_key[v.id] and v.sol is not None]
+
+        def refute(chunk):
+            csp_solver.add_constraint(BoolVars([v != value for v, value in chunk]).fold_or())
             if not csp_solver.solve():
-                break
+                return None
+            return lambda candidate: candidate[0].sol == candidate[1]
+
+        csp_solver.stats.backbone = BackboneStats()
+        is_backbone = compute_backbone(candidates, refute, lambda lits: None, csp_solver.stats.backbone)
+        for v in self.variables:
+            if self.is_answer_key[v.id]:
+                v.sol = None
+        for (v, value), irrefutable in zip(candidates, is_backbone):
+            if irrefutable:
+                v.sol = value
+        return True
 
-            for i in range(n_var):
-                if self.is_answer_key[i] and answer[i] is not None and answer[i] != self.variables[i].sol:
-                    answer[i] = None
 
-        for i in range(n_var):
-            if self.is_answer_key[i]:
-                self.variables[i].sol = answer[i]
-        return True
+def _run_solve_hooks(solver, stats):
+    for hook in cspuz.config.solve_hooks:
+        hook(solver, stats)
+
+
+def _run_batch_job(job, find_answer_only, config, timeout):
+    # the configuration of the caller is passed explicitly, as worker processes do not share it and worker threads
+    # must not change the configuration seen by other threads
+    if timeout is not None:
+        # the time limit of the job counts from its start, not from its submission
+        config = dict(config, solver_timeout=timeout, solver_deadline=time.monotonic() + timeout)
+    with cspuz.config.override(config):
+        if isinstance(job, Solver):
+            if find_answer_only:
+                is_sat = job.find_answer()
+            else:
+                is_sat = job.solve()
+            return is_sat, [v.sol for v in job.variables], job.last_stats
+        else:
+            return job[0](*job[1:])
+
+
+def solve_batch(jobs, max_workers=None, use_threads=False, timeout=None, find_answer_only=False,
+                as_completed=False, return_exceptions=False):
+    """
+    Run independent solving jobs in parallel.
+
+    Each job is either a `Solver`, which is solved by `Solver.solve` (or `Solver.find_answer` if `find_answer_only`
+    is True), or a tuple `(func, arg1, arg2, ...)`, for which `func(arg1, arg2, ...)` is called
+    (e.g. `(solve_slitherlink, height, width, problem)`).
+    The result of a `Solver` job is the return value of `solve` (or `find_answer`), and the solution is written back
+    to the variables of the `Solver`; the result of a tuple job is the return value of `func`.
+
+    Jobs are run in a process pool (of `max_workers` processes), or in a thread pool if `use_threads` is True.
+    Jobs and their results must be picklable when run in processes.
+    `timeout` is the time limit (in seconds) of each job, counted from its start. Each call of the backend by the job
+    is limited to the time left (see `config.solver_deadline`), and fails with `subprocess.TimeoutExpired` once the
+    time is up. The Python code of the job itself is not interrupted, so the job may exceed the limit until it next
+    calls the backend.
+    If a job raises an exception, it is re-raised unless `return_exceptions` is True, in which case the exception
+    object is returned as the result of the job (e.g. `subprocess.TimeoutExpired` on timeout).
+
+    If `as_completed` is False, the list of results (in the order of `jobs`) is returned. Otherwise, an iterator which
+    yields pairs `(index, result)` as jobs complete is returned.
+    """
+    jobs = list(jobs)
+    config = cspuz.config.as_dict()
+
+    if use_threads:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        worker_config = config
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        # hooks are not run in worker processes, but in this process when the result is received
+        worker_config = dict(config, solve_hooks=[])
+
+    futures = [executor.submit(_run_batch_job, job, find_answer_only, worker_config, timeout) for job in jobs]
+    future_index = {f: i for i, f in enumerate(futures)}
+
+    def get_result(i):
+        future = futures[i]
+        exc = future.exception()
+        if exc is not None:
+            if return_exceptions:
+                return exc
+            raise exc
+        res = future.result()
+        if isinstance(jobs[i], Solver):
+            is_sat, sols, stats = res
+            for v, sol in zip(jobs[i].variables, sols):
+                v.sol = sol
+            if not use_threads:
+                jobs[i].last_stats = stats
+                _run_solve_hooks(jobs[i], stats)
+            return is_sat
+        return res
+
+    def cleanup():
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+    if not as_completed:
+        try:
+            return [get_result(i) for i in range(len(jobs))]
+        finally:
+            cleanup()
+
+    def iterate():
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                i = future_index[future]
+                yield i, get_result(i)
+        finally:
+            cleanup()
+    return iterate()
@@ -0,0 +1,64 @@
+"""
+Statistics of solving a problem, to see which phase dominates the time of solving.
+
+Every call of `Solver.find_answer` and `Solver.solve` records a `SolveStats` in `Solver.last_stats`, and passes it to
+the hooks in `cspuz.config.solve_hooks`, e.g.
+
+    cspuz.config.solve_hooks.append(lambda solver, stats: print(stats.times))
+"""
+
+import contextlib
+import time
+
+
+class SolveStats(object):
+    """
+    Statistics of a call of `Solver.find_answer` or `Solver.solve`.
+    - `method`: 'find_answer' or 'solve',
+    - `backend`: the name of the backend (e.g. 'pysat'),
+    - `is_sat`: the return value of the call,
+    - `num_variables`, `num_constraints` and `num_answer_keys`: the size of the problem in the `Solver`,
+    - `num_backend_variables` and `num_backend_constraints`: the size of the problem passed to the backend
+      (after presolve; constraints added for refutation are included),
+    - `num_sat_variables` and `num_clauses`: the size of the CNF (pysat backend only),
+    - `num_solver_calls`: the number of calls of the underlying solver (SAT solver, Z3 or Sugar process),
+    - `backbone`: `BackboneStats` of the deduction of irrefutable answers (None if not computed by a backbone engine),
+    - `times`: seconds spent in each phase. Phases are
+      - 'presolve': presolve of constraints,
+      - 'build': conversion of constraints for the backend (CNF encoding, Sugar syntax or Z3 terms),
+      - 'serialize': writing the input of the Sugar process,
+      - 'subprocess': running the Sugar process,
+      - 'parse': parsing the output of the Sugar process,
+      - 'solve': solving by the in-process solver (PySAT or Z3), and
+      - 'total': the whole call (including the time not covered by the other phases).
+      Phases which did not take place are missing.
+    """
+    def __init__(self):
+        self.method = None
+        self.backend = None
+        self.is_sat = None
+        self.num_variables = 0
+        self.num_constraints = 0
+        self.num_answer_keys = 0
+        self.num_backend_variables = 0
+        self.num_backend_constraints = 0
+        self.num_sat_variables = 0
+        self.num_clauses = 0
+        self.num_solver_calls = 0
+        self.backbone = None
+        self.times = dict()
+
+    def add_time(self, phase, seconds):
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        """Context manager adding the time spent in the block to `times[phase]`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def __repr__(self):
+        return 'SolveStats({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.__dict__.items()))
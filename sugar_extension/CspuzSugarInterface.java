@@ -37,6 +37,9 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 */
 
 import java.io.*;
+import java.nio.file.Files;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
 import java.util.*;
 
 import jp.kobe_u.sugar.SugarException;
@@ -46,30 +49,51 @@ import jp.kobe_u.sugar.expression.Sequence;
 import jp.kobe_u.sugar.expression.Atom;
 import jp.kobe_u.sugar.encoder.Encoder;
 import jp.kobe_u.sugar.csp.CSP;
+import jp.kobe_u.sugar.csp.IntegerVariable;
+import jp.kobe_u.sugar.csp.BooleanVariable;
+import jp.kobe_u.sugar.csp.IntegerDomain;
 import jp.kobe_u.sugar.converter.Converter;
 import jp.kobe_u.sugar.converter.Simplifier;
 import jp.kobe_u.sugar.SugarConstants;
 
 class CspuzSugarInterface {
+    // In server mode, a line consisting of this marker terminates each request and response.
+    static final String END_OF_MESSAGE = "%end";
+
     List<Expression> problem;
     ArrayList<String> intVars, boolVars;
     boolean[] isAnswerKeyInt, isAnswerKeyBool;
     CSP csp;
+    Encoder encoder;
     String satFile, mapFile, outFile;
+    // The header `p cnf <variables> <clauses>` of `satFile` (at byte `satHeaderOffset`, `satHeaderLength` bytes long
+    // without the newline), which is kept up to date when clauses are appended.
+    long satHeaderOffset;
+    int satHeaderLength;
+    int satVariables;
+    long satClauses;
     String[] answerKeys;
+    PrintWriter out = new PrintWriter(new BufferedWriter(new OutputStreamWriter(System.out)));
 
-    void loadProblem() throws IOException {
+    boolean loadProblem(BufferedReader reader) throws IOException {
         ArrayList<String> lines = new ArrayList<String>();
-        BufferedReader reader = new BufferedReader(new InputStreamReader(System.in));
         String line;
+        boolean hasRequest = false;
         answerKeys = null;
         while ((line = reader.readLine()) != null) {
+            hasRequest = true;
+            if (line.equals(END_OF_MESSAGE)) {
+                break;
+            }
             if (line.startsWith("#")) {
                 answerKeys = line.substring(1).split(" ");
             } else {
                 lines.add(line);
             }
         }
+        if (!hasRequest) {
+            return false;
+        }
 
         String cspDescription = String.join("\n", lines);
         Parser parser = new Parser(new BufferedReader(new StringReader(cspDescription)));
@@ -105,6 +129,7 @@ class CspuzSugarInterface {
                 isAnswerKeyBool[i] = answerKeySet.contains(boolVars.get(i));
             }
         }
+        return true;
     }
     private File tempFile(String name, String ext) throws IOException {
         File file = File.createTempFile(name, ext);
@@ -130,11 +155,16 @@ class CspuzSugarInterface {
         if (csp.isUnsatisfiable()) {
             return false;
         }
-        Encoder encoder = new Encoder(csp);
+        // In server mode `satFile` is reused, so make sure no clause of the previous problem survives.
+        new FileOutputStream(satFile).close();
+        encoder = new Encoder(csp);
         encoder.encode(satFile);
         encoder.outputMap(mapFile);
+        readSatHeader();
 
-        // Solve SAT
+        return solveSAT();
+    }
+    boolean solveSAT() throws IOException, SugarException {
         String command[] = new String[] { "minisat", satFile, outFile };
         Process process = Runtime.getRuntime().exec(command);
         try {
@@ -146,29 +176,105 @@ class CspuzSugarInterface {
         
         return encoder.decode(outFile);
     }
+    // Code of the literal `v <= value` in the order encoding. `value` must satisfy lb <= value < ub.
+    private int codeLE(IntegerVariable v, int value) {
+        return v.getCode() + v.getDomain().sizeLE(value) - 1;
+    }
+    // Add literals of the clause `v != value` (`v <= value - 1 || !(v <= value)`) to `clause`.
+    private void addRefutingLiterals(List<Integer> clause, IntegerVariable v, int value) {
+        IntegerDomain domain = v.getDomain();
+        if (value - 1 >= domain.getLowerBound()) {
+            clause.add(codeLE(v, value - 1));
+        }
+        if (value < domain.getUpperBound()) {
+            clause.add(-codeLE(v, value));
+        }
+    }
+    // Append `clause` to the already encoded SAT instance so that it need not be encoded again.
+    private void appendClause(List<Integer> clause) throws IOException {
+        StringBuilder sb = new StringBuilder();
+        for (int lit : clause) {
+            sb.append(lit).append(' ');
+        }
+        sb.append("0\n");
+        try (Writer writer = new BufferedWriter(new FileWriter(satFile, true))) {
+            writer.write(sb.toString());
+        }
+        satClauses += 1;
+        updateSatHeader();
+    }
+    private void readSatHeader() throws IOException {
+        try (RandomAccessFile file = new RandomAccessFile(satFile, "r")) {
+            while (true) {
+                long offset = file.getFilePointer();
+                String line = file.readLine();
+                if (line == null) {
+                    throw new IOException("no header in " + satFile);
+                }
+                if (line.startsWith("p ")) {
+                    String[] header = line.trim().split("\\s+");
+                    satHeaderOffset = offset;
+                    satHeaderLength = line.length();
+                    satVariables = Integer.parseInt(header[2]);
+                    satClauses = Long.parseLong(header[3]);
+                    return;
+                }
+            }
+        }
+    }
+    // Write the header for the current number of clauses. Sugar pads the header with spaces, so it is usually
+    // overwritten in place; otherwise, the whole file is rewritten with a padded header.
+    private void updateSatHeader() throws IOException {
+        String header = "p cnf " + satVariables + " " + satClauses;
+        if (header.length() <= satHeaderLength) {
+            StringBuilder sb = new StringBuilder(header);
+            while (sb.length() < satHeaderLength) {
+                sb.append(' ');
+            }
+            try (RandomAccessFile file = new RandomAccessFile(satFile, "rw")) {
+                file.seek(satHeaderOffset);
+                file.write(sb.toString().getBytes("US-ASCII"));
+            }
+            return;
+        }
+        File rewritten = tempFile("temp", ".cnf");
+        try (BufferedReader reader = new BufferedReader(new FileReader(satFile));
+             Writer writer = new BufferedWriter(new FileWriter(rewritten))) {
+            String line;
+            boolean isHeaderWritten = false;
+            while ((line = reader.readLine()) != null) {
+                if (!isHeaderWritten && line.startsWith("p ")) {
+                    line = String.format("%-63s", header);
+                    isHeaderWritten = true;
+                }
+                writer.write(line);
+                writer.write('\n');
+            }
+        }
+        Files.move(rewritten.toPath(), Paths.get(satFile), StandardCopyOption.REPLACE_EXISTING);
+        readSatHeader();
+    }
     void run() throws IOException, SugarException {
-        loadProblem();
-        setupTempFiles();
         boolean isSat = solveCSP();
 
         if (answerKeys == null) {
             // answer finder mode
             if (isSat) {
-                System.out.println("s SATISFIABLE");
+                out.println("s SATISFIABLE");
                 for (String name : intVars) {
-                    System.out.println("a " + name + "\t" + csp.getIntegerVariable(name).getValue());
+                    out.println("a " + name + "\t" + csp.getIntegerVariable(name).getValue());
                 }
                 for (String name : boolVars) {
-                    System.out.println("a " + name + "\t" + csp.getBooleanVariable(name).getValue());
+                    out.println("a " + name + "\t" + csp.getBooleanVariable(name).getValue());
                 }
-                System.out.println("a");
+                out.println("a");
             } else {
-                System.out.println("s UNSATISFIABLE");
+                out.println("s UNSATISFIABLE");
             }
         } else {
             // deduction mode
             if (!isSat) {
-                System.out.println("unsat");
+                out.println("unsat");
                 return;
             }
             boolean[] notRefutedInt = new boolean[isAnswerKeyInt.length];
@@ -183,21 +289,26 @@ class CspuzSugarInterface {
                 notRefutedBool[i] = isAnswerKeyBool[i];
                 answerBool[i] = csp.getBooleanVariable(boolVars.get(i)).getValue();
             }
+            // The CSP is encoded only once; each refuting clause is directly appended to the CNF.
             while (true) {
-                List<Expression> refutingExpr = new ArrayList<Expression>();
+                List<Integer> refutingClause = new ArrayList<Integer>();
                 for (int i = 0; i < isAnswerKeyInt.length; ++i) {
                     if (notRefutedInt[i]) {
-                        refutingExpr.add(Expression.create(intVars.get(i)).ne(answerInt[i]));
+                        addRefutingLiterals(refutingClause, csp.getIntegerVariable(intVars.get(i)), answerInt[i]);
                     }
                 }
                 for (int i = 0; i < isAnswerKeyBool.length; ++i) {
                     if (notRefutedBool[i]) {
-                        refutingExpr.add(Expression.create(boolVars.get(i)).xor(Expression.create(String.valueOf(answerBool[i]))));
+                        int code = csp.getBooleanVariable(boolVars.get(i)).getCode();
+                        refutingClause.add(answerBool[i] ? -code : code);
                     }
                 }
-                problem.add(Expression.create(Expression.OR, refutingExpr));
+                if (refutingClause.isEmpty()) {
+                    break;
+                }
+                appendClause(refutingClause);
 
-                isSat = solveCSP();
+                isSat = solveSAT();
                 if (!isSat) {
                     break;
                 }
@@ -212,21 +323,34 @@ class CspuzSugarInterface {
                     }
                 }
             }
-            System.out.println("sat");
+            out.println("sat");
             for (int i = 0; i < isAnswerKeyInt.length; ++i) {
                 if (isAnswerKeyInt[i] && notRefutedInt[i]) {
-                    System.out.println(intVars.get(i) + " " + answerInt[i]);
+                    out.println(intVars.get(i) + " " + answerInt[i]);
                 }
             }
             for (int i = 0; i < isAnswerKeyBool.length; ++i) {
                 if (isAnswerKeyBool[i] && notRefutedBool[i]) {
-                    System.out.println(boolVars.get(i) + " " + answerBool[i]);
+                    out.println(boolVars.get(i) + " " + answerBool[i]);
                 }
             }
         }
     }
     public static void main(String[] args) throws IOException, SugarException {
         CspuzSugarInterface inf = new CspuzSugarInterface();
-        inf.run();
+        BufferedReader reader = new BufferedReader(new InputStreamReader(System.in));
+        inf.setupTempFiles();
+        if (args.length >= 1 && args[0].equals("--server")) {
+            // server mode: keep the JVM alive and answer problems one after another
+            while (inf.loadProblem(reader)) {
+                inf.run();
+                inf.out.println(END_OF_MESSAGE);
+                inf.out.flush();
+            }
+        } else {
+            inf.loadProblem(reader);
+            inf.run();
+            inf.out.flush();
+        }
     }
 }
@@ -0,0 +1,40 @@
+from cspuz.backend._backbone import BackboneStats, compute_backbone
+
+
+def _run(candidates, backbone, chunk_size):
+    queries = []
+    fixed = []
+
+    def refute(chunk):
+        queries.append(list(chunk))
+        if all(lit in backbone for lit in chunk):
+            return None
+        # a solution falsifying the literals of `chunk` which are not in the backbone
+        return lambda lit: lit in backbone or lit not in chunk
+
+    stats = BackboneStats()
+    is_backbone = compute_backbone(candidates, refute, fixed.extend, stats, chunk_size=chunk_size)
+    return is_backbone, queries, fixed, stats
+
+
+def test_adaptive_chunk_size():
+    candidates = list(range(10))
+    is_backbone, queries, fixed, stats = _run(candidates, {0, 1, 2, 3, 6, 7, 8, 9}, 2)
+    assert is_backbone == [True] * 4 + [False] * 2 + [True] * 4
+    # doubled after an unsatisfiable query, and halved after a query answered by a solution
+    assert queries == [[0, 1], [2, 3, 4, 5], [2, 3], [6, 7, 8, 9]]
+    assert fixed == [0, 1, 2, 3, 6, 7, 8, 9]
+    assert (stats.num_calls, stats.num_sat_calls, stats.num_backbone) == (4, 1, 8)
+
+    is_backbone, queries, fixed, stats = _run(candidates, {0, 1, 2, 3, 6, 7, 8, 9}, None)
+    assert is_backbone == [True] * 4 + [False] * 2 + [True] * 4
+    assert queries == [candidates, [0, 1, 2, 3, 6, 7, 8, 9]]
+    assert (stats.num_calls, stats.num_sat_calls, stats.num_filtered) == (2, 1, 0)
+
+
+def test_chunk_size_lower_bound():
+    is_backbone, queries, _, stats = _run(list(range(4)), set(), 1)
+    assert is_backbone == [False] * 4
+    # every query is answered by a solution, so the chunk size stays at 1
+    assert queries == [[0], [1], [2], [3]]
+    assert stats.num_sat_calls == 4
@@ -0,0 +1,196 @@
+import operator
+
+import pytest
+
+from cspuz import Solver, alldifferent, count_true, fold_sum
+from cspuz.backend import pysat as pysat_backend
+
+pytest.importorskip('pysat')
+
+
+def test_int_arithmetic():
+    solver = Solver()
+    x = solver.int_var(0, 5)
+    y = solver.int_var(0, 5)
+    solver.add_answer_key(x)
+    solver.add_answer_key(y)
+    solver.ensure(x + y == 7)
+    solver.ensure(x - y == 1)
+    assert solver.solve(backend=pysat_backend)
+    assert (x.sol, y.sol) == (4, 3)
+
+
+def test_irrefutable_answer():
+    solver = Solver()
+    a = solver.bool_array(4)
+    n = solver.int_array(3, 1, 3)
+    solver.add_answer_key(a)
+    solver.add_answer_key(n)
+    solver.ensure(count_true(a) == 2)
+    solver.ensure(a[0])
+    solver.ensure(a[0].then(alldifferent(n)))
+    solver.ensure(n[0] < n[1])
+    solver.ensure(n[2] == 1)
+    assert solver.solve(backend=pysat_backend)
+    assert [v.sol for v in a] == [True, None, None, None]
+    assert [v.sol for v in n] == [2, 3, 1]
+
+
+def test_unsatisfiable():
+    solver = Solver()
+    n = solver.int_array(4, 1, 3)
+    solver.ensure(alldifferent(n))
+    assert not solver.find_answer(backend=pysat_backend)
+
+
+@pytest.mark.parametrize('int_encoding', [None, 'order', 'direct'])
+def test_int_encodings(int_encoding):
+    from pysat.solvers import Solver as SATSolver
+    from cspuz.backend._cnf import CNFCompiler
+
+    solver = Solver()
+    x = solver.int_array(3, 0, 4)
+    b = solver.bool_array(3)
+    constraints = [x[0] + x[1] - x[2] == 1, (x[0] >= 3) == b[0], b[1].cond(x[1], 2) == x[2] - 1,
+                   count_true(b) <= 1, x[2] > x[1]]
+    compiler = CNFCompiler(list(x) + list(b), int_encoding=int_encoding)
+    compiler.add_constraints(constraints)
+    sat_solver = SATSolver(bootstrap_with=compiler.take_clauses())
+    solutions = set()
+    while sat_solver.solve():
+        model = set(sat_solver.get_model())
+        solutions.add(tuple(compiler.decode(v, lambda lit: lit in model) for v in list(x) + list(b)))
+        sat_solver.add_clause([-lit for lit in model])
+    expected = set()
+    for x0 in range(5):
+        for x1 in range(5):
+            for x2 in range(5):
+                for b1 in [False, True]:
+                    for b2 in [False, True]:
+                        b0 = x0 >= 3
+                        if x0 + x1 - x2 == 1 and (x1 if b1 else 2) == x2 - 1 and b0 + b1 + b2 <= 1 and x2 > x1:
+                            expected.add((x0, x1, x2, b0, b1, b2))
+    assert len(expected) > 0
+    assert solutions == expected
+
+
+@pytest.mark.parametrize('fn', [operator.eq, operator.ne, operator.le, operator.lt, operator.ge, operator.gt])
+def test_count_true(fn):
+    from pysat.solvers import Solver as SATSolver
+    from cspuz.backend._cnf import CNFCompiler
+
+    solver = Solver()
+    b = solver.bool_array(4)
+    x = solver.int_var(0, 2)
+    for c in range(-1, 8):
+        compiler = CNFCompiler(list(b) + [x])
+        compiler.add_constraints([fn(fold_sum(count_true(b), x * 2), c), fn(count_true(b[:3], True), c - 1)])
+        sat_solver = SATSolver(bootstrap_with=compiler.take_clauses())
+        solutions = set()
+        while sat_solver.solve():
+            model = set(sat_solver.get_model())
+            solutions.add(tuple(compiler.decode(v, lambda lit: lit in model) for v in list(b) + [x]))
+            sat_solver.add_clause([-lit for lit in model])
+        expected = set()
+        for mask in range(1 << 4):
+            bs = tuple(((mask >> i) & 1) == 1 for i in range(4))
+            for xv in range(3):
+                if fn(sum(bs) + xv * 2, c) and fn(sum(bs[:3]) + 1, c - 1):
+                    expected.add(bs + (xv,))
+        assert solutions == expected
+
+
+@pytest.mark.parametrize('sat_solver_name', ['cadical195', 'minisat22'])
+def test_active_vertices_connected(monkeypatch, sat_solver_name):
+    import cspuz
+    from cspuz import graph
+
+    # cadical195 propagates the connectivity during the search, while minisat22 relies on cuts
+    monkeypatch.setattr(cspuz.config, 'pysat_solver', sat_solver_name)
+    solver = Solver()
+    is_active = solver.bool_array((3, 3))
+    graph.active_vertices_connected(solver, is_active, use_graph_primitive=True)
+    solver.ensure(count_true(is_active) == 4)
+    csp_solver = pysat_backend.CSPSolver(solver.variables)
+    csp_solver.add_constraint(solver.constraints)
+    solutions = set()
+    while csp_solver.solve():
+        sol = tuple(v.sol for v in is_active)
+        solutions.add(sol)
+        csp_solver.add_constraint(count_true([v if s else ~v for v, s in zip(is_active, sol)]) < 9)
+
+    def is_connected(cells):
+        cells = set(cells)
+        stack = [min(cells)]
+        visited = set(stack)
+        while len(stack) > 0:
+            y, x = stack.pop()
+            for p in [(y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)]:
+                if p in cells and p not in visited:
+                    visited.add(p)
+                    stack.append(p)
+        return visited == cells
+
+    expected = set()
+    for mask in range(1 << 9):
+        cells = [(i // 3, i % 3) for i in range(9) if (mask >> i) & 1]
+        if len(cells) == 4 and is_connected(cells):
+            expected.add(tuple(((mask >> i) & 1) == 1 for i in range(9)))
+    assert len(expected) > 0
+    assert solutions == expected
+
+
+@pytest.mark.parametrize('sat_solver_name', ['cadical195', 'minisat22'])
+@pytest.mark.parametrize('chunk_size', [None, 1, 3])
+def test_solve_irrefutably(monkeypatch, sat_solver_name, chunk_size):
+    import cspuz
+    from cspuz import graph
+
+    monkeypatch.setattr(cspuz.config, 'pysat_solver', sat_solver_name)
+    monkeypatch.setattr(cspuz.config, 'backbone_chunk_size', chunk_size)
+    solver = Solver()
+    a = solver.bool_array((3, 3))
+    n = solver.int_var(0, 9)
+    graph.active_vertices_connected(solver, a, use_graph_primitive=True)
+    solver.ensure(a[0, 0] & a[2, 2] & ~a[1, 1])
+    solver.ensure(n == count_true(a))
+    solver.ensure(n <= 5)
+    csp_solver = pysat_backend.CSPSolver(solver.variables)
+    csp_solver.add_constraint(solver.constraints)
+    is_answer_key = bytearray(len(solver.variables))
+    for v in list(a) + [n]:
+        is_answer_key[v.id] = 1
+    assert csp_solver.solve_irrefutably(is_answer_key)
+    assert [v.sol for v in a] == [True, None, None, None, False, None, None, None, True]
+    assert n.sol == 5
+    stats = csp_solver.stats.backbone
+    # `n` is encoded by 2 literals, and each of the 9 cells by 1 literal
+    assert stats.num_candidates == 11 and stats.num_backbone == 5
+    num_unsat_calls = stats.num_calls - stats.num_sat_calls
+    assert num_unsat_calls == 1 if chunk_size is None else 1 <= num_unsat_calls <= 5
+
+    csp_solver.add_constraint(~a[0, 1])
+    assert csp_solver.solve_irrefutably(is_answer_key)
+    assert [v.sol for v in a] == [True, False, False, True, False, False, True, True, True]
+
+
+@pytest.mark.parametrize('sat_solver_name', ['cadical195', 'minisat22'])
+def test_timeout(monkeypatch, sat_solver_name):
+    import subprocess
+    import time
+    import cspuz
+
+    monkeypatch.setattr(cspuz.config, 'pysat_solver', sat_solver_name)
+    monkeypatch.setattr(cspuz.config, 'solver_timeout', 1.0)
+    # pigeonhole principle: 14 pigeons do not fit in 13 holes, which is hard for CDCL solvers
+    n = 13
+    solver = Solver()
+    a = solver.bool_array((n + 1, n))
+    for i in range(n + 1):
+        solver.ensure(a[i, :].fold_or())
+    for j in range(n):
+        solver.ensure(count_true(a[:, j]) <= 1)
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        solver.find_answer(backend=pysat_backend)
+    assert time.monotonic() - start < 3.0
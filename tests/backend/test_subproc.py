@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+from cspuz.backend import _subproc
+
+# a server echoing each request in upper case
+_SERVER = [sys.executable, '-c', '''
+import sys
+for line in sys.stdin:
+    print(line.upper() if line.strip() != '%end' else line, end='', flush=True)
+''']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork is not available')
+def test_servers_not_inherited_by_fork():
+    try:
+        assert _subproc.run_server(_SERVER, ['a', 'b']) == 'A\nB\n'
+        assert len(_subproc._all_servers) == 1
+        server = _subproc._all_servers[0]
+
+        pid = os.fork()
+        if pid == 0:
+            # the child must not use (nor close at exit) the server of the parent
+            ok = len(_subproc._all_servers) == 0 and _subproc.run_server(_SERVER, ['c']) == 'C\n'
+            _subproc.shutdown_servers()
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+        assert server.is_alive()
+        assert _subproc.run_server(_SERVER, ['d']) == 'D\n'
+        assert _subproc._all_servers == [server]
+    finally:
+        _subproc.shutdown_servers()
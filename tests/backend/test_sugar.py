@@ -0,0 +1,47 @@
+import cspuz
+from cspuz import Solver, graph
+from cspuz.backend import sugar, sugar_extended
+
+
+def _descriptions(backend):
+    solver = Solver()
+    is_active = solver.bool_array((3, 3))
+    graph.active_vertices_connected(solver, is_active, use_graph_primitive=True)
+    csp_solver = backend.CSPSolver(solver.variables)
+    csp_solver.add_constraint(solver.constraints)
+    return list(csp_solver._convert_constraints())
+
+
+def test_graph_primitive_lowered_for_plain_sugar():
+    descs = _descriptions(sugar)
+    assert not any('graph-active-vertices-connected' in d for d in descs)
+    # a rank and a root flag for each of the 9 vertices
+    assert sum(d.startswith('(int ') for d in descs) == 9
+    assert sum(d.startswith('(bool ') for d in descs) == 9
+
+
+def test_graph_primitive_sugar_extended(monkeypatch):
+    monkeypatch.setattr(cspuz.config, 'use_graph_primitive', False)
+    assert not any('graph-active-vertices-connected' in d for d in _descriptions(sugar_extended))
+
+    monkeypatch.setattr(cspuz.config, 'use_graph_primitive', True)
+    descs = _descriptions(sugar_extended)
+    assert len(descs) == 1 and descs[0].startswith('(graph-active-vertices-connected ')
+
+
+def test_lazy_conversion():
+    solver = Solver()
+    a = solver.bool_array(4)
+    shared = a[0] & a[1]
+    csp_solver = sugar.CSPSolver(solver.variables)
+    csp_solver.add_constraint([shared | a[2], shared | a[3]])
+    csp_solver.add_constraint([(a[0] & a[1]) | ~a[2]])
+    assert csp_solver.stats.num_backend_constraints == 3
+
+    # constraints are converted when the description is written, the same way every time
+    descs = list(csp_solver._describe())
+    assert descs == list(csp_solver._describe())
+    assert descs[:4] == csp_solver.converted_variables
+    # the shared expression is defined only within the first `add_constraint`
+    assert sum(d.startswith('(bool c') for d in descs) == 1
+    assert 'build' in csp_solver.stats.times
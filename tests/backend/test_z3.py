@@ -0,0 +1,94 @@
+import itertools
+import operator
+
+import pytest
+
+import cspuz
+from cspuz import Solver, count_true
+from cspuz.backend import z3 as z3_backend
+
+z3 = pytest.importorskip('z3')
+
+
+def _solutions(variables, constraints):
+    csp_solver = z3_backend.CSPSolver(variables)
+    csp_solver.add_constraint(constraints)
+    solutions = set()
+    while csp_solver.solve():
+        sol = tuple(v.sol for v in variables)
+        solutions.add(sol)
+        csp_solver.add_constraint(count_true([v if s else ~v for v, s in zip(variables, sol)]) < len(variables))
+    return solutions
+
+
+@pytest.mark.parametrize('fn', [operator.eq, operator.ne, operator.le, operator.lt, operator.ge, operator.gt])
+def test_pseudo_boolean(fn):
+    solver = Solver()
+    b = solver.bool_array(4)
+    for c in range(-1, 6):
+        constraints = [fn(count_true(b) + b[0].cond(2, 0), c), fn(c - 3, count_true(b[1:]) - b[3].cond(1, 0) * 2)]
+        # converted into pseudo-Boolean constraints without int terms
+        variables_dict = dict((v.id, z3.Bool(str(v.id))) for v in b)
+        assert all('If' not in str(z3_backend._convert_expr(e, variables_dict)) for e in constraints)
+
+        expected = set()
+        for bs in itertools.product([False, True], repeat=4):
+            if fn(sum(bs) + (2 if bs[0] else 0), c) and fn(c - 3, sum(bs[1:]) - (2 if bs[3] else 0)):
+                expected.add(bs)
+        assert _solutions(list(b), constraints) == expected
+
+
+def test_finite_domain_fallback():
+    solver = Solver()
+    b = solver.bool_array(4)
+    # nonlinear terms are given up by the finite-domain solver and solved by the default solver
+    constraints = [count_true(b[:2]) * count_true(b[2:]) == 2, b[0]]
+    assert _solutions(list(b), constraints) == {(True, True, True, False), (True, True, False, True),
+                                                (True, False, True, True)}
+
+
+def test_solve_irrefutably():
+    from cspuz import graph
+
+    solver = Solver()
+    a = solver.bool_array((3, 3))
+    n = solver.int_var(0, 9)
+    graph.active_vertices_connected(solver, a, use_graph_primitive=True)
+    solver.ensure(a[0, 0] & a[2, 2] & ~a[1, 1])
+    solver.ensure(n == count_true(a))
+    solver.ensure(n <= 5)
+    csp_solver = z3_backend.CSPSolver(solver.variables)
+    csp_solver.add_constraint(solver.constraints)
+    is_answer_key = bytearray(len(solver.variables))
+    for v in list(a) + [n]:
+        is_answer_key[v.id] = 1
+    assert csp_solver.solve_irrefutably(is_answer_key)
+    assert [v.sol for v in a] == [True, None, None, None, False, None, None, None, True]
+    assert n.sol == 5
+
+    csp_solver.add_constraint(~a[0, 1])
+    assert csp_solver.solve_irrefutably(is_answer_key)
+    assert [v.sol for v in a] == [True, False, False, True, False, False, True, True, True]
+
+
+def _solve_sudoku(problem):
+    from cspuz.puzzle import sudoku
+
+    is_sat, answer = sudoku.solve_sudoku(problem, n=2)
+    return is_sat, [v.sol for v in answer]
+
+
+def test_solve_batch_threads(monkeypatch):
+    monkeypatch.setattr(cspuz.config, 'default_backend', 'z3')
+    problem = [
+        [0, 0, 0, 3],
+        [3, 0, 1, 0],
+        [0, 4, 0, 0],
+        [0, 0, 0, 0],
+    ]
+    # jobs are solved concurrently, with the terms of each thread built in a separate Z3 context
+    jobs = [(_solve_sudoku, problem)] * 16
+    results = cspuz.solve_batch(jobs, max_workers=8, use_threads=True)
+    expected = _solve_sudoku(problem)
+    assert expected[0]
+    assert all(r == expected for r in results)
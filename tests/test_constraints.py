@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from cspuz import Solver, Array, count_true, fold_or
+from cspuz.constraints import Op
+
+
+def test_array_slicing():
+    solver = Solver()
+    a = solver.int_array((3, 4), 0, 9)
+    ids = [[a[y, x].id for x in range(4)] for y in range(3)]
+
+    assert [v.id for v in a[1, :]] == ids[1]
+    assert [v.id for v in a[:, 2]] == [row[2] for row in ids]
+    sub = a[1:, 1:3]
+    assert sub.shape == (2, 2)
+    assert [v.id for v in sub] == [ids[1][1], ids[1][2], ids[2][1], ids[2][2]]
+    assert a[-1:].shape == (1, 4)
+    assert a[3:, 0].shape == (0,)
+
+
+def test_numpy_interop():
+    solver = Solver()
+    a = solver.int_array((2, 3), 0, 9)
+    blocks = np.array([[0, 1, 2], [2, 1, 0]])
+
+    e = a == blocks
+    assert isinstance(e, Array) and e.shape == (2, 3)
+    assert e[1, 0].operands[1] == 2 and type(e[1, 0].operands[1]) is int
+
+    e = blocks < a
+    assert isinstance(e, Array) and e.shape == (2, 3)
+    assert e[0, 2].operands[0] is a[0, 2] and e[0, 2].operands[1] == 2
+
+    assert Array(np.array([True, False])).dtype is bool
+    assert (a[0, 0] + np.int64(1)).operands[1] == 1
+
+
+def test_broadcasting():
+    solver = Solver()
+    a = solver.int_array((3, 1), 0, 9)
+    b = solver.int_array(4, 0, 9)
+
+    e = a + b
+    assert e.shape == (3, 4)
+    assert e[2, 3].operands[0] is a[2, 0] and e[2, 3].operands[1] is b[3]
+    with pytest.raises(TypeError):
+        a + solver.int_array((2, 2), 0, 9)
+
+
+def test_nd_indexing():
+    solver = Solver()
+    x = solver.bool_array((2, 3, 4))
+    ids = [v.id for v in x]
+
+    def id_at(i, j, k):
+        return ids[(i * 3 + j) * 4 + k]
+
+    assert x[1, 2, 3].id == id_at(1, 2, 3)
+    assert x[1].shape == (3, 4)
+    assert x[..., 0].shape == (2, 3)
+    assert [v.id for v in x[:, 1, ::-2]] == [id_at(i, 1, k) for i in range(2) for k in (3, 1)]
+    assert [v.id for v in x[1, [0, 2], [1, 3]]] == [id_at(1, 0, 1), id_at(1, 2, 3)]
+    assert x[np.array([False, True])].shape == (1, 3, 4)
+    assert [v.id for v in x.transpose(2, 0, 1)[3, 1]] == [id_at(1, j, 3) for j in range(3)]
+    assert x.reshape(-1, 6).shape == (4, 6)
+
+
+def test_axis_reductions():
+    solver = Solver()
+    x = solver.bool_array((2, 3, 4))
+
+    c = x.count_true(axis=2)
+    assert c.shape == (2, 3)
+    assert c[1, 2].op == Op.COUNT_TRUE and [v.id for v in c[1, 2].operands] == [v.id for v in x[1, 2, :]]
+    assert count_true(x, axis=(0, 2)).shape == (3,)
+    f = fold_or(x, axis=0)
+    assert f.shape == (3, 4) and f[2, 1].op == Op.OR and len(f[2, 1].operands) == 2
+    assert x.fold_and().op == Op.AND and len(x.fold_and().operands) == 24
+
+
+def test_solution():
+    pytest.importorskip('pysat')
+    from cspuz.backend import pysat as pysat_backend
+
+    solver = Solver()
+    a = solver.bool_array((2, 2))
+    n = solver.int_array(3, 1, 3)
+    solver.add_answer_key(a)
+    solver.add_answer_key(n)
+    solver.ensure(count_true(a) == 2)
+    solver.ensure(a[0, 0])
+    solver.ensure(n[0] < n[1])
+    solver.ensure(n[1] < n[2])
+    assert solver.solve(backend=pysat_backend)
+
+    sol = a.solution()
+    assert sol.shape == (2, 2) and sol.dtype == bool
+    assert sol[0, 0] and sol.mask.tolist() == [[False, True], [True, True]]
+    assert n.solution().tolist() == [1, 2, 3]
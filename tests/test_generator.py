@@ -0,0 +1,191 @@
+import random
+import subprocess
+import time
+
+import pytest
+
+import cspuz
+from cspuz import Solver, alldifferent, count_true
+from cspuz.generator import (generate_problem, generate_problem_multi_chain, iterate_problems_multi_chain, stream_problems,
+                             count_non_default_values, ArrayBuilder2D, SolverCache)
+
+pytest.importorskip('pysat')
+
+
+@pytest.fixture(autouse=True)
+def pysat_backend(monkeypatch):
+    monkeypatch.setattr(cspuz.config, 'default_backend', 'pysat')
+
+
+def _solve_latin_square(problem):
+    solver = Solver()
+    grid = solver.int_array((4, 4), 1, 4)
+    solver.add_answer_key(grid)
+    for i in range(4):
+        solver.ensure(alldifferent(grid[i, :]))
+        solver.ensure(alldifferent(grid[:, i]))
+    for y in range(4):
+        for x in range(4):
+            if problem[y][x] != 0:
+                solver.ensure(grid[y, x] == problem[y][x])
+    is_sat = solver.solve()
+    return is_sat, grid
+
+
+def _generate(parallel=None, cache=None):
+    random.seed(42)
+    return generate_problem(_solve_latin_square,
+                            builder_pattern=ArrayBuilder2D(4, 4, [0, 1, 2, 3, 4], default=0),
+                            clue_penalty=lambda problem: count_non_default_values(problem, default=0, weight=2),
+                            parallel=parallel, cache=cache)
+
+
+def test_generate_problem_parallel():
+    problem = _generate(None)
+    assert problem is not None
+    is_sat, grid = _solve_latin_square(problem)
+    assert is_sat
+    assert all(v.sol is not None for v in grid)
+    assert _generate(parallel=4) == problem
+
+
+def test_generate_problem_parallel_z3(monkeypatch):
+    # solves in worker threads build their Z3 terms in separate contexts
+    pytest.importorskip('z3')
+    monkeypatch.setattr(cspuz.config, 'default_backend', 'z3')
+    problem = _generate(parallel=4)
+    assert problem is not None
+    assert _generate(None) == problem
+
+
+def test_solver_cache(tmp_path):
+    calls = []
+
+    def solve(problem):
+        calls.append(problem)
+        return _solve_latin_square(problem)
+
+    problem = [[1, 2, 3, 4], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
+    path = str(tmp_path / 'cache')
+    with SolverCache(maxsize=1, path=path) as cache:
+        cached_solve = cache.wrap(solve)
+        is_sat, grid = cached_solve(problem)
+        assert is_sat
+        expected = [v.sol for v in grid]
+        assert expected[:4] == [1, 2, 3, 4]
+        is_sat, grid = cached_solve([[row[i] for i in range(4)] for row in problem])
+        assert is_sat and [v.sol for v in grid] == expected
+        assert len(calls) == 1
+        cached_solve([[0] * 4] * 4)
+        assert len(calls) == 2
+        assert (cache.hits, cache.misses) == (1, 2)
+    with SolverCache(path=path) as cache:
+        is_sat, grid = cache.wrap(solve)(problem)
+        assert is_sat and [v.sol for v in grid] == expected
+        assert len(calls) == 2
+    assert _generate(cache=SolverCache()) == _generate()
+
+
+def test_solver_cache_key():
+    np = pytest.importorskip('numpy')
+    problem = np.zeros((40, 40), dtype=int)
+    other = problem.copy()
+    # `repr` of these arrays are the same, as the middle elements are omitted
+    other[20, 20] = 1
+    assert repr(problem) == repr(other)
+    assert SolverCache.key(problem) != SolverCache.key(other)
+    assert SolverCache.key(other) == SolverCache.key(other.tolist())
+    assert SolverCache.key([[1, 0], [0, 0]]) != SolverCache.key([[True, False], [False, False]])
+
+
+def _is_unique(problem):
+    is_sat, grid = _solve_latin_square(problem)
+    return is_sat and all(v.sol is not None for v in grid)
+
+
+def test_generate_problem_multi_chain():
+    problem = generate_problem_multi_chain(_solve_latin_square, temperatures=[2.0, 5.0], seed=0,
+                                           builder_pattern=ArrayBuilder2D(4, 4, [0, 1, 2, 3, 4], default=0))
+    assert problem is not None
+    assert _is_unique(problem)
+
+
+def test_iterate_problems_multi_chain():
+    problems = []
+    for problem in iterate_problems_multi_chain(_solve_latin_square, num_chains=2, seed=0,
+                                                builder_pattern=ArrayBuilder2D(4, 4, [0, 1, 2, 3, 4], default=0)):
+        problems.append(problem)
+        if len(problems) == 3:
+            break
+    assert all(_is_unique(problem) for problem in problems)
+
+
+def _raise_value_error(problem):
+    raise ValueError('broken solver')
+
+
+_num_timeouts = []
+
+
+def _solve_after_timeout(problem):
+    # the first solve of each chain (in its own process) times out
+    if not _num_timeouts:
+        _num_timeouts.append(1)
+        raise subprocess.TimeoutExpired('solver', 1.0)
+    return _solve_latin_square(problem)
+
+
+def test_multi_chain_exceptions():
+    builder_pattern = ArrayBuilder2D(4, 4, [0, 1, 2, 3, 4], default=0)
+    with pytest.raises(ValueError, match='broken solver'):
+        generate_problem_multi_chain(_raise_value_error, num_chains=2, seed=0, builder_pattern=builder_pattern)
+    with pytest.raises(ValueError, match='broken solver'):
+        next(iterate_problems_multi_chain(_raise_value_error, num_chains=2, seed=0, builder_pattern=builder_pattern))
+
+    # chains are restarted on timeout
+    problem = generate_problem_multi_chain(_solve_after_timeout, num_chains=2, seed=0, builder_pattern=builder_pattern)
+    assert problem is not None
+    assert _is_unique(problem)
+
+
+@pytest.mark.parametrize('prefetch', [None, 2])
+def test_stream_problems(prefetch):
+    random.seed(0)
+    problems = list(stream_problems(_solve_latin_square, count=3, prefetch=prefetch, cache=SolverCache(),
+                                    builder_pattern=ArrayBuilder2D(4, 4, [0, 1, 2, 3, 4], default=0)))
+    assert len(problems) == 3
+    assert all(_is_unique(problem) for problem in problems)
+
+
+def test_generate_problem_time_limit():
+    problem = generate_problem(_solve_latin_square, builder_pattern=ArrayBuilder2D(4, 4, [0, 1, 2, 3, 4], default=0),
+                               time_limit=0.0)
+    assert problem is None
+
+
+def test_stream_problems_solver_timeout(monkeypatch):
+    # generations whose solves time out are restarted, also with the default SAT solver (CaDiCaL)
+    monkeypatch.setattr(cspuz.config, 'pysat_solver', 'cadical195')
+    monkeypatch.setattr(cspuz.config, 'solver_timeout', 1.0)
+    num_hard_solves = []
+
+    def solve(problem):
+        if not num_hard_solves:
+            num_hard_solves.append(1)
+            # pigeonhole principle: 14 pigeons do not fit in 13 holes, which is hard for CDCL solvers
+            solver = Solver()
+            a = solver.bool_array((14, 13))
+            solver.add_answer_key(a)
+            for i in range(14):
+                solver.ensure(a[i, :].fold_or())
+            for j in range(13):
+                solver.ensure(count_true(a[:, j]) <= 1)
+            solver.solve()
+        return _solve_latin_square(problem)
+
+    random.seed(0)
+    start = time.monotonic()
+    problems = list(stream_problems(solve, count=1, builder_pattern=ArrayBuilder2D(4, 4, [0, 1, 2, 3, 4], default=0)))
+    assert len(problems) == 1 and _is_unique(problems[0])
+    assert num_hard_solves == [1]
+    assert time.monotonic() - start < 10.0
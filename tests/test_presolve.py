@@ -0,0 +1,154 @@
+import importlib
+import json
+import os
+
+import pytest
+
+import cspuz
+from cspuz import Solver, count_true, graph
+from cspuz.constraints import Op
+from cspuz.presolve import Presolver
+
+
+def test_constant_folding():
+    solver = Solver()
+    a = solver.bool_array(3)
+    x = solver.int_var(0, 5)
+    presolver = Presolver(solver.variables)
+
+    assert presolver.simplify((x + 1 - 1) * 1 >= -1) is True
+    assert presolver.simplify(count_true(a) >= 0) is True
+    assert presolver.simplify(count_true(a) > 3) is False
+    assert presolver.simplify(a[0] | (a[1].cond(x, x) == x)) is True
+    assert presolver.simplify((a[0] & True).then(a[1])).op == Op.IMP
+
+
+def test_unit_constraints():
+    solver = Solver()
+    a = solver.bool_array(3)
+    x = solver.int_var(0, 5)
+    y = solver.int_var(0, 5)
+    presolver = Presolver(solver.variables)
+    remaining = presolver.run([a[0], a[0].then(x == 3), x * y <= 12, y != 0, ~a[1] | a[2]])
+
+    assert presolver.fixed == {a[0].id: True, x.id: 3}
+    assert (presolver.domains[y.id].lo, presolver.domains[y.id].hi) == (1, 4)
+    assert [c.op for c in remaining] == [Op.OR]
+    assert not presolver.infeasible
+
+    presolver = Presolver(solver.variables)
+    presolver.run([x >= 3, x < 3])
+    assert presolver.infeasible
+
+
+def test_bounds_propagation():
+    solver = Solver()
+    a = solver.bool_array(4)
+    d = solver.int_array(4, 0, 9)
+    z = solver.int_var(-5, 5)
+    presolver = Presolver(solver.variables)
+    remaining = presolver.run([d[0] == 0] + [d[i] == a[i].cond(0, d[i - 1] + 1) for i in range(1, 4)] +
+                              [z * -2 >= d[3] + 4])
+
+    assert presolver.tightened_domains() == {d[0].id: (0, 0), d[1].id: (0, 1), d[2].id: (0, 2), d[3].id: (0, 3),
+                                             z.id: (-5, -2)}
+    assert len(remaining) == 4
+
+    presolver = Presolver(solver.variables)
+    presolver.run([d[0] < d[1], d[1] < d[2] - 8])
+    assert presolver.infeasible
+
+    # bounds are not propagated through unbounded terms (`d[2] % 3`)
+    presolver = Presolver(solver.variables)
+    presolver.run([d[0] + (d[1] - (d[2] % 3)) == 5])
+    assert not presolver.infeasible
+    assert presolver.tightened_domains() == {}
+
+
+def test_equivalent_variables():
+    solver = Solver()
+    a = solver.bool_array(4)
+    presolver = Presolver(solver.variables)
+    remaining = presolver.run([a[0] == a[1], a[2] != a[1], ~a[3] == a[2], a[0] | a[3]])
+
+    assert len(presolver.aliases) == 3 and len(presolver.fixed) == 1
+    assert [presolver.simplify(v) for v in a] == [True, True, False, True]
+    assert remaining == []
+
+    presolver = Presolver(solver.variables)
+    presolver.run([a[0] == a[1], a[1] == ~a[2], a[2] == a[0]])
+    assert presolver.infeasible
+
+
+def test_presolved_solve():
+    pytest.importorskip('pysat')
+    from cspuz.backend import pysat as pysat_backend
+
+    solver = Solver()
+    a = solver.bool_array(4)
+    n = solver.int_array(2, 0, 9)
+    aux = solver.int_var(0, 3)
+    solver.add_answer_key(a)
+    solver.add_answer_key(n)
+    solver.ensure(a[0])
+    solver.ensure(a[0].then(n[0] == 4))
+    solver.ensure(count_true(a) == 2)
+    solver.ensure(n[1] >= n[0] + 5)
+    assert solver.solve(backend=pysat_backend)
+    assert [v.sol for v in a] == [True, None, None, None]
+    assert [v.sol for v in n] == [4, 9]
+    assert aux.sol is None
+
+    assert solver.find_answer(backend=pysat_backend)
+    assert count_true([v.sol for v in a]) == 2 and aux.sol == 0
+
+    solver = Solver()
+    x, y, z = [solver.int_var(0, 9) for _ in range(3)]
+    solver.ensure(x + (z - (y % 3)) == 5)
+    assert solver.find_answer(backend=pysat_backend)
+    assert x.sol + (z.sol - (y.sol % 3)) == 5
+
+
+def test_presolved_graph_constraints():
+    pytest.importorskip('pysat')
+    from cspuz.backend import pysat as pysat_backend
+
+    solver = Solver()
+    a = solver.bool_array((3, 3))
+    solver.add_answer_key(a)
+    graph.active_vertices_connected(solver, a, use_graph_primitive=True)
+    solver.ensure(a[0, 0] & a[2, 2] & a[2, 0])
+    solver.ensure(a[1, 0] != a[1, 1])
+    solver.ensure(a[1, 1] == ~a[1, 2])
+    solver.ensure(~a[2, 1])
+    assert solver.solve(backend=pysat_backend)
+    assert [[v.sol for v in row] for row in (a[0, :], a[1, :], a[2, :])] == \
+        [[True, True, True], [True, False, True], [True, False, True]]
+
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'instances.json')) as f:
+    _BENCHMARK_INSTANCES = json.load(f)
+
+
+def _benchmark_answers(instance, backend, use_presolve):
+    module_name, func_name = instance['solver'].split('.')
+    func = getattr(importlib.import_module('cspuz.puzzle.' + module_name), func_name)
+    answers = []
+
+    def hook(solver, stats):
+        answers.append((stats.method, stats.is_sat, [v.sol for v in solver.variables if solver.is_answer_key[v.id]]))
+
+    with cspuz.config.override({'default_backend': backend, 'use_presolve': use_presolve, 'solve_hooks': [hook]}):
+        func(*instance['args'], **instance.get('kwargs', {}))
+    return answers
+
+
+@pytest.mark.parametrize('backend', ['pysat', 'z3'])
+@pytest.mark.parametrize('instance', _BENCHMARK_INSTANCES,
+                         ids=['{}-{}'.format(i['puzzle'], i['size']) for i in _BENCHMARK_INSTANCES])
+def test_presolve_benchmark_answers(backend, instance):
+    # presolve (enabled by default) must not change any answer on the benchmark instances
+    pytest.importorskip(backend)
+    answers = _benchmark_answers(instance, backend, True)
+    assert len(answers) > 0
+    assert answers == _benchmark_answers(instance, backend, False)
@@ -0,0 +1,175 @@
+import concurrent.futures
+import subprocess
+import threading
+import time
+
+import pytest
+
+import cspuz
+from cspuz import Solver, solve_batch, count_true
+
+pytest.importorskip('pysat')
+
+
+@pytest.fixture(autouse=True)
+def pysat_backend(monkeypatch):
+    monkeypatch.setattr(cspuz.config, 'default_backend', 'pysat')
+
+
+def _build_solver(n, k):
+    solver = Solver()
+    a = solver.bool_array(n)
+    solver.add_answer_key(a)
+    solver.ensure(count_true(a) == k)
+    solver.ensure(a[0])
+    return solver, a
+
+
+def _solve_problem(n, k):
+    solver, a = _build_solver(n, k)
+    is_sat = solver.solve()
+    return is_sat, [v.sol for v in a]
+
+
+def _raise_timeout():
+    raise subprocess.TimeoutExpired('solver', cspuz.config.solver_timeout)
+
+
+@pytest.mark.parametrize('use_threads', [False, True])
+def test_solve_batch_solvers(use_threads):
+    problems = [(3, 1), (3, 3), (3, 4), (4, 2)]
+    solvers = [_build_solver(n, k) for n, k in problems]
+    results = solve_batch([s for s, _ in solvers], max_workers=2, use_threads=use_threads)
+    assert results == [True, True, False, True]
+    assert [v.sol for v in solvers[0][1]] == [True, False, False]
+    assert [v.sol for v in solvers[1][1]] == [True, True, True]
+    assert [v.sol for v in solvers[3][1]] == [True, None, None, None]
+
+
+def test_solve_batch_functions():
+    jobs = [(_solve_problem, 3, 1), (_solve_problem, 3, 4), (_solve_problem, 2, 2)]
+    results = dict(solve_batch(jobs, max_workers=2, as_completed=True))
+    assert results == {
+        0: (True, [True, False, False]),
+        1: (False, [None, None, None]),
+        2: (True, [True, True]),
+    }
+
+
+def test_solve_batch_exceptions():
+    jobs = [(_solve_problem, 2, 1), (_raise_timeout,)]
+    results = solve_batch(jobs, use_threads=True, timeout=10.0, return_exceptions=True)
+    assert results[0] == (True, [True, False])
+    assert isinstance(results[1], subprocess.TimeoutExpired)
+    assert results[1].timeout == 10.0
+    assert cspuz.config.solver_timeout is None
+    with pytest.raises(subprocess.TimeoutExpired):
+        solve_batch(jobs, use_threads=True)
+
+
+def _build_pigeonhole_solver(n):
+    # `n + 1` pigeons do not fit in `n` holes, which is hard for CDCL solvers
+    solver = Solver()
+    a = solver.bool_array((n + 1, n))
+    for i in range(n + 1):
+        solver.ensure(a[i, :].fold_or())
+    for j in range(n):
+        solver.ensure(count_true(a[:, j]) <= 1)
+    return solver
+
+
+def test_solve_batch_timeout(monkeypatch):
+    # the default SAT solver (CaDiCaL) cannot be interrupted, but the timeout must still be enforced
+    monkeypatch.setattr(cspuz.config, 'pysat_solver', 'cadical195')
+    start = time.monotonic()
+    results = solve_batch([_build_pigeonhole_solver(13)], use_threads=True, timeout=1.0, find_answer_only=True,
+                          return_exceptions=True)
+    assert isinstance(results[0], subprocess.TimeoutExpired)
+    assert time.monotonic() - start < 5.0
+
+
+def _solve_repeatedly(num_solves, interval):
+    # each solve is quick, but the job as a whole takes `num_solves * interval` seconds
+    for _ in range(num_solves):
+        time.sleep(interval)
+        _solve_problem(3, 1)
+    return True
+
+
+@pytest.mark.parametrize('use_threads', [False, True])
+def test_solve_batch_job_deadline(use_threads):
+    # `timeout` limits each job as a whole, not only each call of the backend
+    results = solve_batch([(_solve_repeatedly, 10, 0.2), (_solve_repeatedly, 2, 0.2)], use_threads=use_threads,
+                          timeout=1.0, return_exceptions=True)
+    assert isinstance(results[0], subprocess.TimeoutExpired)
+    assert results[1] is True
+
+
+def test_solver_time_limit():
+    with cspuz.config.override({'solver_timeout': 10.0, 'solver_deadline': time.monotonic() + 1.0}):
+        assert 0.0 < cspuz.config.solver_time_limit('solver') <= 1.0
+    with cspuz.config.override({'solver_timeout': 0.5, 'solver_deadline': time.monotonic() + 10.0}):
+        assert cspuz.config.solver_time_limit('solver') == 0.5
+    with cspuz.config.override({'solver_deadline': time.monotonic() - 1.0}):
+        with pytest.raises(subprocess.TimeoutExpired):
+            cspuz.config.solver_time_limit('solver')
+    assert cspuz.config.solver_time_limit('solver') is None
+
+
+def _get_solver_timeout(event):
+    event.wait(10.0)
+    return cspuz.config.solver_timeout
+
+
+def test_solve_batch_threads_config():
+    # the timeout of the batch is seen only by its jobs, even while they are running
+    event = threading.Event()
+    results = solve_batch([(_get_solver_timeout, event)], use_threads=True, timeout=5.0, as_completed=True)
+    assert cspuz.config.solver_timeout is None
+    event.set()
+    assert list(results) == [(0, 5.0)]
+    assert cspuz.config.solver_timeout is None
+
+
+def test_config_override():
+    use_presolve = cspuz.config.use_presolve
+    with cspuz.config.override({'solver_timeout': 1.0}):
+        with cspuz.config.override({'use_presolve': not use_presolve}):
+            assert cspuz.config.as_dict()['solver_timeout'] == 1.0
+            assert cspuz.config.use_presolve == (not use_presolve)
+            with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                assert executor.submit(lambda: cspuz.config.solver_timeout).result() is None
+        assert cspuz.config.use_presolve == use_presolve
+        assert cspuz.config.solver_timeout == 1.0
+    assert cspuz.config.solver_timeout is None
+
+
+def test_ensure_deduplication():
+    solver = Solver()
+    a = solver.bool_array((2, 2))
+    solver.ensure(a[0, :] | a[1, :])
+    solver.ensure(a[0, 1] | a[1, 1])
+    solver.ensure([a[0, 0] | a[1, 0], ~(a[0, 0] & a[0, 1])])
+    solver.ensure(~(a[0, 0] & a[0, 1]))
+    assert len(solver.constraints) == 3
+
+
+def test_solve_stats(monkeypatch):
+    calls = []
+    monkeypatch.setattr(cspuz.config, 'solve_hooks', [lambda solver, stats: calls.append((solver, stats))])
+    solver, a = _build_solver(4, 2)
+    assert solver.solve()
+    stats = solver.last_stats
+    assert calls == [(solver, stats)]
+    assert (stats.method, stats.backend, stats.is_sat) == ('solve', 'pysat', True)
+    assert (stats.num_variables, stats.num_constraints, stats.num_answer_keys) == (4, 2, 4)
+    # `a[0]` is fixed by presolve
+    assert stats.num_backend_variables == 3 and stats.num_clauses > 0
+    assert stats.num_solver_calls == stats.backbone.num_calls + 1
+    assert {'presolve', 'build', 'solve', 'total'} <= set(stats.times)
+
+    assert solver.find_answer()
+    solvers = [_build_solver(3, k)[0] for k in (1, 4)]
+    assert solve_batch(solvers, max_workers=2) == [True, False]
+    assert [s.last_stats.is_sat for s in solvers] == [True, False]
+    assert [stats.method for _, stats in calls[1:]] == ['find_answer', 'solve', 'solve']